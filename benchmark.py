@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los flujos del toolkit contra la API de Proxmox simulada (lib/fake_proxmox.py).
+
+Para cada tamaño (10..1000 VMs) levanta un cluster falso vacío, genera un
+config.yaml + vms.yaml temporales y ejecuta los flujos reales en orden
+(create -> start -> snapshot -> patch -> restart -> rollback -> shutdown -> delete), midiendo tiempo, VMs/s,
+llamadas a la API (totales, escrituras y por endpoint), tareas, esperas y
+fallos de lock y peticiones simultáneas. Cada flujo se valida contra el estado
+final del servidor falso; patch y restart, además, fallan si dos masters
+estuvieron caídos a la vez.
+
+    python benchmark.py --sizes 10,100 --latency 0.005 --time-scale 0.05
+    python benchmark.py --sizes 100 --flows create,delete --json logs/bench.json
+    python benchmark.py --baseline logs/bench.json       # exit 1 si hay regresión
+
+Los flujos corren sin consola (su salida va a /dev/null salvo con --verbose).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import yaml
+
+from lib.fake_proxmox import FakeProxmox
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+FLOW_ORDER = ('create', 'start', 'snapshot', 'patch', 'restart', 'rollback', 'shutdown', 'delete')
+
+
+# ----------------------------------------------------------------------
+# Flujos (import diferido: se cargan dentro del directorio de trabajo temporal)
+# ----------------------------------------------------------------------
+def flow_create(args):
+    from create_vm import ProxmoxVMCreator
+    ProxmoxVMCreator().run(dry_run=False, parallel=args.parallel, per_node=args.per_node)
+
+
+def flow_start(args):
+    from start_vms import start_vms
+    start_vms()
+
+
+def flow_snapshot(args):
+    from create_snapshot import create_snapshots
+    create_snapshots()
+
+
+def flow_patch(args):
+    from patch_console import patch_console
+    patch_console()
+
+
+def flow_restart(args):
+    from restart_vms import restart_vms
+    # force: el flujo mide el ciclo completo (olas, apagado ACPI, arranque) aunque no haya pending
+    restart_vms(force=True)
+
+
+def flow_rollback(args):
+    from rollback_snapshot import rollback_vms
+    rollback_vms(start=True)
+
+
+def flow_shutdown(args):
+    from shutdown_vms import shutdown_vms
+    shutdown_vms()
+
+
+def flow_delete(args):
+    from delete_all_vms import delete_vms
+    delete_vms()
+
+
+FLOWS = {
+    'create': flow_create,
+    'start': flow_start,
+    'snapshot': flow_snapshot,
+    'patch': flow_patch,
+    'restart': flow_restart,
+    'rollback': flow_rollback,
+    'shutdown': flow_shutdown,
+    'delete': flow_delete,
+}
+
+# Estado esperado tras cada flujo: (vm del servidor falso) -> bool
+EXPECTED = {
+    'create': lambda vm: vm is not None and not vm['lock'],
+    'start': lambda vm: vm is not None and vm['status'] == 'running',
+    'snapshot': lambda vm: vm is not None and vm['snapshots'],
+    'patch': lambda vm: vm is not None and vm['status'] == 'running' and vm['config'].get('cicustom')
+    and not vm.get('pending'),
+    'restart': lambda vm: vm is not None and vm['status'] == 'running',
+    'rollback': lambda vm: vm is not None and vm['status'] == 'running' and not vm['lock'],
+    'shutdown': lambda vm: vm is not None and vm['status'] == 'stopped' and not vm['lock'],
+    'delete': lambda vm: vm is None,
+}
+
+# Flujos que reinician masters: nunca dos caídos a la vez (quórum de etcd)
+ROLLING_FLOWS = ('patch', 'restart')
+DOWN_TASKS = ('qmshutdown', 'qmstop', 'qmreboot')
+
+
+def master_overlaps(fake, vms, since):
+    """Pares de masters con ventanas de caída solapadas (apagado/reinicio -> fin del arranque)."""
+    masters = {vm['vmid'] for vm in vms if 'master' in vm['tags']}
+    with fake._lock:
+        tasks = sorted((t for t in fake.tasks.values()
+                        if t.vmid is not None and int(t.vmid) in masters and t.start is not None and t.queued >= since),
+                       key=lambda t: t.start)
+    windows, down = [], {}
+    for task in tasks:
+        vmid = int(task.vmid)
+        if task.type == 'qmreboot':
+            windows.append((task.start, task.end, vmid))
+        elif task.type in DOWN_TASKS:
+            down.setdefault(vmid, task.start)
+        elif task.type == 'qmstart' and vmid in down:
+            windows.append((down.pop(vmid), task.end, vmid))
+    windows += [(start, float('inf'), vmid) for vmid, start in down.items()]
+
+    windows.sort()
+    overlaps = []
+    for i, (start, end, vmid) in enumerate(windows):
+        for other_start, _, other in windows[i + 1:]:
+            if other_start >= end:
+                break
+            if other != vmid:
+                overlaps.append((vmid, other))
+    return overlaps
+
+
+# ----------------------------------------------------------------------
+# Entorno
+# ----------------------------------------------------------------------
+def write_inventory(workdir, fake, size, args):
+    vms = [{
+        'vmid': 10000 + i,
+        'name': f"bench-{i:04d}",
+        'node': fake.nodes[i % len(fake.nodes)],
+        'memory': 2048,
+        'cores': 2,
+        'disk_size': '20G',
+        'storage': args.storage,
+        'image': 'ubuntu22',
+        'tags': 'bench,worker' if i % 10 else 'bench,master',
+        'ip': '127.0.0.1',
+    } for i in range(size)]
+    with open(os.path.join(ROOT, 'config.yaml.example')) as f:
+        config = yaml.safe_load(f) or {}
+    config['execution'] = {'parallel': args.parallel, 'per_node': args.per_node, 'task_timeout': 600}
+    config.pop('tracing', None)
+    # Las VMs simuladas no tienen guest agent: la espera entre olas sondea el propio servidor simulado
+    config['restarts'] = dict(config.get('restarts') or {}, ready_port=fake.port)
+    with open(os.path.join(workdir, 'config.yaml'), 'w') as f:
+        yaml.safe_dump(config, f)
+    with open(os.path.join(workdir, 'vms.yaml'), 'w') as f:
+        yaml.safe_dump({'vms': vms}, f)
+    return vms
+
+
+def seed(fake, vms, flow):
+    """Estado previo para ejecutar un flujo aislado (p.ej. --flows start)."""
+    status = 'running' if flow in ('patch', 'restart', 'rollback', 'shutdown') else 'stopped'
+    for vm in vms:
+        if vm['vmid'] not in fake.vms:
+            fake.add_vm(vm['vmid'], vm['node'], vm['name'], status=status, storage=vm['storage'],
+                        tags=vm['tags'])
+    if flow == 'rollback':
+        from create_snapshot import SNAPSHOT_NAME
+        with fake._lock:
+            for vm in vms:
+                state = fake.vms[vm['vmid']]
+                state['snapshots'].setdefault(SNAPSHOT_NAME, {
+                    'description': '', 'snaptime': int(time.time()), 'vmstate': 0, 'parent': None,
+                    'config': dict(state['config']), 'status': 'stopped'})
+
+
+def fresh_client():
+    # Cada tamaño usa su propio vms.yaml: el cliente compartido se recrea
+    from lib import proxmox_client
+    proxmox_client._shared_client = None
+
+
+@contextmanager
+def quiet(enabled):
+    """Silencia stdout a nivel de descriptor (los loggers guardan su propio stream)."""
+    if not enabled:
+        yield
+        return
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(devnull)
+        os.close(saved)
+
+
+# ----------------------------------------------------------------------
+# Ejecución
+# ----------------------------------------------------------------------
+def run_flow(fake, flow, vms, args):
+    fake.reset_stats()
+    error = None
+    start = time.monotonic()
+    with quiet(not args.verbose):
+        try:
+            FLOWS[flow](args)
+        except SystemExit as e:
+            error = f"exit {e.code}"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    elapsed = time.monotonic() - start
+    stats = fake.snapshot_stats()
+
+    with fake._lock:
+        bad = [vm['vmid'] for vm in vms if not EXPECTED[flow](fake.vms.get(vm['vmid']))]
+    overlaps = master_overlaps(fake, vms, start) if flow in ROLLING_FLOWS else []
+    if overlaps and error is None:
+        error = f"masters caídos a la vez: {', '.join(f'{a}/{b}' for a, b in overlaps[:3])}"
+    size = len(vms)
+    return {
+        'flow': flow,
+        'vms': size,
+        'seconds': round(elapsed, 3),
+        'vms_per_s': round(size / elapsed, 2) if elapsed else None,
+        'api_calls': stats['calls'],
+        'calls_per_vm': round(stats['calls'] / size, 2) if size else None,
+        'writes': stats['writes'],
+        'errors': stats['errors'],
+        'tasks': stats['tasks'],
+        'lock_waits': stats['lock_waits'],
+        'lock_failures': stats['lock_failures'],
+        'locked_rejects': stats['locked_rejects'],
+        'max_inflight': stats['max_inflight'],
+        'ok': not bad and error is None,
+        'master_overlaps': len(overlaps),
+        'wrong_state': len(bad),
+        'error': error,
+        'endpoints': dict(sorted(stats['endpoints'].items(), key=lambda kv: kv[1], reverse=True)),
+    }
+
+
+def print_results(results):
+    header = (f"{'flujo':<9}{'VMs':>6}{'seg':>9}{'VMs/s':>9}{'API':>8}{'API/VM':>8}{'escr.':>7}"
+              f"{'tareas':>8}{'esperas':>9}{'lockfail':>9}{'simult.':>8}  estado")
+    print(header)
+    print('─' * len(header))
+    for r in results:
+        state = '✅' if r['ok'] else f"❌ {r['error'] or ''} {r['wrong_state']} VM(s) mal".strip()
+        print(f"{r['flow']:<9}{r['vms']:>6}{r['seconds']:>9.2f}{r['vms_per_s'] or 0:>9.2f}{r['api_calls']:>8}"
+              f"{r['calls_per_vm'] or 0:>8.1f}{r['writes']:>7}{r['tasks']:>8}{r['lock_waits']:>9}"
+              f"{r['lock_failures']:>9}{r['max_inflight']:>8}  {state}")
+
+
+def compare(results, baseline, tolerance):
+    """Regresiones frente a un JSON anterior: menos VMs/s o más llamadas de las toleradas."""
+    previous = {(r['flow'], r['vms']): r for r in baseline.get('results', [])}
+    regressions = []
+    for r in results:
+        old = previous.get((r['flow'], r['vms']))
+        if not old:
+            continue
+        if old.get('vms_per_s') and r['vms_per_s'] < old['vms_per_s'] * (1 - tolerance):
+            regressions.append(f"{r['flow']}@{r['vms']}: {r['vms_per_s']} VMs/s (antes {old['vms_per_s']})")
+        if old.get('api_calls') and r['api_calls'] > old['api_calls'] * (1 + tolerance):
+            regressions.append(f"{r['flow']}@{r['vms']}: {r['api_calls']} llamadas (antes {old['api_calls']})")
+        if old.get('ok') and not r['ok']:
+            regressions.append(f"{r['flow']}@{r['vms']}: ahora falla ({r['error'] or r['wrong_state']})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de flujos contra una API de Proxmox simulada')
+    parser.add_argument('--sizes', default='10,100', help='Número de VMs por ronda (p.ej. 10,100,1000)')
+    parser.add_argument('--flows', default=','.join(FLOW_ORDER), help=f"Flujos ({', '.join(FLOW_ORDER)})")
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--storage', default='local-lvm')
+    parser.add_argument('--parallel', type=int, default=8, help='create_vm --parallel')
+    parser.add_argument('--per-node', type=int, default=4, help='create_vm --per-node')
+    parser.add_argument('--latency', type=float, default=0.005, help='Latencia por petición (s)')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--time-scale', type=float, default=0.05, help='Escala de la duración de las tareas')
+    parser.add_argument('--lock-timeout', type=float, default=10.0)
+    parser.add_argument('--api-workers', type=int, default=0, help='Peticiones simultáneas del API (0 = sin límite)')
+    parser.add_argument('--json', help='Guardar resultados en este fichero')
+    parser.add_argument('--baseline', help='JSON de una ejecución anterior con el que comparar')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Margen antes de marcar regresión (0.2 = 20%%)')
+    parser.add_argument('--verbose', action='store_true', help='Mostrar la salida de los flujos')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    flows = [f.strip() for f in args.flows.split(',') if f.strip()]
+    unknown = [f for f in flows if f not in FLOWS]
+    if unknown:
+        parser.error(f"Flujos desconocidos: {', '.join(unknown)}")
+    flows = [f for f in FLOW_ORDER if f in flows]
+
+    fake = FakeProxmox(nodes=args.nodes, latency=args.latency, jitter=args.jitter, time_scale=args.time_scale,
+                       lock_timeout=args.lock_timeout, api_workers=args.api_workers, seed=0).start()
+    os.environ.update({
+        'PROXMOX_HOST': fake.address,
+        'PROXMOX_USER': 'root@pam',
+        'PROXMOX_TOKEN_NAME': 'bench',
+        'PROXMOX_TOKEN_VALUE': 'bench',
+        'PROXMOX_VERIFY_SSL': 'false',
+    })
+
+    print(f"🧪 Proxmox simulado en {fake.address}: {len(fake.nodes)} nodos, latencia {args.latency * 1000:.0f}ms, "
+          f"tareas x{args.time_scale}, flujos: {', '.join(flows)}")
+    results = []
+    origin = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='proxmox-bench-') as workdir:
+        os.chdir(workdir)
+        try:
+            for size in sizes:
+                fake.reset()
+                vms = write_inventory(workdir, fake, size, args)
+                fresh_client()
+                print(f"\n📦 {size} VM(s)")
+                round_results = []
+                for flow in flows:
+                    if flow != 'create':
+                        seed(fake, vms, flow)
+                    round_results.append(run_flow(fake, flow, vms, args))
+                print_results(round_results)
+                results.extend(round_results)
+        finally:
+            os.chdir(origin)
+            fake.stop()
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'settings': {k: v for k, v in vars(args).items() if k not in ('json', 'baseline', 'verbose')},
+        'results': results,
+    }
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📄 Resultados guardados en: {args.json}")
+
+    failed = [r for r in results if not r['ok']]
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n🛑 Regresiones respecto a la línea base:")
+            for line in regressions:
+                print(f"   • {line}")
+            sys.exit(1)
+        print("\n✅ Sin regresiones respecto a la línea base")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,77 +1,102 @@
 #!/usr/bin/env python3
 """
-Script to Create Snapshots for K3s Cluster VMs
+Snapshots de las VMs del cluster K3s, todas en paralelo.
+
+Por defecto: snapshot 'Pre-K3s-Install' sólo de disco (congelado con el guest
+agent cuando responde) de las VMs de vms.yaml, con un máximo de tareas por nodo
+y por storage (ver lib/snapshots.py). La RAM se incluye sólo con --vmstate.
+
+    python create_snapshot.py                                   # Pre-K3s-Install
+    python create_snapshot.py --snapshot 'pre-upgrade-%Y%m%d-%H%M' --keep 3 --all
 """
+import argparse
 import time
+
 from lib.config import Config
-from lib.proxmox_client import ProxmoxClient
 from lib.logger import log
+from lib.proxmox_client import get_client
+from lib.selection import Selector
+from lib.snapshots import SnapshotEngine, expand_name
 
 SNAPSHOT_NAME = "Pre-K3s-Install"
 SNAPSHOT_DESC = "Estado limpio antes de instalar K3s HA Cluster (Discos redimensionados y optimizados)"
 
-def wait_for_task(client, node, upid):
-    while True:
-        task = client.get_node(node).tasks(upid).status.get()
-        if task['status'] == 'stopped':
-            if task['exitstatus'] == 'OK':
-                return True, "OK"
-            else:
-                return False, task['exitstatus']
-        time.sleep(1)
-
-def create_snapshots():
+
+def create_snapshots(selector=None, name=SNAPSHOT_NAME, description=SNAPSHOT_DESC, vmstate=None,
+                     require_freeze=None, keep=None, parallel=None, per_node=None, per_storage=None,
+                     dry_run=False):
+    """Crea el snapshot en las VMs seleccionadas. Devuelve una lista de resultados por VM."""
     cfg = Config()
-    client = ProxmoxClient(cfg)
-    
+    client = get_client(cfg)
     if not client.connect():
-        return
-
-    log.info(f"📸 Creating Snapshot '{SNAPSHOT_NAME}' for all VMs...")
-    log.info("="*60)
-
-    for vm in cfg.vms:
-        vmid = vm['vmid']
-        node = vm['node']
-        
-        log.info(f"VM {vmid} ({node})...")
-        
-        try:
-            # Check if snapshot already exists
-            existing = client.get_vm(node, vmid).snapshot.get()
-            if any(s['name'] == SNAPSHOT_NAME for s in existing):
-                log.warning(f"  ⚠️  Snapshot '{SNAPSHOT_NAME}' already exists. Skipping.")
-                continue
-
-            log.info("  ⏳ Taking snapshot...")
-            upid = client.get_vm(node, vmid).snapshot.post(
-                snapname=SNAPSHOT_NAME,
-                description=SNAPSHOT_DESC,
-                vmstate=1 # Include RAM configuration
-            )
-            
-            success, msg = wait_for_task(client, node, upid)
-            if success:
-                 log.info("     ✅ Snapshot Created.")
-            else:
-                 log.error(f"     ❌ Snapshot Failed: {msg}")
-                 log.info("     🔄 Retrying without RAM (vmstate=0)...")
-                 upid = client.get_vm(node, vmid).snapshot.post(
-                    snapname=SNAPSHOT_NAME,
-                    description=SNAPSHOT_DESC,
-                    vmstate=0
-                )
-                 success, msg = wait_for_task(client, node, upid)
-                 if success:
-                     log.info("     ✅ Snapshot Created (Disk Only).")
-                 else:
-                     log.error(f"     ❌ Snapshot Failed Again: {msg}")
-
-        except Exception as e:
-            log.error(f"     ❌ Error: {e}")
-
-    log.info("\n" + "="*60)
-    log.info("Done. Ready for installation.")
+        return []
+
+    selector = selector or Selector()
+    engine = SnapshotEngine(client, cfg.data, parallel=parallel, per_node=per_node, per_storage=per_storage)
+    try:
+        targets = selector.select(client.inventory.refresh(), cfg.vms)
+    except Exception as e:
+        log.error(f"❌ No se pudo consultar el cluster: {e}")
+        return []
+
+    ram = engine.settings['vmstate'] if vmstate is None else vmstate
+    log.info(f"📸 Snapshot '{expand_name(name)}' de {len(targets)} VM(s) ({selector.describe()}) - "
+             f"{engine.parallel} en paralelo, máx. {engine.per_node} por nodo y {engine.per_storage} por storage"
+             f"{', con RAM' if ram else ', sólo disco'}")
+    log.info("=" * 60)
+    if not targets:
+        return []
+
+    start = time.monotonic()
+    results = engine.snapshot(targets, name, description=description, vmstate=vmstate,
+                              require_freeze=require_freeze, keep=keep, dry_run=dry_run)
+    total = time.monotonic() - start
+
+    for r in results:
+        icon = '✅' if r['ok'] else '❌'
+        if r['detail'] == 'ya existe':
+            icon = '⚪'
+        extra = f" [{r['consistency']}]" if r['consistency'] else ''
+        if r['pruned']:
+            extra += f" 🧹 podados: {', '.join(r['pruned'])}"
+        log.info(f"  {icon} VM {r['vmid']} ({r['name']}) en {r['node']}: {r['detail']}{extra} ({r['elapsed']:.1f}s)")
+
+    failed = [r for r in results if not r['ok']]
+    log.info("\n" + "=" * 60)
+    log.info(f"✅ Correctas: {len(results) - len(failed)}   ❌ Fallidas: {len(failed)}")
+    log.info(f"⏱️  Total: {total:.1f}s (VM más lenta: {max(r['elapsed'] for r in results):.1f}s, "
+             f"suma: {sum(r['elapsed'] for r in results):.1f}s)")
+    for r in failed:
+        log.error(f"   • VM {r['vmid']} ({r['name']}) en {r['node']}: {r['detail']}")
+    log.info("=" * 60)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Snapshots en paralelo de las VMs')
+    Selector.add_arguments(parser)
+    parser.add_argument('--snapshot', default=SNAPSHOT_NAME,
+                        help=f"Nombre del snapshot, admite strftime (default: {SNAPSHOT_NAME})")
+    parser.add_argument('--description', default=SNAPSHOT_DESC)
+    parser.add_argument('--vmstate', action='store_true', default=None, help='Incluir la RAM (más lento)')
+    parser.add_argument('--require-freeze', action='store_true', default=None,
+                        help='Fallar en VMs encendidas cuyo guest agent no responde')
+    parser.add_argument('--keep', type=int, default=None,
+                        help='Conservar sólo los N snapshots más recientes con el mismo prefijo')
+    parser.add_argument('--parallel', type=int, default=None, help='VMs a la vez (default: execution.bulk_parallel)')
+    parser.add_argument('--per-node', type=int, default=None, help='Máximo por nodo (default: execution.bulk_per_node)')
+    parser.add_argument('--per-storage', type=int, default=None,
+                        help='Máximo por storage (default: snapshots.per_storage)')
+    parser.add_argument('--dry-run', action='store_true', help='Mostrar qué se haría sin crear nada')
+    args = parser.parse_args()
+
+    results = create_snapshots(Selector.from_args(args), name=args.snapshot, description=args.description,
+                               vmstate=args.vmstate, require_freeze=args.require_freeze, keep=args.keep,
+                               parallel=args.parallel, per_node=args.per_node, per_storage=args.per_storage,
+                               dry_run=args.dry_run)
+    if any(not r['ok'] for r in results):
+        raise SystemExit(1)
+
 
 if __name__ == "__main__":
-    create_snapshots()
+    main()
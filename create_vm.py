@@ -4,7 +4,11 @@ Proxmox VM Creator v3.2.0
 Cloud-init con imágenes cloud de Ubuntu y snippet único
 Características:
 - Checks pre-vuelo (duplicados, espacio)
-- Ejecución serializada
+- Ejecución serializada o paralela (--parallel N, un lock por nodo+storage)
+- Staging opcional de imágenes cloud en el storage local de cada nodo (SHA256)
+- Modo clon opcional (--clone): linked clones desde plantillas golden por imagen+storage
+- Colocación automática (node: auto): bin-packing por RAM/CPU/disco con anti-afinidad de masters
+- Modo reconcile (--reconcile): sólo crea/actualiza/redimensiona lo que difiere del cluster
 """
 
 import yaml
@@ -15,81 +19,75 @@ import argparse
 import json
 from datetime import datetime
 from typing import Dict, List
-from proxmoxer import ProxmoxAPI
-import requests
-from dotenv import load_dotenv
-from urllib.parse import quote
 import platform
-import time
-
-# Cargar variables de entorno desde .env
-load_dotenv()
-
-requests.packages.urllib3.disable_warnings()
-
-# Crear nombre de archivo de log con timestamp
-timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-log_filename = f'logs/vm_creation_{timestamp}.log'
-log_general = 'vm_creation.log'
-
-# Crear directorio de logs si no existe
-os.makedirs('logs', exist_ok=True)
-
-# Configurar logging con dos archivos: uno general y uno por ejecución
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_general),           # Log general (se sobrescribe)
-        logging.FileHandler(log_filename),          # Log específico de esta ejecución
-        logging.StreamHandler(sys.stdout)           # Consola
-    ]
-)
+from lib.config import Config
+from lib import specs
+from lib.golden import GoldenTemplates
+from lib.logger import log_context, run_files, setup_run_logging
+from lib.images import ImageStager
+from lib.parallel import run_parallel
+from lib.placement import Scheduler, log_placements, needs_placement
+from lib.reconcile import Reconciler, log_plan
+from lib.specs import env_snapshot, load_specs, merge_vm
+from lib.proxmox_client import get_client
+from lib.tracing import span, tracer
+
 logger = logging.getLogger(__name__)
 
-# Log de inicio
-logger.info("="*80)
-logger.info(f"Proxmox VM Creator v3.2.0 - Ejecución iniciada")
-logger.info(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-logger.info(f"Log de esta ejecución: {log_filename}")
-logger.info(f"Sistema: {platform.system()} {platform.release()}")
-logger.info(f"Python: {platform.python_version()}")
-logger.info("="*80)
+# Id de la ejecución (timestamp) y log de la ejecución: los fija setup_logging(), no el import
+timestamp = None
+log_filename = None
+
+
+def setup_logging(settings=None):
+    """Activa los logs de la ejecución (lib/logger.py, una vez por proceso) y escribe la cabecera.
+
+    Log humano y JSONL por ejecución más vm_creation.log rotado, escritos desde la
+    cola del logger; el id de ejecución es el mismo del summary_<ts>.json.
+    """
+    global timestamp, log_filename
+    if timestamp is not None:
+        return timestamp
+
+    timestamp = setup_run_logging('vm_creation', settings)
+    files = run_files()
+    log_filename = files.get('log')
+
+    logger.info("="*80)
+    logger.info(f"Proxmox VM Creator v3.2.0 - Ejecución iniciada")
+    logger.info(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.info(f"Ejecución (run): {timestamp}")
+    logger.info(f"Log de esta ejecución: {log_filename}")
+    if files.get('jsonl'):
+        logger.info(f"Log JSON: {files['jsonl']}")
+    logger.info(f"Sistema: {platform.system()} {platform.release()}")
+    logger.info(f"Python: {platform.python_version()}")
+    logger.info("="*80)
+    return timestamp
 
 
 class ProxmoxVMCreator:
     def __init__(self, config_file='config.yaml'):
-        with open(config_file) as f:
-            self.config = yaml.safe_load(f)
-
-        # Obtener credenciales Proxmox (prioridad: .env > config.yaml)
-        px = self.config.get('proxmox', {})
-        px_host = os.getenv('PROXMOX_HOST', px.get('host'))
-        px_user = os.getenv('PROXMOX_USER', px.get('user'))
-        px_password = os.getenv('PROXMOX_PASSWORD', px.get('password'))
-        px_verify_ssl = os.getenv('PROXMOX_VERIFY_SSL', str(px.get('verify_ssl', False))).lower() == 'true'
-
-        if not all([px_host, px_user, px_password]):
-            logger.error("❌ Faltan credenciales de Proxmox (verifica .env o config.yaml)")
-            sys.exit(1)
-
-        try:
-            logger.info(f"Intentando conectar a Proxmox...")
-            logger.info(f"  Host: {px_host}")
-            logger.info(f"  Usuario: {px_user}")
-            logger.info(f"  Verify SSL: {px_verify_ssl}")
-
-            self.proxmox = ProxmoxAPI(
-                px_host,
-                user=px_user,
-                password=px_password,
-                verify_ssl=px_verify_ssl
-            )
-            logger.info(f"✅ Conectado a Proxmox {px_host}")
-        except Exception as e:
-            logger.error(f"❌ Error de conexión: {e}")
-            logger.exception("Detalles completos del error:")
+        cfg = Config(config_file)
+        setup_logging(cfg.data.get('logging'))
+        self.config_file = config_file
+        self.config = cfg.data
+
+        px = cfg.proxmox
+        logger.info(f"Intentando conectar a Proxmox...")
+        logger.info(f"  Host: {px['host']}")
+        logger.info(f"  Usuario: {px['user']}")
+        logger.info(f"  Auth: {'API token' if px['token_name'] and px['token_value'] else 'ticket (cacheado)'}")
+        logger.info(f"  Verify SSL: {px['verify_ssl']}")
+
+        # Cliente compartido: sesión keep-alive y ticket reutilizado entre ejecuciones
+        self.client = get_client(cfg)
+        if not self.client.connect():
+            logger.error("❌ No se pudo conectar a Proxmox (verifica .env o config.yaml)")
             sys.exit(1)
+        self.proxmox = self.client.api
+        self.golden = None
+        logger.info(f"✅ Conectado a Proxmox {px['host']}")
     
     def load_templates(self, file='templates.yaml'):
         try:
@@ -101,172 +99,37 @@ class ProxmoxVMCreator:
     def load_vms(self, file='vms.yaml'):
         with open(file) as f:
             return yaml.safe_load(f).get('vms', [])
+
+    def load_specs(self, vms_file='vms.yaml'):
+        """Compila vms.yaml (plantillas + defaults + env) una sola vez, con caché por contenido."""
+        return load_specs(self.config_file, vms_file)
     
     def merge_config(self, vm):
-        if 'template' in vm:
-            templates = self.load_templates()
-            if vm['template'] in templates:
-                base = templates[vm['template']].copy()
-                base.update(vm)
-                vm = base
-
-        # Defaults desde config.yaml
-        defaults = self.config.get('defaults', {})
-
-        # Override con variables de entorno si existen
-        env_defaults = {
-            'storage': os.getenv('DEFAULT_STORAGE'),
-            'memory': os.getenv('DEFAULT_MEMORY'),
-            'cores': os.getenv('DEFAULT_CORES'),
-            'disk_size': os.getenv('DEFAULT_DISK_SIZE'),
-        }
-
-        # Actualizar defaults con env vars (solo si existen)
-        for k, v in env_defaults.items():
-            if v is not None:
-                defaults[k] = int(v) if k in ['memory', 'cores'] else v
-
-        # Aplicar defaults a la VM
-        for k, v in defaults.items():
-            if k not in vm:
-                vm[k] = v
-
-        return vm
+        return merge_vm(vm, self.load_templates(), self.config, env_snapshot())
     
     def build_params(self, vm):
-        params = {
-            'vmid': vm['vmid'],
-            'name': vm['name'],
-            'memory': vm.get('memory', 2048),
-            'cores': vm.get('cores', 2),
-            'sockets': vm.get('sockets', 1),
-            'ostype': vm.get('ostype', 'l26'),
-            'onboot': 1 if vm.get('onboot', False) else 0,
-            'agent': '1',  # QEMU Agent habilitado
-        }
-        
-        # Obtener imagen cloud
-        image_key = vm.get('image', 'ubuntu22')
-        if 'images' not in self.config['defaults']:
-            logger.error("❌ No hay imágenes configuradas en config.yaml")
-            raise ValueError("Configuración de imágenes faltante")
-        
-        if image_key not in self.config['defaults']['images']:
-            logger.error(f"❌ Imagen '{image_key}' no encontrada en config.yaml")
-            raise ValueError(f"Imagen {image_key} no existe")
-        
-        image_path = self.config['defaults']['images'][image_key]
-        storage = vm.get('storage', 'local-lvm')
-        disk_size = str(vm.get('disk_size', '20G')).rstrip('G')
-
-        # Convertir NFS_SERVER:iso/filename a path absoluto
-        if image_path.startswith('NFS_SERVER:iso/'):
-            # Extraer el nombre del archivo
-            filename = image_path.replace('NFS_SERVER:iso/', '')
-            image_path = f"/mnt/pve/NFS_SERVER/template/iso/{filename}"
-        elif image_path.startswith('NFS_SERVER:'):
-            # Si está en otro subdirectorio
-            filename = image_path.replace('NFS_SERVER:', '')
-            image_path = f"/mnt/pve/NFS_SERVER/{filename}"
-
-        # Importar disco desde imagen cloud
-        params['scsihw'] = 'virtio-scsi-pci'
-        params['scsi0'] = f"{storage}:0,import-from={image_path},discard=on"
-        
-        # Redimensionar disco si es necesario
-        if int(disk_size) > 20:  # Las imágenes cloud suelen ser 2-3GB
-            params['scsi0'] += f",size={disk_size}G"
-        
-        # Cloud-init drive
-        params['ide2'] = f"{storage}:cloudinit"
-        
-        # Red
-        net_cfg = self.config.get('network', {})
-        bridge = vm.get('bridge', os.getenv('NETWORK_BRIDGE', net_cfg.get('bridge', 'vmbr0')))
-        model = vm.get('model', net_cfg.get('model', 'virtio'))
-        params['net0'] = f"{model},bridge={bridge}"
-        
-        # Boot desde disco
-        params['boot'] = 'order=scsi0'
-        
-        # Serial console para cloud-init
-        params['serial0'] = 'socket'
-        params['vga'] = 'serial0'
-        
-        if 'tags' in vm:
-            params['tags'] = vm['tags']
-        
-        if 'description' in vm:
-            params['description'] = vm['description']
-        
-        # Credenciales cloud-init (prioridad: VM > .env > config.yaml)
-        creds = vm.get('credentials', self.config.get('credentials', {}))
-        default_user = os.getenv('VM_DEFAULT_USER', creds.get('user', 'ubuntu'))
-        default_password = os.getenv('VM_DEFAULT_PASSWORD', creds.get('password'))
-
-        params['ciuser'] = creds.get('user', default_user)
-        if 'password' in creds or default_password:
-            params['cipassword'] = creds.get('password', default_password)
-        
-        # Configuración de red (prioridad: VM > .env > config.yaml)
-        net_cfg = self.config.get('network', {})
-        net_type = vm.get('network_type', self.config.get('defaults', {}).get('network_type', 'dhcp'))
-
-        if net_type == 'static' and 'ip' in vm:
-            ip = vm['ip']
-            mask = vm.get('netmask', os.getenv('NETWORK_NETMASK', net_cfg.get('netmask', '24')))
-            gw = vm.get('gateway', os.getenv('NETWORK_GATEWAY', net_cfg.get('gateway')))
-            params['ipconfig0'] = f"ip={ip}/{mask},gw={gw}"
-
-            dns = vm.get('nameserver', os.getenv('NETWORK_NAMESERVER', net_cfg.get('nameserver', '8.8.8.8')))
-            params['nameserver'] = dns
-        else:
-            params['ipconfig0'] = 'ip=dhcp'
-        
-        # SSH keys (prioridad: VM > .env > config.yaml)
-        keys = creds.get('ssh_keys', [])
-        env_keys = os.getenv('VM_SSH_KEYS')
-        if env_keys and not keys:
-            keys = [k.strip() for k in env_keys.split(',') if k.strip()]
-        if keys:
-            # Limpiar keys y URL-encode para Proxmox API
-            cleaned_keys = [k.strip() for k in keys if k.strip()]
-            if cleaned_keys:
-                # Proxmox requiere keys URL-encoded, separadas por %0A (newline)
-                encoded_keys = [quote(key, safe='') for key in cleaned_keys]
-                params['sshkeys'] = '%0A'.join(encoded_keys)
-                logger.info(f"  🔑 Configuradas {len(cleaned_keys)} SSH key(s)")
-        
-        # ⭐ SNIPPET ÚNICO para TODAS las VMs
-        if 'snippet' in self.config['defaults']:
-            snippet = self.config['defaults']['snippet']
-            params['cicustom'] = f"vendor={snippet}"
-            logger.info(f"  📄 Usando snippet: {snippet}")
-        
-        return params
-        return params
+        try:
+            return specs.build_params(vm, self.config, env_snapshot())
+        except ValueError as e:
+            logger.error(f"❌ {e}")
+            raise
     
-    def wait_for_task(self, node, upid):
+    def wait_for_task(self, node, upid, timeout=None):
         logger.info(f"⏳ Supervisando tarea Proxmox: {upid}")
-        while True:
-            try:
-                task = self.proxmox.nodes(node).tasks(upid).status.get()
-                if task['status'] == 'stopped':
-                    if task['exitstatus'] == 'OK':
-                        logger.info(f"✅ Tarea completada exitosamente")
-                        return True
-                    else:
-                        logger.error(f"❌ Tarea falló: {task['exitstatus']}")
-                        return False
-            except Exception as e:
-                logger.error(f"⚠️ Error verificando tarea: {e}")
-            
-            time.sleep(2)
+        if timeout is None:
+            timeout = self.config.get('execution', {}).get('task_timeout', 1800)
+        result = self.client.tasks.wait(node, upid, timeout=timeout)
+        if result.ok:
+            logger.info(f"✅ Tarea completada exitosamente ({result.elapsed:.1f}s)")
+            return True
+        logger.error(f"❌ Tarea falló: {result.exitstatus}")
+        return False
 
-    def create_vm(self, vm):
-        vmid = vm['vmid']
-        name = vm['name']
-        node = vm['node']
+    def create_vm(self, spec):
+        vm = spec.vm
+        vmid = spec.vmid
+        name = spec.name
+        node = spec.node
 
         logger.info(f"\n🚀 Creando VM {vmid} ({name}) en {node}...")
         logger.info(f"{'─'*80}")
@@ -287,7 +150,13 @@ class ProxmoxVMCreator:
             if vm.get('tags'):
                 logger.info(f"   Tags: {vm.get('tags')}")
 
-            params = self.build_params(vm)
+            if spec.error:
+                raise ValueError(spec.error)
+            params = spec.api_params()
+            if 'sshkeys' in params:
+                logger.info(f"  🔑 Configuradas {params['sshkeys'].count('%0A') + 1} SSH key(s)")
+            if 'cicustom' in params:
+                logger.info(f"  📄 Usando snippet: {params['cicustom'].replace('vendor=', '', 1)}")
 
             # Log de parámetros completos (para debugging)
             logger.debug(f"📦 Parámetros completos de Proxmox API:")
@@ -299,17 +168,24 @@ class ProxmoxVMCreator:
                 safe_params['cipassword'] = "<password oculto>"
             logger.debug(json.dumps(safe_params, indent=2, default=str))
 
-            # Crear VM
-            logger.info(f"⏳ Enviando petición a Proxmox API...")
             start_time = datetime.now()
-            
-            # create devuelve el UPID si es exitoso
-            upid = self.proxmox.nodes(node).qemu.create(**params)
-            
-            # Esperar a que termine la creación para evitar problemas de locking en storage
-            if upid and isinstance(upid, str):
-                if not self.wait_for_task(node, upid):
-                    raise Exception(f"Fallo en creación de VM (Task: {upid})")
+
+            if self.golden:
+                # Clonar desde la plantilla golden de (imagen, storage)
+                linked = self.golden.provision(spec)
+                disk_desc = f"{'linked' if linked else 'full'} clone, {spec.disk_size}"
+            else:
+                # Crear VM
+                logger.info(f"⏳ Enviando petición a Proxmox API...")
+
+                # create devuelve el UPID si es exitoso
+                upid = self.proxmox.nodes(node).qemu.create(**params)
+
+                # Esperar a que termine la creación para evitar problemas de locking en storage
+                if upid and isinstance(upid, str):
+                    if not self.wait_for_task(node, upid):
+                        raise Exception(f"Fallo en creación de VM (Task: {upid})")
+                disk_desc = params['scsi0']
 
             elapsed_time = (datetime.now() - start_time).total_seconds()
 
@@ -318,7 +194,7 @@ class ProxmoxVMCreator:
             logger.info(f"   └─ Imagen: {image_key}")
             logger.info(f"   └─ RAM: {params['memory']}MB")
             logger.info(f"   └─ CPU: {params['cores']} cores")
-            logger.info(f"   └─ Disco: {params['scsi0']}")
+            logger.info(f"   └─ Disco: {disk_desc}")
             logger.info(f"   └─ QEMU Agent: Habilitado")
             logger.info(f"   └─ Cloud-init: Configurado")
 
@@ -338,10 +214,13 @@ class ProxmoxVMCreator:
             logger.error(traceback.format_exc())
             logger.error(f"{'─'*80}\n")
             return False
-    
-            logger.error(f"{'─'*80}\n")
-            return False
             
+    def _create_traced(self, spec):
+        with span(f"vm {spec.vmid}", 'vm', name=spec.name, node=spec.node) as attrs, \
+                log_context(vmid=spec.vmid, node=spec.node, op='create'):
+            attrs['ok'] = self.create_vm(spec)
+        return attrs['ok']
+
     def check_storage_space(self, node, storage, required_gb):
         try:
             status = self.proxmox.nodes(node).storage(storage).status.get()
@@ -358,7 +237,7 @@ class ProxmoxVMCreator:
             logger.warning(f"⚠️ No se pudo verificar espacio en {node}:{storage} - {e}")
             return True # Asumimos que sí hay espacio si falla el check
 
-    def validate_deployment(self, vms):
+    def validate_deployment(self, specs):
         logger.info(f"\n🔍 Ejecutando comprobaciones PRE-VUELO...")
         logger.info(f"{'─'*80}")
         
@@ -367,25 +246,27 @@ class ProxmoxVMCreator:
         # 1. Verificar duplicados en vms.yaml
         seen_ids = set()
         seen_names = set()
-        for vm in vms:
-            if vm['vmid'] in seen_ids:
-                errors.append(f"❌ ID DUPLICADO en vms.yaml: {vm['vmid']}")
-            if vm['name'] in seen_names:
-                errors.append(f"❌ NOMBRE DUPLICADO en vms.yaml: {vm['name']}")
-            seen_ids.add(vm['vmid'])
-            seen_names.add(vm['name'])
+        for spec in specs:
+            if spec.vmid in seen_ids:
+                errors.append(f"❌ ID DUPLICADO en vms.yaml: {spec.vmid}")
+            if spec.name in seen_names:
+                errors.append(f"❌ NOMBRE DUPLICADO en vms.yaml: {spec.name}")
+            if spec.error:
+                errors.append(f"❌ VM {spec.vmid} ({spec.name}): {spec.error}")
+            seen_ids.add(spec.vmid)
+            seen_names.add(spec.name)
 
         # 2. Verificar duplicados en Cluster (ID y Nombre)
         try:
-            cluster_resources = self.proxmox.cluster.resources.get(type='vm')
-            existing_ids = {int(r.get('vmid')) for r in cluster_resources if r.get('vmid')}
+            cluster_resources = self.client.inventory.refresh().all()
+            existing_ids = {r['vmid'] for r in cluster_resources}
             existing_names = {r.get('name') for r in cluster_resources if r.get('name')}
             
-            for vm in vms:
-                if vm['vmid'] in existing_ids:
-                     errors.append(f"❌ ID YA EXISTE en Proxmox: {vm['vmid']} (Conflicts with existing VM)")
-                if vm['name'] in existing_names:
-                     errors.append(f"❌ NOMBRE YA EXISTE en Proxmox: {vm['name']}")
+            for spec in specs:
+                if spec.vmid in existing_ids:
+                     errors.append(f"❌ ID YA EXISTE en Proxmox: {spec.vmid} (Conflicts with existing VM)")
+                if spec.name in existing_names:
+                     errors.append(f"❌ NOMBRE YA EXISTE en Proxmox: {spec.name}")
         except Exception as e:
              logger.warning(f"⚠️ No se pudo consultar el cluster para duplicados: {e}")
 
@@ -393,15 +274,9 @@ class ProxmoxVMCreator:
         # Agrupar por nodo/storage
         storage_reqs = {} # key: (node, storage) -> val: total_gb
         
-        for vm in vms:
-            vm = self.merge_config(vm) # Necesitamos defaults para saber storage y disk_size
-            node = vm['node']
-            storage = vm.get('storage', self.config['defaults']['storage'])
-            size_str = str(vm.get('disk_size', self.config['defaults']['disk_size'])).rstrip('G')
-            size_gb = int(size_str)
-            
-            key = (node, storage)
-            storage_reqs[key] = storage_reqs.get(key, 0) + size_gb
+        for spec in specs:
+            key = (spec.node, spec.storage)
+            storage_reqs[key] = storage_reqs.get(key, 0) + spec.disk_gb
 
         for (node, storage), total_gb in storage_reqs.items():
             if not self.check_storage_space(node, storage, total_gb):
@@ -417,24 +292,56 @@ class ProxmoxVMCreator:
         logger.info("✅ Todas las comprobaciones PASARON. El plan es seguro.")
         return True
     
-    def run(self, dry_run=False, vms_file='vms.yaml'):
+    def run(self, dry_run=False, vms_file='vms.yaml', parallel=None, per_node=None, clone=None, reconcile=False):
         execution_start = datetime.now()
 
+        exec_cfg = self.config.get('execution', {})
+        if parallel is None:
+            parallel = int(exec_cfg.get('parallel', 1))
+        if per_node is None:
+            per_node = int(exec_cfg.get('per_node', parallel))
+        if clone is None:
+            clone = self.config.get('provisioning', {}).get('mode', 'import') == 'clone'
+        if clone:
+            self.golden = GoldenTemplates(self.client, self.config)
+
         # Log de parámetros de ejecución
         logger.info(f"\n{'='*80}")
         logger.info(f"📋 PARÁMETROS DE EJECUCIÓN")
         logger.info(f"{'='*80}")
         logger.info(f"Archivo de VMs: {vms_file}")
         logger.info(f"Modo: {'DRY-RUN (Simulación)' if dry_run else 'PRODUCCIÓN (Creación real)'}")
+        logger.info(f"Paralelismo: {parallel} (máx. {per_node} por nodo)")
+        logger.info(f"Aprovisionamiento: {'clon desde plantilla golden' if clone else 'import de imagen cloud'}")
+        if reconcile:
+            logger.info(f"Reconcile: sólo se aplican las diferencias con el cluster")
         logger.info(f"{'='*80}\n")
 
-        vms = self.load_vms(vms_file)
+        # Compilación única: plantillas, defaults y parámetros de la API
+        vms = self.load_specs(vms_file)
+        if self.golden:
+            # Las plantillas no pueden ocupar el vmid de una VM de este inventario
+            self.golden.reserve_vmids(spec.vmid for spec in vms)
+        placements = {}
+        if any(needs_placement(spec) for spec in vms):
+            # node: auto / sin node -> nodo elegido según la capacidad real del cluster
+            vms, placements = Scheduler(self.proxmox, self.config).place(vms)
+            log_placements(vms, placements)
+        to_create = vms
+        actions = []
+        if reconcile:
+            # Plan: diff de las specs contra cluster/resources + config de cada VM
+            reconciler = Reconciler(self.client, max_workers=max(parallel, 8))
+            actions = reconciler.plan(vms)
+            log_plan(actions)
+            to_create = tuple(a.spec for a in actions if a.kind == 'create')
+
         logger.info(f"\n{'='*80}")
-        logger.info(f"Creando {len(vms)} VM(s) con imágenes cloud")
+        logger.info(f"Creando {len(to_create)} VM(s) con imágenes cloud")
         logger.info(f"{'='*80}\n")
         
         # Validar antes de hacer nada (incluso en dry-run)
-        if not self.validate_deployment(vms) and not dry_run:
+        if (to_create or not reconcile) and not self.validate_deployment(to_create) and not dry_run:
              sys.exit(1)
 
         if dry_run:
@@ -444,41 +351,85 @@ class ProxmoxVMCreator:
         successful_vms = []
         failed_vms = []
 
-        for vm in vms:
-            vm = self.merge_config(vm)
-
-            if dry_run:
-                logger.info(f"[DRY-RUN] VM {vm['vmid']} - {vm['name']}")
-                logger.info(f"  Nodo: {vm.get('node', 'N/A')}")
-                logger.info(f"  Imagen: {vm.get('image', 'ubuntu22')}")
-                logger.info(f"  CPU: {vm.get('cores', 2)}, RAM: {vm.get('memory', 2048)}MB")
-                logger.info(f"  Disco: {vm.get('disk_size', '20G')}")
+        if dry_run:
+            for spec in to_create:
+                logger.info(f"[DRY-RUN] VM {spec.vmid} - {spec.name}")
+                logger.info(f"  Nodo: {spec.node or 'N/A'}")
+                logger.info(f"  Imagen: {spec.image}")
+                logger.info(f"  CPU: {spec.cores}, RAM: {spec.memory}MB")
+                logger.info(f"  Disco: {spec.disk_size}")
                 successful_vms.append({
-                    'vmid': vm['vmid'],
-                    'name': vm['name'],
-                    'node': vm.get('node', 'N/A'),
+                    'vmid': spec.vmid,
+                    'name': spec.name,
+                    'node': spec.node or 'N/A',
                     'status': 'dry-run'
                 })
-            else:
-                if self.create_vm(vm):
+        else:
+            # Imágenes cloud en el storage local de cada nodo antes de importar
+            staging_failed = ImageStager(self.client, self.config).stage(to_create)
+            pending = []
+            for spec in to_create:
+                if (spec.node, spec.image) in staging_failed:
+                    logger.error(f"❌ VM {spec.vmid} ({spec.name}): imagen {spec.image} no disponible en {spec.node}")
+                    failed_vms.append({
+                        'vmid': spec.vmid,
+                        'name': spec.name,
+                        'node': spec.node or 'N/A',
+                        'status': 'staging-failed'
+                    })
+                else:
+                    pending.append(spec)
+
+            if parallel > 1:
+                logger.info(f"⚡ Modo paralelo: {parallel} VMs simultáneas, máx. {per_node} por nodo, 1 por nodo+storage")
+
+            # Sólo se serializa donde Proxmox toma un lock real: mismo nodo + mismo storage
+            results = run_parallel(
+                pending,
+                self._create_traced,
+                max_workers=parallel,
+                limits=[
+                    (lambda spec: (spec.node, spec.storage), 1),
+                    (lambda spec: spec.node, per_node),
+                ]
+            )
+
+            for spec, ok in zip(pending, results):
+                if ok:
                     successful_vms.append({
-                        'vmid': vm['vmid'],
-                        'name': vm['name'],
-                        'node': vm.get('node', 'N/A'),
-                        'memory': vm.get('memory', 2048),
-                        'cores': vm.get('cores', 2),
-                        'disk': vm.get('disk_size', '20G'),
-                        'ip': vm.get('ip', 'DHCP'),
+                        'vmid': spec.vmid,
+                        'name': spec.name,
+                        'node': spec.node or 'N/A',
+                        'memory': spec.memory,
+                        'cores': spec.cores,
+                        'disk': spec.disk_size,
+                        'ip': spec.ip or 'DHCP',
                         'status': 'created'
                     })
                 else:
                     failed_vms.append({
-                        'vmid': vm['vmid'],
-                        'name': vm['name'],
-                        'node': vm.get('node', 'N/A'),
+                        'vmid': spec.vmid,
+                        'name': spec.name,
+                        'node': spec.node or 'N/A',
                         'status': 'failed'
                     })
 
+            # Reconcile: sólo las VMs existentes que difieren reciben escrituras
+            if reconcile:
+                applied = dict((a.spec.vmid, ok) for a, ok in reconciler.apply(actions))
+                for action in actions:
+                    spec = action.spec
+                    entry = {'vmid': spec.vmid, 'name': spec.name, 'node': spec.node or 'N/A'}
+                    if action.kind == 'conflict':
+                        failed_vms.append(dict(entry, status='conflict', reason=action.reason))
+                    elif action.kind == 'noop':
+                        successful_vms.append(dict(entry, status='unchanged'))
+                    elif action.kind in ('update', 'resize'):
+                        status = 'updated' if action.kind == 'update' else 'resized'
+                        target = successful_vms if applied.get(spec.vmid) else failed_vms
+                        target.append(dict(entry, status=status if applied.get(spec.vmid) else 'failed',
+                                           changes=sorted(action.changes), resize=action.resize))
+
         execution_end = datetime.now()
         elapsed_total = (execution_end - execution_start).total_seconds()
 
@@ -492,9 +443,10 @@ class ProxmoxVMCreator:
         logger.info(f"{'='*80}")
 
         if successful_vms:
-            logger.info(f"\n✅ VMs creadas exitosamente:")
+            logger.info(f"\n✅ VMs creadas exitosamente:" if not reconcile else f"\n✅ VMs reconciliadas:")
             for vm in successful_vms:
-                logger.info(f"   • VM {vm['vmid']} ({vm['name']}) en {vm['node']}")
+                logger.info(f"   • VM {vm['vmid']} ({vm['name']}) en {vm['node']}"
+                            + (f" [{vm['status']}]" if reconcile else ''))
 
         if failed_vms:
             logger.info(f"\n❌ VMs que fallaron:")
@@ -503,9 +455,15 @@ class ProxmoxVMCreator:
 
         # Guardar resumen en JSON
         summary = {
+            'run': timestamp,
             'timestamp': execution_end.strftime('%Y-%m-%d %H:%M:%S'),
             'execution_time_seconds': elapsed_total,
             'mode': 'dry-run' if dry_run else 'production',
+            'parallel': parallel,
+            'provisioning': 'clone' if clone else 'import',
+            'reconcile': reconcile,
+            'plan': {a.spec.vmid: a.kind for a in actions},
+            'placement': placements,
             'vms_file': vms_file,
             'total_vms': len(vms),
             'successful': len(successful_vms),
@@ -513,7 +471,11 @@ class ProxmoxVMCreator:
             'successful_vms': successful_vms,
             'failed_vms': failed_vms
         }
+        summary['logs'] = run_files()
+        if tracer.enabled and tracer.run_id:
+            summary['trace'] = tracer.paths(tracer.run_id)['jsonl']
 
+        os.makedirs('logs', exist_ok=True)
         summary_file = f'logs/summary_{timestamp}.json'
         with open(summary_file, 'w') as f:
             json.dump(summary, f, indent=2)
@@ -526,6 +488,7 @@ class ProxmoxVMCreator:
         logger.info(f"Ejecución finalizada: {execution_end.strftime('%Y-%m-%d %H:%M:%S')}")
         logger.info(f"Log completo: {log_filename}")
         logger.info(f"{'='*80}\n")
+        return summary
 
 
 def main():
@@ -533,11 +496,26 @@ def main():
     parser.add_argument('--dry-run', action='store_true', help='Simular sin crear VMs')
     parser.add_argument('--config', default='config.yaml', help='Archivo de configuración')
     parser.add_argument('--vms', default='vms.yaml', help='Archivo de VMs')
-    
+    parser.add_argument('--parallel', type=int, default=None, help='VMs a crear en paralelo (default: execution.parallel o 1)')
+    parser.add_argument('--per-node', type=int, default=None, help='Máximo de creaciones simultáneas por nodo')
+    parser.add_argument('--reconcile', action='store_true',
+                        help='Aplicar sólo las diferencias con el cluster (crear/actualizar/redimensionar)')
+    parser.add_argument('--clone', action='store_true', default=None,
+                        help='Clonar desde plantillas golden por imagen+storage (default: provisioning.mode)')
+
+    parser.add_argument('--trace', action='store_true', help='Exportar trazas de tiempo (logs/trace_<ts>.jsonl)')
+    parser.add_argument('--profile', action='store_true', help='Ejecutar bajo cProfile (logs/profile_<ts>.prof)')
+
     args = parser.parse_args()
 
     creator = ProxmoxVMCreator(args.config)
-    creator.run(dry_run=args.dry_run, vms_file=args.vms)
+    tracer.configure(creator.config.get('tracing'))
+    tracer.enabled = tracer.enabled or args.trace
+    tracer.profile = tracer.profile or args.profile
+    # Mismo timestamp que el log y el summary_*.json de esta ejecución
+    with tracer.action('create_vm', run_id=timestamp):
+        creator.run(dry_run=args.dry_run, vms_file=args.vms, parallel=args.parallel, per_node=args.per_node,
+                    clone=args.clone, reconcile=args.reconcile)
 
 
 if __name__ == '__main__':
@@ -1,31 +1,103 @@
+#!/usr/bin/env python3
+"""
+Borrado masivo de VMs en un solo proceso.
+
+Cada VM se detiene (si corre) y se destruye con `purge` en paralelo, con un
+máximo de operaciones simultáneas por nodo. Todas las tareas se siguen juntas
+con el TaskWatcher compartido, así que borrar una flota tarda lo que la VM
+más lenta y no la suma. Por defecto se borran las VMs de vms.yaml; los
+filtros --tag/--node/--ids/--name/--all eligen otras (ver lib/selection.py).
+"""
+import argparse
+import time
+
+from lib.config import Config
+from lib.logger import log_context
+from lib.parallel import bulk_limits, run_parallel
+from lib.proxmox_client import get_client
+from lib.selection import Selector
+from lib.tracing import span
+from delete_vm import destroy_vm
+
+
+def delete_vms(selector=None, purge=True, parallel=None, per_node=None, dry_run=False):
+    """Borra las VMs seleccionadas. Devuelve una lista de resultados por VM."""
+    cfg = Config()
+    client = get_client(cfg)
+    if not client.connect():
+        return []
+
+    selector = selector or Selector()
+    parallel, per_node = bulk_limits(cfg.data, parallel, per_node)
+    try:
+        targets = selector.select(client.inventory.refresh(), cfg.vms)
+    except Exception as e:
+        print(f"❌ No se pudo consultar el cluster: {e}")
+        return []
+
+    if not selector.all_vms:
+        missing = {vm['vmid'] for vm in cfg.vms} - {vm['vmid'] for vm in client.inventory.all()}
+        if missing:
+            print(f"⚪ {len(missing)} VM(s) de vms.yaml ya no existen: {', '.join(map(str, sorted(missing)))}")
+
+    print(f"🗑️  Borrando {len(targets)} VM(s) ({selector.describe()}) - "
+          f"{parallel} en paralelo, máx. {per_node} por nodo{', purge' if purge else ''}")
+    if not targets:
+        return []
+    if dry_run:
+        for vm in targets:
+            print(f"  [DRY-RUN] VM {vm['vmid']} ({vm.get('name', '')}) en {vm['node']} [{vm.get('status')}]")
+        return [dict(vmid=vm['vmid'], name=vm.get('name'), node=vm['node'], ok=True, elapsed=0.0,
+                     detail='dry-run') for vm in targets]
+
+    def delete_one(vm):
+        start = time.monotonic()
+        with span(f"delete {vm['vmid']}", 'vm', node=vm['node']), \
+                log_context(vmid=vm['vmid'], node=vm['node'], op='delete'):
+            ok, detail = destroy_vm(client, vm['node'], vm['vmid'], running=vm.get('status') == 'running',
+                                    purge=purge)
+        elapsed = time.monotonic() - start
+        print(f"  {'✅' if ok else '❌'} VM {vm['vmid']} ({vm.get('name', '')}) en {vm['node']}: "
+              f"{detail} ({elapsed:.1f}s)")
+        return dict(vmid=vm['vmid'], name=vm.get('name'), node=vm['node'], ok=ok, elapsed=elapsed,
+                    detail=detail)
+
+    start = time.monotonic()
+    results = run_parallel(targets, delete_one, max_workers=parallel,
+                           limits=[(lambda vm: vm['node'], per_node)])
+    total = time.monotonic() - start
+
+    failed = [r for r in results if not r['ok']]
+    print("\n" + "=" * 60)
+    print(f"✅ Eliminadas: {len(results) - len(failed)}   ❌ Fallidas: {len(failed)}")
+    print(f"⏱️  Total: {total:.1f}s (VM más lenta: {max(r['elapsed'] for r in results):.1f}s, "
+          f"suma: {sum(r['elapsed'] for r in results):.1f}s)")
+    for r in failed:
+        print(f"   • VM {r['vmid']} ({r['name']}) en {r['node']}: {r['detail']}")
+    print("=" * 60)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Borrado masivo y en paralelo de VMs')
+    Selector.add_arguments(parser)
+    parser.add_argument('--no-purge', action='store_true', help='No purgar backups/HA ni discos no referenciados')
+    parser.add_argument('--parallel', type=int, default=None, help='VMs a la vez (default: execution.bulk_parallel)')
+    parser.add_argument('--per-node', type=int, default=None, help='Máximo por nodo (default: execution.bulk_per_node)')
+    parser.add_argument('--dry-run', action='store_true', help='Mostrar qué se borraría sin borrar')
+    parser.add_argument('--yes', action='store_true', help='No pedir confirmación')
+    args = parser.parse_args()
+
+    if not args.yes and not args.dry_run:
+        if input("Escribe 'borrar' para confirmar: ").strip() != 'borrar':
+            print("Cancelado.")
+            return
+
+    results = delete_vms(Selector.from_args(args), purge=not args.no_purge, parallel=args.parallel,
+                         per_node=args.per_node, dry_run=args.dry_run)
+    if any(not r['ok'] for r in results):
+        raise SystemExit(1)
 
-import yaml
-import subprocess
-import sys
-
-def load_vms(file='config.yaml'):
-    with open(file) as f:
-        return yaml.safe_load(f).get('vms', [])
-
-def delete_vms():
-    vms = load_vms()
-    print(f"🗑️  Starting cleanup of {len(vms)} VMs...")
-    
-    for vm in vms:
-        vmid = vm['vmid']
-        node = vm['node']
-        print(f"  👉 Deleting VM {vmid} from {node}...")
-        
-        # Call delete_vm.py
-        # Using the same venv python
-        cmd = [sys.executable, "delete_vm.py", node, str(vmid)]
-        
-        try:
-            subprocess.run(cmd, check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"  ⚠️  Failed to delete VM {vmid}: {e}")
-        except Exception as e:
-            print(f"  ❌ Error: {e}")
 
 if __name__ == "__main__":
-    delete_vms()
+    main()
@@ -3,80 +3,61 @@
 Script para eliminar VMs de Proxmox
 """
 
-import yaml
-import os
 import sys
-from proxmoxer import ProxmoxAPI
-import requests
-from dotenv import load_dotenv
+from lib.proxmox_client import get_client
 
-load_dotenv()
-requests.packages.urllib3.disable_warnings()
 
-# Leer config
-with open('config.yaml') as f:
-    config = yaml.safe_load(f)
+def destroy_vm(client, node, vmid, running=None, purge=True, stop_timeout=120, timeout=600):
+    """Detiene (si corre) y destruye una VM sin escribir en consola. Devuelve (ok, detalle).
 
-px = config.get('proxmox', {})
-px_host = os.getenv('PROXMOX_HOST', px.get('host'))
-px_user = os.getenv('PROXMOX_USER', px.get('user'))
-px_password = os.getenv('PROXMOX_PASSWORD', px.get('password'))
-px_verify_ssl = os.getenv('PROXMOX_VERIFY_SSL', str(px.get('verify_ssl', False))).lower() == 'true'
-
-proxmox = ProxmoxAPI(
-    px_host,
-    user=px_user,
-    password=px_password,
-    verify_ssl=px_verify_ssl
-)
-
-if len(sys.argv) < 3:
-    print("Uso: python delete_vm.py <node> <vmid>")
-    print("Ejemplo: python delete_vm.py Nnuc13 9999")
-    sys.exit(1)
-
-node = sys.argv[1]
-vmid = sys.argv[2]
-
-print(f"\n🗑️  Eliminando VM {vmid} del nodo {node}...")
-
-try:
-    # Detener VM si está corriendo
+    running: estado ya conocido (p.ej. del inventario); None = consultarlo.
+    purge: quitar la VM de backups/replicación/HA y borrar discos no referenciados.
+    """
+    proxmox = client.api
+    vm = proxmox.nodes(node).qemu(vmid)
     try:
-        status = proxmox.nodes(node).qemu(vmid).status.current.get()
-        if status['status'] == 'running':
-            print(f"  ⏸️  Deteniendo VM...")
-            task = proxmox.nodes(node).qemu(vmid).status.stop.post()
-            # Wait for stop
-            while True:
-                task_status = proxmox.nodes(node).tasks(task).status.get()
-                if task_status['status'] == 'stopped':
-                    break
-                import time
-                time.sleep(1)
-            time.sleep(2) # Extra safety
-    except:
-        pass
-
-    # Eliminar VM
-    print(f"  🗑️  Enviando orden de borrado...")
-    task = proxmox.nodes(node).qemu(vmid).delete()
-    
-    # Wait for delete
-    while True:
-        task_status = proxmox.nodes(node).tasks(task).status.get()
-        if task_status['status'] == 'stopped':
-            if task_status['exitstatus'] == 'OK':
-                print(f"  ✅ VM {vmid} eliminada exitosamente\n")
-            else:
-                print(f"  ❌ Error eliminando VM: {task_status['exitstatus']}\n")
-            break
-        import time
-        time.sleep(1)
-
-except Exception as e:
-    if "does not exist" in str(e):
-        print(f"  ⚠️  VM no encontrada (ya eliminada?): {e}\n")
-        sys.exit(0)
-    print(f"  ❌ Error: {e}\n")
-    sys.exit(1)
+        if running is None:
+            running = vm.status.current.get().get('status') == 'running'
+        if running:
+            result = client.tasks.wait(node, vm.status.stop.post(), timeout=stop_timeout)
+            if not result.ok:
+                return False, f"stop: {result.exitstatus}"
+
+        params = {'purge': 1, 'destroy-unreferenced-disks': 1} if purge else {}
+        result = client.tasks.wait(node, vm.delete(**params), timeout=timeout)
+        if result.ok:
+            return True, 'eliminada'
+        return False, str(result.exitstatus)
+    except Exception as e:
+        if "does not exist" in str(e):
+            return True, 'ya no existía'
+        return False, str(e)
+
+
+def delete_vm(client, node, vmid, purge=True):
+    """Detiene (si corre) y elimina una VM. Devuelve True si quedó eliminada."""
+    print(f"\n🗑️  Eliminando VM {vmid} del nodo {node}...")
+    ok, detail = destroy_vm(client, node, vmid, purge=purge)
+    if ok:
+        print(f"  ✅ VM {vmid} {detail}\n")
+    else:
+        print(f"  ❌ Error eliminando VM {vmid}: {detail}\n")
+    return ok
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Uso: python delete_vm.py <node> <vmid>")
+        print("Ejemplo: python delete_vm.py Nnuc13 9999")
+        sys.exit(1)
+
+    client = get_client()
+    if not client.connect():
+        sys.exit(1)
+
+    if not delete_vm(client, sys.argv[1], sys.argv[2]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,102 +1,113 @@
 #!/usr/bin/env python3
 """
 Script to Fix & Optimize K3s Cluster VMs
-1. Resizes disks to correct size (200G for Masters, 400G for Workers)
+1. Resizes disks to the size declared in vms.yaml (disk_size; grow only)
 2. Enables SSD emulation (ssd=1)
 3. Expands filesystem inside VM
-"""
 
+Los pasos 1 y 2 son un único config POST + resize por VM, todas en paralelo
+(ver lib/patches.py). El resize es en caliente; `ssd=1` en una VM encendida
+queda pendiente hasta el próximo arranque: con --restart se reinicia cada VM
+que lo necesite una sola vez, después de expandir el FS; sin él, restart_vms.py
+lo aplica más tarde.
+
+    python fix_and_optimize.py
+    python fix_and_optimize.py --tag worker --restart
+"""
+import argparse
 import time
-import subprocess
-import yaml
-import os
-from proxmoxer import ProxmoxAPI
-import requests
-from dotenv import load_dotenv
-
-
-def fix_and_optimize():
-    """Optimiza las VMs del cluster K3s: resize disk, SSD flag, expand FS"""
-    load_dotenv()
-    requests.packages.urllib3.disable_warnings()
-
-    # Configuration
-    VMS = [
-        {'vmid': 3001, 'node': 'DELL',   'size': '200G', 'ip': '192.168.1.21'},
-        {'vmid': 3002, 'node': 'nuc10',  'size': '200G', 'ip': '192.168.1.22'},
-        {'vmid': 3003, 'node': 'msa',    'size': '200G', 'ip': '192.168.1.23'},
-        {'vmid': 3004, 'node': 'BOSC',   'size': '400G', 'ip': '192.168.1.24'},
-        {'vmid': 3005, 'node': 'DELL',   'size': '400G', 'ip': '192.168.1.25'},
-        {'vmid': 3006, 'node': 'msn2',   'size': '400G', 'ip': '192.168.1.26'},
-        {'vmid': 3007, 'node': 'Nnuc13', 'size': '400G', 'ip': '192.168.1.27'},
-        {'vmid': 3008, 'node': 'msa',    'size': '400G', 'ip': '192.168.1.28'},
-    ]
-
-    # Proxmox Setup
-    with open('config.yaml') as f:
-        config = yaml.safe_load(f)
-
-    px = config.get('proxmox', {})
-    px_host = os.getenv('PROXMOX_HOST', px.get('host'))
-    px_user = os.getenv('PROXMOX_USER', px.get('user'))
-    px_password = os.getenv('PROXMOX_PASSWORD', px.get('password'))
-
-    proxmox = ProxmoxAPI(px_host, user=px_user, password=px_password, verify_ssl=False)
-
-    def run_ssh(ip, cmd):
-        """Runs SSH command with strict checking disabled"""
-        ssh_cmd = f"ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null rwagner@{ip} '{cmd}'"
-        return subprocess.run(ssh_cmd, shell=True, capture_output=True, text=True)
-
-    print("🚀 Starting Disk Fix & Optimization...")
-    print("="*60)
-
-    for vm in VMS:
-        vmid = vm['vmid']
-        node = vm['node']
-        size = vm['size']
-        ip = vm['ip']
-
-        print(f"\nProcessing VM {vmid} ({ip})...")
-
-        try:
-            # 1. Resize Disk
-            print(f"  💾 Resizing disk to {size}...")
-            proxmox.nodes(node).qemu(vmid).resize.put(disk='scsi0', size=size)
-
-            # 2. Enable SSD Emulation
-            print(f"  ⚡ Enabling SSD emulation...")
-            vm_config = proxmox.nodes(node).qemu(vmid).config.get()
-            current_scsi0 = vm_config.get('scsi0', '')
-
-            if 'ssd=1' not in current_scsi0:
-                new_scsi0 = f"{current_scsi0},ssd=1"
-                proxmox.nodes(node).qemu(vmid).config.set(scsi0=new_scsi0)
-                print("     -> SSD flag enabled.")
-            else:
-                print("     -> SSD flag already active.")
-
-            # 3. Expand Filesystem inside VM
-            print(f"  📈 Expanding filesystem inside Guest...")
-
-            # Grow partition
-            res = run_ssh(ip, "sudo growpart /dev/sda 1")
-            if res.returncode != 0 and "NOCHANGE" not in res.stdout:
-                 print(f"     ⚠️  Growpart issue: {res.stderr.strip()}")
-
-            # Resize FS
-            run_ssh(ip, "sudo resize2fs /dev/sda1")
-
-            # Check result
-            res = run_ssh(ip, "df -h / | grep /")
-            print(f"     ✅ New Size: {res.stdout.strip()}")
-
-        except Exception as e:
-            print(f"  ❌ Error: {e}")
-
-    print("\n" + "="*60)
-    print("Done.")
+
+from lib.config import Config
+from lib.logger import log, log_context
+from lib.parallel import run_parallel
+from lib.patches import DriveOption, PatchEngine, Resize, report
+from lib.proxmox_client import get_client
+from lib.selection import Selector
+from lib.ssh import get_pool
+
+DISK = 'scsi0'
+
+
+def fix_and_optimize(selector=None, restart=False, expand_fs=True, parallel=None, per_node=None, dry_run=False):
+    """Optimiza las VMs del cluster K3s: resize disk, SSD flag, expand FS. Devuelve resultados por VM."""
+    cfg = Config()
+    client = get_client(cfg)
+    if not client.connect():
+        return False
+
+    selector = selector or Selector()
+    engine = PatchEngine(client, cfg.data, parallel=parallel, per_node=per_node)
+    try:
+        targets = selector.select(client.inventory.refresh(), cfg.vms)
+    except Exception as e:
+        log.error(f"❌ No se pudo consultar el cluster: {e}")
+        return False
+    declared = {vm['vmid']: vm for vm in cfg.vms}
+
+    def changes(vm):
+        spec = declared.get(vm['vmid'], {})
+        wanted = [Resize(DISK, spec['disk_size'])] if spec.get('disk_size') else []
+        return wanted + [DriveOption(DISK, ssd=1)]
+
+    log.info(f"🚀 Fix & Optimize de {len(targets)} VM(s) ({selector.describe()}) - "
+             f"{engine.parallel} en paralelo, máx. {engine.per_node} por nodo")
+    log.info("=" * 60)
+    if not targets:
+        return []
+
+    start = time.monotonic()
+    results = engine.apply(targets, changes, restart=False, dry_run=dry_run)
+
+    if expand_fs and not dry_run:
+        k3s = cfg.data.get('k3s', {})
+        # Una conexión multiplexada por VM: growpart, resize2fs y df comparten handshake
+        ssh = get_pool(k3s.get('user', 'rwagner'), k3s.get('ssh_key'))
+        running = {vm['vmid'] for vm in targets if vm.get('status') == 'running'}
+
+        def expand(result):
+            ip = str(declared.get(result['vmid'], {}).get('ip', '')).split('/')[0]
+            if not result['ok'] or result['vmid'] not in running or not ip or ip == 'dhcp':
+                return
+            with log_context(vmid=result['vmid'], node=result['node'], op='expand-fs'):
+                begin = time.monotonic()
+                try:
+                    res = ssh.run(ip, "sudo growpart /dev/sda 1", timeout=120)
+                    if res.returncode != 0 and "NOCHANGE" not in res.stdout:
+                        log.warning(f"     ⚠️  Growpart issue en VM {result['vmid']}: {res.stderr.strip()}")
+                    ssh.run(ip, "sudo resize2fs /dev/sda1", timeout=120)
+                    res = ssh.run(ip, "df -h / | grep /", timeout=120)
+                    result['detail'] += f", FS: {' '.join(res.stdout.split()[1:2]) or '?'}"
+                except Exception as e:
+                    result['detail'] += f", FS sin expandir: {e}"
+                result['elapsed'] += time.monotonic() - begin
+
+        log.info("  📈 Expandiendo el filesystem dentro de las VMs...")
+        run_parallel(results, expand, max_workers=engine.parallel)
+
+    if restart and not dry_run:
+        engine.restart(results)
+
+    report(results, time.monotonic() - start)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resize de disco, SSD y expansión del FS de las VMs')
+    Selector.add_arguments(parser)
+    parser.add_argument('--restart', action='store_true',
+                        help='Reiniciar las VMs en las que ssd=1 quede pendiente (tras expandir el FS)')
+    parser.add_argument('--no-expand-fs', dest='expand_fs', action='store_false',
+                        help='No ejecutar growpart/resize2fs por SSH')
+    parser.add_argument('--parallel', type=int, default=None, help='VMs a la vez (default: execution.bulk_parallel)')
+    parser.add_argument('--per-node', type=int, default=None, help='Máximo por nodo (default: execution.bulk_per_node)')
+    parser.add_argument('--dry-run', action='store_true', help='Mostrar qué se cambiaría sin tocar las VMs')
+    args = parser.parse_args()
+
+    results = fix_and_optimize(Selector.from_args(args), restart=args.restart, expand_fs=args.expand_fs,
+                               parallel=args.parallel, per_node=args.per_node, dry_run=args.dry_run)
+    if results is False or any(not r['ok'] for r in results):
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
-    fix_and_optimize()
+    main()
@@ -0,0 +1,171 @@
+"""
+Registro de acciones del menú y del modo headless (`main.py --action <nombre>`).
+
+Cada acción tiene un nombre estable (el que usa `deploy.sh --action`), su
+entrada en el menú y un destino 'módulo:función' o 'módulo:Clase.método' que
+sólo se importa al ejecutarla: arrancar main.py no carga proxmoxer, K3s ni
+ningún script que no se vaya a usar.
+
+En modo headless la salida humana de la acción va a stderr y stdout recibe una
+línea JSON por acción, de modo que varias acciones se pueden encadenar y
+procesar con `jq`:
+
+    {"action": "check-vms", "ok": true, "elapsed": 1.42, "result": null, "error": null}
+"""
+import importlib
+import json
+import sys
+import time
+from collections import namedtuple
+from contextlib import redirect_stdout
+
+from lib.logger import log_context
+from lib.tracing import tracer
+
+Action = namedtuple('Action', ['name', 'key', 'label', 'target', 'kwargs', 'confirm', 'confirm_word', 'interactive',
+                               'help'])
+Action.__new__.__defaults__ = ({}, None, None, False, '')
+
+ACTIONS = [
+    Action('create-vms', '1', "🚀 Crear VMs (Producción)", 'create_vm:ProxmoxVMCreator.run', {'dry_run': False},
+           confirm="¿Seguro que deseas CREAR las VMs en Proxmox?", help='Crea las VMs de vms.yaml'),
+    Action('dry-run', '2', "🧪 Crear VMs (Dry Run / Simulación)", 'create_vm:ProxmoxVMCreator.run', {'dry_run': True},
+           help='Simula la creación de VMs'),
+    Action('check-vms', '3', "🔍 Verificar Estado de VMs", 'check_vms:check_vms', help='Estado de las VMs de vms.yaml'),
+    Action('start-vms', '4', "▶️  Iniciar Todas las VMs", 'start_vms:start_vms', help='Arranca las VMs'),
+    Action('restart-vms', '5', "🔄 Reiniciar VMs (Aplicar cambios HW)", 'restart_vms:restart_vms',
+           confirm="Esto REINICIARÁ las VMs con cambios pendientes. ¿Continuar?",
+           help='Reinicia por olas las VMs con cambios de hardware pendientes'),
+    Action('fix-optimize', '6', "🛠️  Fix & Optimize (Resize Disk, SSD, FS)", 'fix_and_optimize:fix_and_optimize',
+           help='Discos SSD/discard y expansión del FS'),
+    Action('create-snapshots', '7', "📸 Crear Snapshots 'Pre-K3s'", 'create_snapshot:create_snapshots',
+           help="Snapshot 'Pre-K3s-Install' en paralelo"),
+    Action('delete-vms', '8', "🗑️  BORRAR Todas las VMs", 'delete_all_vms:delete_vms', confirm_word='borrar',
+           help='Borra las VMs de vms.yaml'),
+    Action('deploy-k3s', '9', "☸️  Desplegar Cluster K3s (HA)", 'lib.k3s_manager:K3sManager.deploy',
+           confirm="🚀 ¿Desplegar K3s HA Cluster? (Asegúrate de haber iniciado las VMs)",
+           help='Despliega K3s HA, kube-vip y MetalLB'),
+    Action('k3s-status', '10', "📊 Ver Estatus Cluster K3s (Nodos/IPs)", 'lib.k3s_manager:K3sManager.show_status',
+           help='Nodos, versiones e IPs del cluster K3s'),
+    Action('k3s-start', '11', "🚀 Iniciar Cluster K3s", 'lib.k3s_manager:K3sManager.start_cluster',
+           confirm="🚀 ¿Iniciar servicios K3s en todo el cluster?", help='Arranca los servicios K3s'),
+    Action('k3s-stop', '12', "🛑 Detener Cluster K3s", 'lib.k3s_manager:K3sManager.stop_cluster',
+           confirm="⚠️  ¿Detener todos los servicios K3s en el cluster?", help='Detiene los servicios K3s'),
+    Action('shutdown-vms', '13', "🌙 Apagar VMs (Selección Manual)", 'shutdown_vms:shutdown_vms_interactive',
+           interactive=True, help='Apagado ACPI de las VMs elegidas'),
+    Action('remove-cloudinit', '14', "💿 Remover Cloud-Init Drives", 'remove_cloudinit_all:remove_cloudinit_all',
+           confirm="¿Remover Cloud-Init drives de todas las VMs?", help='Quita los drives cloud-init'),
+    Action('install-metallb', '15', "☸️  Instalar MetalLB (LoadBalancer)", 'lib.k3s_manager:K3sManager.install_metallb',
+           confirm="¿Instalar MetalLB en el cluster K3s?", help='Instala MetalLB'),
+    Action('nginx-test', '16', "🌐 Deploy Nginx Test (verificar LB)", 'lib.k3s_manager:K3sManager.deploy_nginx_test',
+           confirm="¿Desplegar nginx de prueba con LoadBalancer?", help='nginx de prueba con LoadBalancer'),
+    Action('rollback-lab', '18', "⏪ Rollback a Snapshot 'Pre-K3s' (Reset Lab)", 'rollback_snapshot:rollback_vms',
+           {'start': True}, confirm="⚠️  ¿Volver TODAS las VMs al snapshot 'Pre-K3s'? Se pierde el estado actual",
+           help="Vuelve las VMs a 'Pre-K3s-Install' y las arranca"),
+    Action('shutdown-all', '19', "🌙 Apagar Todas las VMs (ACPI + stop forzado)", 'shutdown_vms:shutdown_vms',
+           confirm="¿Apagar TODAS las VMs de vms.yaml?", help='Apagado ACPI en paralelo con stop forzado si no termina'),
+    Action('setup-wizard', '17', "🪄  Configuración / Setup Wizard", 'lib.setup_wizard:SetupWizard.run',
+           interactive=True, help='Asistente de configuración'),
+]
+
+_BY_NAME = {a.name: a for a in ACTIONS}
+_BY_KEY = {a.key: a for a in ACTIONS}
+
+
+def get(name):
+    """Acción por nombre ('check-vms') o número de menú ('3'); None si no existe."""
+    return _BY_NAME.get(name) or _BY_KEY.get(name)
+
+
+def needs_confirmation(action):
+    return bool(action.confirm or action.confirm_word)
+
+
+def load(action):
+    """Importa el destino de la acción y devuelve el callable."""
+    module_name, _, path = action.target.partition(':')
+    attr, _, method = path.partition('.')
+    obj = getattr(importlib.import_module(module_name), attr)
+    if method:
+        # 'Clase.método': la clase se instancia al ejecutar (conecta en __init__)
+        cls = obj
+        return lambda **kwargs: getattr(cls(), method)(**kwargs)
+    return obj
+
+
+def succeeded(result):
+    """Interpreta el valor devuelto por una acción: False, resultados por VM con 'ok' o un resumen."""
+    if result is False:
+        return False
+    if isinstance(result, list) and result and all(isinstance(r, dict) and 'ok' in r for r in result):
+        return all(r['ok'] for r in result)
+    if isinstance(result, dict) and 'failed' in result:
+        return not result['failed']
+    return True
+
+
+def run(action):
+    """Ejecuta una acción. Devuelve (ok, resultado, error)."""
+    try:
+        with tracer.action(action.name), log_context(action=action.name):
+            result = load(action)(**action.kwargs)
+    except SystemExit as e:
+        return e.code in (0, None), None, None if e.code in (0, None) else f"exit {e.code}"
+    except Exception as e:
+        return False, None, f"{type(e).__name__}: {e}"
+    return succeeded(result), result, None
+
+
+def describe():
+    return [{'name': a.name, 'menu': a.key, 'label': a.label, 'help': a.help,
+             'confirm': needs_confirmation(a), 'headless': not a.interactive} for a in ACTIONS]
+
+
+def _emit(out, payload):
+    out.write(json.dumps(payload, default=str, ensure_ascii=False) + '\n')
+    out.flush()
+
+
+def run_headless(names, confirm=False, keep_going=False):
+    """Ejecuta acciones en orden sin menú; una línea JSON por acción en stdout. Devuelve el exit code.
+
+    0 = todas bien, 1 = alguna falló, 2 = acción desconocida, interactiva o sin --confirm.
+    """
+    out = sys.stdout
+    # Validar toda la cadena antes de ejecutar nada
+    for name in names:
+        action = get(name)
+        error = None
+        if name == 'list-actions':
+            continue
+        if action is None:
+            error = "acción desconocida (ver --action list-actions)"
+        elif action.interactive:
+            error = 'acción interactiva: sólo disponible desde el menú'
+        elif needs_confirmation(action) and not confirm:
+            error = 'acción destructiva: requiere --confirm'
+        if error:
+            _emit(out, {'action': name, 'ok': False, 'elapsed': 0.0, 'result': None, 'error': error})
+            return 2
+
+    code = 0
+    for name in names:
+        if name == 'list-actions':
+            for a in ACTIONS:
+                flags = ' (requiere --confirm)' if needs_confirmation(a) else ' (sólo menú)' if a.interactive else ''
+                print(f"  {a.name:<18} {a.help}{flags}", file=sys.stderr)
+            _emit(out, {'action': name, 'ok': True, 'elapsed': 0.0, 'result': describe(), 'error': None})
+            continue
+
+        action = get(name)
+        start = time.monotonic()
+        # La salida humana de la acción (prints y logs) va a stderr; stdout queda para el JSON
+        with redirect_stdout(sys.stderr):
+            ok, result, error = run(action)
+        _emit(out, {'action': action.name, 'ok': ok, 'elapsed': round(time.monotonic() - start, 3),
+                    'result': result, 'error': error})
+        if not ok:
+            code = 1
+            if not keep_going:
+                break
+    return code
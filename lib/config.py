@@ -0,0 +1,41 @@
+"""
+Carga de configuración: config.yaml + vms.yaml + variables de entorno (.env).
+"""
+import os
+import yaml
+from dotenv import load_dotenv
+
+# Caché local compartida (tickets, specs compiladas, manifiestos...)
+CACHE_DIR = os.path.expanduser(os.getenv('PROXMOX_CACHE_DIR', '~/.cache/proxmox-vm-creator'))
+
+
+class Config:
+    def __init__(self, config_file='config.yaml', vms_file='vms.yaml'):
+        load_dotenv()
+        self.config_file = config_file
+        self.vms_file = vms_file
+
+        with open(config_file) as f:
+            self.data = yaml.safe_load(f) or {}
+
+        # Las VMs pueden declararse en config.yaml (sección vms) o en vms.yaml
+        self.vms = self.data.get('vms') or self._load_vms(vms_file)
+
+    def _load_vms(self, file):
+        if not os.path.exists(file):
+            return []
+        with open(file) as f:
+            return (yaml.safe_load(f) or {}).get('vms', [])
+
+    @property
+    def proxmox(self):
+        """Credenciales Proxmox (prioridad: .env > config.yaml)."""
+        px = self.data.get('proxmox') or {}
+        return {
+            'host': os.getenv('PROXMOX_HOST', px.get('host')),
+            'user': os.getenv('PROXMOX_USER', px.get('user')),
+            'password': os.getenv('PROXMOX_PASSWORD', px.get('password')),
+            'token_name': os.getenv('PROXMOX_TOKEN_NAME', px.get('token_name')),
+            'token_value': os.getenv('PROXMOX_TOKEN_VALUE', px.get('token_value')),
+            'verify_ssl': os.getenv('PROXMOX_VERIFY_SSL', str(px.get('verify_ssl', False))).lower() == 'true',
+        }
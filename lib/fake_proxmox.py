@@ -0,0 +1,963 @@
+"""
+Servidor local que imita la API de Proxmox VE para medir el toolkit sin cluster.
+
+Implementa los endpoints que usan los scripts (`cluster/resources`,
+`nodes/{n}/qemu` create/config/pending/status/delete/snapshot/resize/clone,
+`nodes/{n}/tasks`, storage status/content/download-url) sobre un estado en
+memoria, con:
+
+- latencia configurable por petición (pveproxy) y, opcionalmente, un número
+  limitado de peticiones atendidas a la vez (`api_workers`)
+- tareas asíncronas con UPID y duración por tipo (`task_seconds`, `time_scale`)
+- contención de locks como en Proxmox: una tarea por VM a la vez y, mientras
+  se importa/clona un disco, una por nodo+storage; la tarea que espera más de
+  `lock_timeout` falla con "can't lock file ... got timeout"
+- config pendiente: en una VM encendida los cambios que Proxmox no aplica en
+  caliente quedan en `pending` hasta el siguiente start/reboot
+- contadores por endpoint, peticiones simultáneas, esperas y fallos de lock
+
+Usado por benchmark.py; también se puede lanzar a mano y apuntar los scripts a él:
+
+    python -m lib.fake_proxmox --port 8006 --nodes 3 --latency 0.01
+    PROXMOX_HOST=127.0.0.1:8006 PROXMOX_USER=root@pam PROXMOX_TOKEN_NAME=x PROXMOX_TOKEN_VALUE=y ...
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import ssl
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from lib.config import CACHE_DIR
+from lib.tracing import endpoint
+
+GB = 1024 ** 3
+MB = 1024 ** 2
+
+# Duración (segundos reales antes de time_scale) de cada tipo de tarea
+DEFAULT_TASK_SECONDS = {
+    'qmcreate': 1.0,
+    'import': 8.0,          # extra por disco importado (import-from)
+    'qmclone': 2.0,
+    'qmtemplate': 1.0,
+    'qmconfig': 0.2,
+    'qmstart': 1.0,
+    'qmstop': 0.5,
+    'qmshutdown': 3.0,
+    'qmreboot': 4.0,
+    'qmreset': 0.5,
+    'qmsuspend': 0.5,
+    'qmresume': 0.5,
+    'qmsnapshot': 2.0,
+    'qmdelsnapshot': 1.0,
+    'qmrollback': 2.0,
+    'qmdestroy': 1.0,
+    'download': 10.0,
+}
+
+# Acción de status/* -> (tipo de tarea, estado final)
+STATUS_ACTIONS = {
+    'start': ('qmstart', 'running'),
+    'stop': ('qmstop', 'stopped'),
+    'shutdown': ('qmshutdown', 'stopped'),
+    'reboot': ('qmreboot', 'running'),
+    'reset': ('qmreset', 'running'),
+    'suspend': ('qmsuspend', 'paused'),
+    'resume': ('qmresume', 'running'),
+}
+
+# Opciones que Proxmox aplica en caliente aunque la VM corra ($fast_plug_option);
+# el resto de cambios en una VM encendida quedan pendientes hasta start/reboot
+FAST_PLUG = {'lock', 'name', 'onboot', 'shares', 'startup', 'description', 'protection', 'vmstatestorage',
+             'hookscript', 'tags'}
+
+DEFAULT_STORAGES = {
+    'local': {'type': 'dir', 'shared': False, 'content': 'iso,vztmpl,import,snippets', 'total': 100 * GB},
+    'local-lvm': {'type': 'lvmthin', 'shared': False, 'content': 'images,rootdir', 'total': 2000 * GB},
+    'NFS': {'type': 'nfs', 'shared': True, 'content': 'images,iso,import', 'total': 8000 * GB},
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _size_bytes(text):
+    """'20G' / '2252M' / '+10G' -> bytes (sin el signo)."""
+    match = re.match(r'^\+?(\d+(?:\.\d+)?)([KMGT]?)$', str(text).strip())
+    if not match:
+        raise ApiError(400, f"invalid size '{text}'")
+    factor = {'': 1, 'K': 1024, 'M': MB, 'G': GB, 'T': 1024 * GB}[match.group(2)]
+    return int(float(match.group(1)) * factor)
+
+
+def _size_text(size):
+    return f"{size // GB}G" if size % GB == 0 else f"{size // MB}M"
+
+
+def _coerce(params):
+    """Los formularios llegan como texto; Proxmox devuelve los enteros como enteros."""
+    return {k: int(v) if isinstance(v, str) and v.isdigit() else v for k, v in params.items()}
+
+
+def _drive_options(value):
+    parts = str(value).split(',')
+    return parts[0], dict(p.split('=', 1) for p in parts[1:] if '=' in p)
+
+
+def _drive_text(volume, options):
+    return ','.join([volume] + [f"{k}={v}" for k, v in options.items()])
+
+
+class _Task:
+    __slots__ = ('upid', 'node', 'type', 'vmid', 'queued', 'start', 'end', 'duration',
+                 'locks', 'on_done', 'on_fail', 'exitstatus', 'waited')
+
+    def __init__(self, upid, node, type, vmid, duration, locks, on_done, on_fail, now):
+        self.upid = upid
+        self.node = node
+        self.type = type
+        self.vmid = vmid
+        self.duration = duration
+        self.locks = locks
+        self.on_done = on_done
+        self.on_fail = on_fail
+        self.queued = now
+        self.start = None
+        self.end = None
+        self.exitstatus = None
+        self.waited = False
+
+
+class FakeProxmox:
+    def __init__(self, nodes=3, storages=None, latency=0.0, jitter=0.0, task_seconds=None,
+                 time_scale=1.0, lock_timeout=10.0, api_workers=0, node_memory_gb=256, node_cpus=64,
+                 host='127.0.0.1', port=0, seed=None):
+        self.nodes = [f"pve{i + 1}" for i in range(nodes)] if isinstance(nodes, int) else list(nodes)
+        self.storages = {name: dict(spec) for name, spec in (storages or DEFAULT_STORAGES).items()}
+        self.latency = latency
+        self.jitter = jitter
+        self.task_seconds = dict(DEFAULT_TASK_SECONDS, **(task_seconds or {}))
+        self.time_scale = time_scale
+        self.lock_timeout = lock_timeout
+        self.node_memory = node_memory_gb * GB
+        self.node_cpus = node_cpus
+        self.host = host
+        self.port = port
+        self._random = random.Random(seed)
+        self._workers = threading.BoundedSemaphore(api_workers) if api_workers else None
+        self._lock = threading.RLock()
+        self._server = None
+        self._thread = None
+        self.reset()
+
+    # ------------------------------------------------------------------
+    # Estado
+    # ------------------------------------------------------------------
+    def reset(self):
+        """Borra VMs, tareas, volúmenes y estadísticas."""
+        with self._lock:
+            self.vms = {}
+            self.tasks = {}
+            self._running = []
+            self._queue = []
+            self._held = set()
+            self._pid = 0
+            # (nodo o None si el storage es compartido, storage) -> {volid: {...}}
+            self.volumes = {}
+            self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {
+                'calls': 0, 'writes': 0, 'errors': 0, 'inflight': 0, 'max_inflight': 0,
+                'tasks': 0, 'lock_waits': 0, 'lock_failures': 0, 'locked_rejects': 0,
+                'endpoints': {}, 'task_types': {},
+            }
+
+    def snapshot_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['endpoints'] = dict(self.stats['endpoints'])
+            stats['task_types'] = dict(self.stats['task_types'])
+            return stats
+
+    def add_vm(self, vmid, node, name=None, status='stopped', memory=2048, cores=2, disk='20G',
+               storage='local-lvm', tags=None, template=False):
+        """Crea una VM directamente en el estado (sin tarea), p.ej. para sembrar un benchmark."""
+        with self._lock:
+            config = {
+                'name': name or f"vm-{vmid}", 'memory': memory, 'cores': cores, 'sockets': 1,
+                'scsihw': 'virtio-scsi-pci', 'net0': f"virtio={self._mac(vmid)},bridge=vmbr0",
+            }
+            if tags:
+                config['tags'] = tags
+            config['scsi0'] = self._alloc(node, storage, vmid, 0, _size_bytes(disk), {'discard': 'on'})
+            if template:
+                config['template'] = 1
+            self.vms[int(vmid)] = {'node': node, 'status': status, 'config': config,
+                                   'snapshots': {}, 'lock': None}
+
+    def _mac(self, vmid):
+        digest = hashlib.sha1(str(vmid).encode()).hexdigest().upper()
+        return 'BC:24:11:' + ':'.join(digest[i:i + 2] for i in range(0, 6, 2))
+
+    def _pool_key(self, node, storage):
+        spec = self.storages.get(storage)
+        if spec is None:
+            raise ApiError(500, f"storage '{storage}' does not exist")
+        return (None if spec['shared'] else node, storage)
+
+    def _alloc(self, node, storage, vmid, index, size, options, name=None):
+        volid = f"{storage}:{name or f'vm-{vmid}-disk-{index}'}"
+        self.volumes.setdefault(self._pool_key(node, storage), {})[volid] = {
+            'volid': volid, 'size': size, 'format': 'raw', 'content': 'images', 'vmid': int(vmid)}
+        return _drive_text(volid, dict(options, size=_size_text(size)))
+
+    def _free_vm_volumes(self, node, vmid):
+        for (pool_node, _), volumes in self.volumes.items():
+            if pool_node in (None, node):
+                for volid in [v for v, info in volumes.items() if info.get('vmid') == vmid]:
+                    del volumes[volid]
+
+    def _vm(self, node, vmid):
+        vm = self.vms.get(int(vmid))
+        if vm is None or vm['node'] != node:
+            raise ApiError(500, f"Configuration file 'nodes/{node}/qemu-server/{vmid}.conf' does not exist")
+        return vm
+
+    def _check_unlocked(self, vmid, vm):
+        if vm['lock']:
+            self.stats['locked_rejects'] += 1
+            raise ApiError(500, f"VM {vmid} is locked ({vm['lock']})")
+
+    @staticmethod
+    def _digest(config, pending=None):
+        return hashlib.sha1(json.dumps([config, pending or {}], sort_keys=True, default=str).encode()).hexdigest()
+
+    @staticmethod
+    def _pending(vm):
+        """{opción: valor pendiente | None si está pendiente de borrar}"""
+        return vm.setdefault('pending', {})
+
+    def _apply_pending(self, vm):
+        for key, value in self._pending(vm).items():
+            if value is None:
+                vm['config'].pop(key, None)
+            else:
+                vm['config'][key] = value
+        vm['pending'] = {}
+
+    def _current_config(self, vm, current=False):
+        """GET config: por defecto con los valores pendientes aplicados (como Proxmox)."""
+        config = dict(vm['config'])
+        if not current:
+            for key, value in self._pending(vm).items():
+                if value is None:
+                    config.pop(key, None)
+                else:
+                    config[key] = value
+        return dict(config, digest=self._digest(vm['config'], self._pending(vm)))
+
+    def _pending_list(self, vm):
+        pending = self._pending(vm)
+        entries = []
+        for key in sorted(set(vm['config']) | set(pending)):
+            entry = {'key': key}
+            if key in vm['config']:
+                entry['value'] = vm['config'][key]
+            if key in pending:
+                if pending[key] is None:
+                    entry['delete'] = 1
+                else:
+                    entry['pending'] = pending[key]
+            entries.append(entry)
+        return entries
+
+    # ------------------------------------------------------------------
+    # Tareas y locks (simulación por eventos, avanzada en cada petición)
+    # ------------------------------------------------------------------
+    def _advance(self, now=None):
+        now = time.monotonic() if now is None else now
+        while True:
+            running_end = min((t.end for t in self._running), default=None)
+            queue_expiry = min((t.queued + self.lock_timeout for t in self._queue), default=None)
+            events = [e for e in (running_end, queue_expiry) if e is not None and e <= now]
+            if not events:
+                return
+            at = min(events)
+            if running_end == at:
+                task = next(t for t in self._running if t.end == at)
+                self._running.remove(task)
+                self._held.difference_update(task.locks)
+                try:
+                    if task.on_done:
+                        task.on_done()
+                    task.exitstatus = 'OK'
+                except ApiError as e:
+                    task.exitstatus = e.message
+                    if task.on_fail:
+                        task.on_fail()
+                self._start_queued(at)
+            else:
+                task = next(t for t in self._queue if t.queued + self.lock_timeout == at)
+                self._queue.remove(task)
+                self.stats['lock_failures'] += 1
+                busy = task.locks & self._held
+                vm_lock = next((lock for lock in busy if lock[0] == 'vm'), None)
+                target = (f"/var/lock/qemu-server/lock-{vm_lock[1]}.conf" if vm_lock
+                          else f"/var/lock/pve-manager/pve-storage-{next(iter(busy))[2]}")
+                task.start = task.end = at
+                task.exitstatus = f"can't lock file '{target}' - got timeout"
+                if task.on_fail:
+                    task.on_fail()
+
+    def _start_queued(self, at):
+        for task in list(self._queue):
+            if not task.locks & self._held:
+                self._queue.remove(task)
+                self._begin(task, at)
+
+    def _begin(self, task, at):
+        self._held.update(task.locks)
+        task.start = at
+        task.end = at + task.duration
+        self._running.append(task)
+
+    def _task(self, node, type, vmid=None, on_done=None, locks=(), extra_seconds=0.0, on_fail=None,
+              user='root@pam'):
+        now = time.monotonic()
+        self._advance(now)
+        self._pid += 1
+        starttime = int(time.time())
+        upid = f"UPID:{node}:{self._pid:08X}:{self._pid:08X}:{starttime:08X}:{type}:{vmid or ''}:{user}:"
+        duration = (self.task_seconds.get(type, 0.5) + extra_seconds) * self.time_scale
+        task = _Task(upid, node, type, vmid, duration, set(locks), on_done, on_fail, now)
+        self.tasks[upid] = task
+        self.stats['tasks'] += 1
+        self.stats['task_types'][type] = self.stats['task_types'].get(type, 0) + 1
+        if task.locks & self._held:
+            task.waited = True
+            self.stats['lock_waits'] += 1
+            self._queue.append(task)
+        else:
+            self._begin(task, now)
+        return upid
+
+    def _vm_locks(self, vmid, node=None, storage=None):
+        locks = {('vm', int(vmid))}
+        if storage:
+            locks.add(('storage',) + self._pool_key(node, storage))
+        return locks
+
+    def _task_entry(self, task):
+        entry = {
+            'upid': task.upid, 'node': task.node, 'type': task.type, 'id': str(task.vmid or ''),
+            'user': 'root@pam', 'starttime': int(task.upid.split(':')[4], 16),
+        }
+        if task.exitstatus is not None:
+            entry['endtime'] = entry['starttime'] + int(task.end - task.queued)
+            entry['status'] = task.exitstatus
+        return entry
+
+    # ------------------------------------------------------------------
+    # Endpoints
+    # ------------------------------------------------------------------
+    def handle(self, method, path, params):
+        """Resuelve una petición (ruta sin /api2/json). Devuelve el valor de 'data'."""
+        with self._lock:
+            self._advance()
+            parts = [unquote(p) for p in path.strip('/').split('/')]
+            route = getattr(self, f"_route_{parts[0]}", None) if parts and parts[0] else None
+            if route is None:
+                raise ApiError(501, f"Method '{method} {path}' not implemented")
+            return route(method, parts[1:], params)
+
+    def _route_version(self, method, parts, params):
+        return {'version': '8.2.4', 'release': '8.2', 'repoid': 'fake'}
+
+    def _route_access(self, method, parts, params):
+        if parts == ['ticket'] and method == 'POST':
+            return {'username': params.get('username'), 'ticket': f"PVE:{params.get('username')}:FAKE",
+                    'CSRFPreventionToken': 'FAKE'}
+        raise ApiError(501, 'not implemented')
+
+    def _route_cluster(self, method, parts, params):
+        if parts == ['resources']:
+            return self._resources(params.get('type'))
+        if parts == ['nextid']:
+            return str(max(self.vms, default=99) + 1)
+        raise ApiError(501, 'not implemented')
+
+    def _resources(self, type_filter=None):
+        out = []
+        if type_filter in (None, 'node'):
+            for node in self.nodes:
+                vms = [v for v in self.vms.values() if v['node'] == node and v['status'] == 'running']
+                out.append({'id': f"node/{node}", 'type': 'node', 'node': node, 'status': 'online',
+                            'maxmem': self.node_memory, 'maxcpu': self.node_cpus,
+                            'mem': sum(int(v['config'].get('memory', 0)) * MB for v in vms),
+                            'cpu': min(1.0, len(vms) / max(1, self.node_cpus))})
+        if type_filter in (None, 'vm'):
+            for vmid, vm in sorted(self.vms.items()):
+                config = vm['config']
+                _, disk = _drive_options(config.get('scsi0', ''))
+                entry = {'id': f"qemu/{vmid}", 'type': 'qemu', 'vmid': vmid, 'node': vm['node'],
+                         'name': config.get('name'), 'status': vm['status'],
+                         'maxmem': int(config.get('memory', 0)) * MB, 'maxcpu': int(config.get('cores', 1)),
+                         'maxdisk': _size_bytes(disk.get('size', '0')), 'template': int(config.get('template', 0))}
+                if config.get('tags'):
+                    entry['tags'] = config['tags']
+                if vm['lock']:
+                    entry['lock'] = vm['lock']
+                out.append(entry)
+        if type_filter in (None, 'storage'):
+            for node in self.nodes:
+                for storage, spec in self.storages.items():
+                    out.append({'id': f"storage/{node}/{storage}", 'type': 'storage', 'node': node,
+                                'storage': storage, 'status': 'available', 'shared': int(spec['shared']),
+                                'plugintype': spec['type'], 'content': spec['content'],
+                                'maxdisk': spec['total'], 'disk': self._used(node, storage)})
+        return out
+
+    def _used(self, node, storage):
+        volumes = self.volumes.get(self._pool_key(node, storage), {})
+        return sum(v['size'] for v in volumes.values())
+
+    def _route_nodes(self, method, parts, params):
+        if not parts:
+            return [{'node': n, 'status': 'online', 'maxmem': self.node_memory, 'maxcpu': self.node_cpus}
+                    for n in self.nodes]
+        node, rest = parts[0], parts[1:]
+        if node not in self.nodes:
+            raise ApiError(595, f"no such cluster node '{node}'")
+        if not rest or rest == ['status']:
+            return {'memory': {'total': self.node_memory}, 'cpuinfo': {'cpus': self.node_cpus}}
+        handler = getattr(self, f"_node_{rest[0].replace('-', '_')}", None)
+        if handler is None:
+            raise ApiError(501, 'not implemented')
+        return handler(method, node, rest[1:], params)
+
+    # --- nodes/{node}/tasks -------------------------------------------
+    def _node_tasks(self, method, node, parts, params):
+        if not parts:
+            since = int(params.get('since', 0))
+            limit = int(params.get('limit', 50))
+            entries = [self._task_entry(t) for t in self.tasks.values() if t.node == node]
+            entries = [e for e in entries if e['starttime'] >= since]
+            entries.sort(key=lambda e: e['starttime'], reverse=True)
+            return entries[:limit]
+        task = self.tasks.get(parts[0])
+        if task is None or task.node != node:
+            raise ApiError(500, f"no such task '{parts[0]}'")
+        if parts[1:] == ['status']:
+            if task.exitstatus is None:
+                return {'upid': task.upid, 'status': 'running', 'type': task.type}
+            return {'upid': task.upid, 'status': 'stopped', 'exitstatus': task.exitstatus, 'type': task.type}
+        if parts[1:] == ['log']:
+            return [{'n': 1, 't': task.exitstatus or 'running'}]
+        raise ApiError(501, 'not implemented')
+
+    # --- nodes/{node}/storage -----------------------------------------
+    def _node_storage(self, method, node, parts, params):
+        if not parts:
+            return [{'storage': s, 'type': spec['type'], 'content': spec['content'], 'shared': int(spec['shared']),
+                     'total': spec['total'], 'used': self._used(node, s),
+                     'avail': spec['total'] - self._used(node, s), 'active': 1, 'enabled': 1}
+                    for s, spec in self.storages.items()]
+        storage, rest = parts[0], parts[1:]
+        spec = self.storages.get(storage)
+        if spec is None:
+            raise ApiError(500, f"storage '{storage}' does not exist")
+        pool = self.volumes.setdefault(self._pool_key(node, storage), {})
+        if rest == ['status']:
+            used = self._used(node, storage)
+            return {'type': spec['type'], 'total': spec['total'], 'used': used, 'avail': spec['total'] - used,
+                    'active': 1, 'enabled': 1, 'shared': int(spec['shared']), 'content': spec['content']}
+        if rest and rest[0] == 'content':
+            if method == 'GET' and len(rest) == 1:
+                content = params.get('content')
+                return [dict(v) for v in pool.values() if not content or v['content'] == content]
+            if method == 'DELETE' and len(rest) == 2:
+                volid = rest[1] if ':' in rest[1] else f"{storage}:{rest[1]}"
+                if pool.pop(volid, None) is None:
+                    raise ApiError(500, f"volume '{volid}' does not exist")
+                return None
+        if rest == ['download-url'] and method == 'POST':
+            self.stats['writes'] += 1
+            content, filename = params.get('content', 'iso'), params['filename']
+            volid = f"{storage}:{content}/{filename}"
+
+            def done():
+                pool[volid] = {'volid': volid, 'size': 600 * MB, 'format': 'raw', 'content': content}
+            return self._task(node, 'download', filename, done, locks={('download', node, storage, filename)})
+        raise ApiError(501, 'not implemented')
+
+    # --- nodes/{node}/qemu --------------------------------------------
+    def _node_qemu(self, method, node, parts, params):
+        if not parts:
+            if method == 'GET':
+                return [{'vmid': vmid, 'name': vm['config'].get('name'), 'status': vm['status'],
+                         'template': int(vm['config'].get('template', 0))}
+                        for vmid, vm in sorted(self.vms.items()) if vm['node'] == node]
+            if method == 'POST':
+                return self._create(node, params)
+            raise ApiError(501, 'not implemented')
+
+        vmid, rest = int(parts[0]), parts[1:]
+        if method == 'DELETE' and not rest:
+            return self._destroy(node, vmid, params)
+        vm = self._vm(node, vmid)
+        if not rest:
+            return [{'subdir': s} for s in ('config', 'pending', 'status', 'snapshot', 'resize', 'clone', 'agent')]
+        what = rest[0]
+        if what == 'config':
+            if method == 'GET':
+                return self._current_config(vm, current=str(params.get('current', 0)) in ('1', 'True', 'true'))
+            return self._update_config(node, vmid, vm, params, asynchronous=method == 'POST')
+        if what == 'pending' and method == 'GET':
+            return self._pending_list(vm)
+        if what == 'status':
+            if rest[1:] == ['current'] and method == 'GET':
+                config = vm['config']
+                return {'vmid': vmid, 'name': config.get('name'), 'status': vm['status'],
+                        'qmpstatus': vm['status'], 'lock': vm['lock'],
+                        'maxmem': int(config.get('memory', 0)) * MB, 'cpus': int(config.get('cores', 1)),
+                        'agent': 1 if config.get('agent') else 0}
+            if method == 'POST' and len(rest) == 2 and rest[1] in STATUS_ACTIONS:
+                return self._power(node, vmid, vm, rest[1])
+        if what == 'resize' and method == 'PUT':
+            return self._resize(vmid, vm, params)
+        if what == 'snapshot':
+            return self._snapshot(method, node, vmid, vm, rest[1:], params)
+        if what == 'clone' and method == 'POST':
+            return self._clone(node, vmid, vm, params)
+        if what == 'template' and method == 'POST':
+            return self._template(node, vmid, vm)
+        if what == 'agent':
+            if vm['status'] != 'running':
+                raise ApiError(500, f"VM {vmid} is not running")
+            return {'result': {}}
+        raise ApiError(501, 'not implemented')
+
+    def _create(self, node, params):
+        vmid = int(params['vmid'])
+        if vmid in self.vms:
+            raise ApiError(500, f"unable to create VM {vmid} - VM {vmid} already exists on node '{self.vms[vmid]['node']}'")
+        self.stats['writes'] += 1
+        config = {k: v for k, v in _coerce(params).items() if k not in ('vmid', 'start', 'cipassword')}
+        if 'cipassword' in params:
+            config['cipassword'] = '**********'
+        if str(config.get('net0', '')).partition(',')[0].find('=') < 0 and config.get('net0'):
+            model, _, rest = config['net0'].partition(',')
+            config['net0'] = f"{model}={self._mac(vmid)}" + (f",{rest}" if rest else '')
+
+        # El disco se reserva al terminar la tarea; mientras tanto la VM existe con lock 'create'
+        disk = config.pop('scsi0', None)
+        storage, imported, size = None, False, 0
+        if disk:
+            volume, options = _drive_options(disk)
+            storage, _, amount = volume.partition(':')
+            self._pool_key(node, storage)
+            imported = 'import-from' in options
+            options.pop('import-from', None)
+            size = _size_bytes(options.pop('size', '2252M' if imported else f"{amount or 0}G"))
+
+        vm = {'node': node, 'status': 'stopped', 'config': config, 'snapshots': {}, 'lock': 'create'}
+        self.vms[vmid] = vm
+
+        def done():
+            if disk:
+                config['scsi0'] = self._alloc(node, storage, vmid, 0, size, options)
+            if str(config.get('ide2', '')).endswith(':cloudinit'):
+                config['ide2'] = f"{config['ide2'].split(':')[0]}:vm-{vmid}-cloudinit,media=cdrom"
+            vm['lock'] = None
+            if str(params.get('start', 0)) in ('1', 'True', 'true'):
+                vm['status'] = 'running'
+        return self._task(node, 'qmcreate', vmid, done, self._vm_locks(vmid, node, storage if disk else None),
+                          extra_seconds=self.task_seconds['import'] if imported else 0.0,
+                          on_fail=lambda: self.vms.pop(vmid, None))
+
+    def _destroy(self, node, vmid, params):
+        vm = self._vm(node, vmid)
+        self._check_unlocked(vmid, vm)
+        if vm['status'] != 'stopped':
+            raise ApiError(500, f"VM {vmid} is running - destroy failed")
+        self.stats['writes'] += 1
+
+        def done():
+            current = self.vms.get(vmid)
+            if current is None:
+                raise ApiError(500, f"Configuration file 'nodes/{node}/qemu-server/{vmid}.conf' does not exist")
+            if current['status'] != 'stopped':
+                raise ApiError(500, f"VM {vmid} is running - destroy failed")
+            self._free_vm_volumes(node, vmid)
+            del self.vms[vmid]
+        return self._task(node, 'qmdestroy', vmid, done, self._vm_locks(vmid))
+
+    def _update_config(self, node, vmid, vm, params, asynchronous):
+        self._check_unlocked(vmid, vm)
+        digest = params.pop('digest', None)
+        if digest and digest != self._digest(vm['config'], self._pending(vm)):
+            raise ApiError(500, "detected modified configuration - file changed by other user? Try again.")
+        self.stats['writes'] += 1
+        deletes = list(filter(None, str(params.pop('delete', '')).split(',')))
+        params.pop('skiplock', None)
+        if 'cipassword' in params:
+            params['cipassword'] = '**********'
+        updates = _coerce(params)
+        if vm['status'] == 'running':
+            # Los cambios que no se pueden aplicar en caliente quedan pendientes
+            pending = self._pending(vm)
+            for key in deletes:
+                if key in FAST_PLUG:
+                    vm['config'].pop(key, None)
+                    pending.pop(key, None)
+                elif key in vm['config']:
+                    pending[key] = None
+                else:
+                    pending.pop(key, None)
+            for key, value in updates.items():
+                if key in FAST_PLUG or vm['config'].get(key) == value:
+                    vm['config'][key] = value
+                    pending.pop(key, None)
+                else:
+                    pending[key] = value
+        else:
+            self._apply_pending(vm)
+            for key in deletes:
+                vm['config'].pop(key, None)
+            vm['config'].update(updates)
+        if asynchronous:
+            return self._task(node, 'qmconfig', vmid, None, self._vm_locks(vmid))
+        return None
+
+    def _power(self, node, vmid, vm, action):
+        task_type, final = STATUS_ACTIONS[action]
+        if action != 'stop':
+            self._check_unlocked(vmid, vm)
+        if action == 'start' and vm['config'].get('template'):
+            raise ApiError(500, "you can't start a vm if it's a template")
+        self.stats['writes'] += 1
+
+        def done():
+            if action in ('shutdown', 'reboot', 'suspend') and vm['status'] != 'running':
+                raise ApiError(500, f"VM {vmid} not running")
+            if action == 'reboot' or (action == 'start' and vm['status'] == 'stopped'):
+                # Un arranque nuevo de QEMU aplica la config pendiente
+                self._apply_pending(vm)
+            vm['status'] = final
+        return self._task(node, task_type, vmid, done, self._vm_locks(vmid))
+
+    def _resize(self, vmid, vm, params):
+        self._check_unlocked(vmid, vm)
+        disk = params['disk']
+        if disk not in vm['config']:
+            raise ApiError(500, f"disk '{disk}' does not exist")
+        volume, options = _drive_options(vm['config'][disk])
+        current = _size_bytes(options.get('size', '0'))
+        size = params['size']
+        new = current + _size_bytes(size) if str(size).startswith('+') else _size_bytes(size)
+        if new < current:
+            raise ApiError(500, "shrinking disks is not supported")
+        self.stats['writes'] += 1
+        options['size'] = _size_text(new)
+        vm['config'][disk] = _drive_text(volume, options)
+        if self._pending(vm).get(disk):
+            # El resize es en caliente: también actualiza la versión pendiente del drive
+            pending_volume, pending_options = _drive_options(self._pending(vm)[disk])
+            pending_options['size'] = options['size']
+            self._pending(vm)[disk] = _drive_text(pending_volume, pending_options)
+        for volumes in self.volumes.values():
+            if volume in volumes:
+                volumes[volume]['size'] = new
+        return None
+
+    def _snapshot(self, method, node, vmid, vm, parts, params):
+        if not parts:
+            if method == 'GET':
+                snaps = [{'name': name, 'description': s['description'], 'snaptime': s['snaptime'],
+                          'vmstate': s['vmstate'], 'parent': s.get('parent')} for name, s in vm['snapshots'].items()]
+                return snaps + [{'name': 'current', 'description': 'You are here!',
+                                 'parent': next(reversed(vm['snapshots']), None)}]
+            if method == 'POST':
+                self._check_unlocked(vmid, vm)
+                name = params['snapname']
+                if name in vm['snapshots']:
+                    raise ApiError(500, f"snapshot name '{name}' already used")
+                vmstate = str(params.get('vmstate', 0)) in ('1', 'True', 'true')
+                if vmstate and vm['status'] != 'running':
+                    vmstate = False
+                self.stats['writes'] += 1
+                vm['lock'] = 'snapshot'
+
+                def done():
+                    vm['snapshots'][name] = {
+                        'description': params.get('description', ''), 'snaptime': int(time.time()),
+                        'vmstate': int(vmstate), 'parent': next(reversed(vm['snapshots']), None),
+                        'config': dict(vm['config']), 'status': vm['status'],
+                    }
+                    vm['lock'] = None
+                return self._task(node, 'qmsnapshot', vmid, done, self._vm_locks(vmid),
+                                  extra_seconds=self.task_seconds['qmsnapshot'] * 2 if vmstate else 0.0,
+                                  on_fail=lambda: vm.update(lock=None))
+            raise ApiError(501, 'not implemented')
+
+        name, rest = parts[0], parts[1:]
+        snap = vm['snapshots'].get(name)
+        if snap is None:
+            raise ApiError(500, f"snapshot '{name}' does not exist")
+        if method == 'GET' and rest == ['config']:
+            return dict(snap['config'])
+        if method == 'DELETE' and not rest:
+            self._check_unlocked(vmid, vm)
+            self.stats['writes'] += 1
+            vm['lock'] = 'snapshot-delete'
+
+            def done():
+                vm['snapshots'].pop(name, None)
+                vm['lock'] = None
+            return self._task(node, 'qmdelsnapshot', vmid, done, self._vm_locks(vmid),
+                              on_fail=lambda: vm.update(lock=None))
+        if method == 'POST' and rest == ['rollback']:
+            self._check_unlocked(vmid, vm)
+            self.stats['writes'] += 1
+            vm['lock'] = 'rollback'
+
+            def done():
+                vm['config'] = dict(snap['config'])
+                if str(params.get('start', 0)) in ('1', 'True', 'true'):
+                    vm['status'] = 'running'
+                else:
+                    vm['status'] = snap['status'] if snap['vmstate'] else 'stopped'
+                vm['lock'] = None
+            return self._task(node, 'qmrollback', vmid, done, self._vm_locks(vmid),
+                              on_fail=lambda: vm.update(lock=None))
+        raise ApiError(501, 'not implemented')
+
+    def _clone(self, node, vmid, vm, params):
+        newid = int(params['newid'])
+        if newid in self.vms:
+            raise ApiError(500, f"unable to create VM {newid} - VM {newid} already exists")
+        target = params.get('target', node)
+        if target not in self.nodes:
+            raise ApiError(500, f"no such node '{target}'")
+        full = str(params.get('full', 0 if vm['config'].get('template') else 1)) in ('1', 'True', 'true')
+        if not full and not vm['config'].get('template'):
+            raise ApiError(500, "Linked clone feature is not supported for a non-template VM")
+        _, src_options = _drive_options(vm['config'].get('scsi0', ''))
+        src_storage = vm['config'].get('scsi0', 'local-lvm:').split(':')[0]
+        storage = params.get('storage', src_storage)
+        self.stats['writes'] += 1
+
+        config = {k: v for k, v in vm['config'].items() if k not in ('template', 'scsi0', 'ide2')}
+        config['name'] = params.get('name', f"Copy-of-VM-{config.get('name')}")
+        if config.get('net0'):
+            model, _, rest = config['net0'].partition(',')
+            config['net0'] = f"{model.split('=')[0]}={self._mac(newid)}" + (f",{rest}" if rest else '')
+        clone = {'node': target, 'status': 'stopped', 'config': config, 'snapshots': {}, 'lock': 'clone'}
+        self.vms[newid] = clone
+        locks = self._vm_locks(newid, target, storage if full else None)
+        if not vm['config'].get('template'):
+            locks |= self._vm_locks(vmid)
+
+        def done():
+            size = _size_bytes(src_options.get('size', '2252M'))
+            options = {k: v for k, v in src_options.items() if k != 'size'}
+            config['scsi0'] = self._alloc(target, storage, newid, 0, size, options)
+            if vm['config'].get('ide2'):
+                config['ide2'] = f"{storage}:vm-{newid}-cloudinit,media=cdrom"
+            clone['lock'] = None
+        return self._task(node, 'qmclone', vmid, done, locks,
+                          extra_seconds=self.task_seconds['import'] / 2 if full else 0.0,
+                          on_fail=lambda: self.vms.pop(newid, None))
+
+    def _template(self, node, vmid, vm):
+        self._check_unlocked(vmid, vm)
+        if vm['status'] != 'stopped':
+            raise ApiError(500, "you can't convert a running VM to a template")
+        self.stats['writes'] += 1
+        vm['lock'] = 'template'
+
+        def done():
+            vm['config']['template'] = 1
+            vm['lock'] = None
+        return self._task(node, 'qmtemplate', vmid, done, self._vm_locks(vmid),
+                          on_fail=lambda: vm.update(lock=None))
+
+    # ------------------------------------------------------------------
+    # Servidor HTTPS
+    # ------------------------------------------------------------------
+    @property
+    def address(self):
+        """'127.0.0.1:PUERTO' (válido como PROXMOX_HOST)."""
+        return f"{self.host}:{self.port}"
+
+    def start(self, certfile=None, keyfile=None):
+        if self._server is not None:
+            return self
+        certfile, keyfile = (certfile, keyfile) if certfile else _self_signed_cert()
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+
+        fake = self
+
+        class Handler(_Handler):
+            server_fake = fake
+
+        server = ThreadingHTTPServer((self.host, self.port), Handler)
+        server.daemon_threads = True
+        # El handshake TLS se hace en el hilo de cada conexión, no en el de accept
+        server.socket = context.wrap_socket(server.socket, server_side=True, do_handshake_on_connect=False)
+        self._server = server
+        self.port = server.server_address[1]
+        self._thread = threading.Thread(target=server.serve_forever, name='fake-proxmox', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _enter_request(self, method, path):
+        with self._lock:
+            stats = self.stats
+            stats['calls'] += 1
+            stats['inflight'] += 1
+            stats['max_inflight'] = max(stats['max_inflight'], stats['inflight'])
+            name = endpoint(method, path)
+            stats['endpoints'][name] = stats['endpoints'].get(name, 0) + 1
+
+    def _leave_request(self, failed):
+        with self._lock:
+            self.stats['inflight'] -= 1
+            if failed:
+                self.stats['errors'] += 1
+
+    def _delay(self):
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_fake = None
+
+    def log_message(self, *args):
+        pass
+
+    def _dispatch(self, method):
+        fake = self.server_fake
+        url = urlsplit(self.path)
+        path = re.sub(r'^/api2/json', '', url.path)
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length).decode()
+            if 'json' in (self.headers.get('Content-Type') or ''):
+                params.update(json.loads(body or '{}'))
+            else:
+                params.update(parse_qsl(body, keep_blank_values=True))
+
+        fake._enter_request(method, path)
+        failed = True
+        try:
+            if fake._workers:
+                with fake._workers:
+                    fake._delay()
+                    data = fake.handle(method, path, params)
+            else:
+                fake._delay()
+                data = fake.handle(method, path, params)
+            failed = False
+            self._reply(200, 'OK', {'data': data})
+        except ApiError as e:
+            self._reply(e.status, e.message, {'data': None, 'errors': {'message': e.message}})
+        except (KeyError, ValueError) as e:
+            self._reply(400, f"Parameter verification failed: {e}", {'data': None, 'errors': {'param': str(e)}})
+        finally:
+            fake._leave_request(failed)
+
+    def _reply(self, status, reason, payload):
+        body = json.dumps(payload, default=str).encode()
+        # El motivo viaja en la línea de estado, como hace pveproxy
+        self.send_response(status, reason.replace('\n', ' ')[:200])
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+
+def _self_signed_cert():
+    """Certificado autofirmado para el servidor falso (se genera una vez con openssl)."""
+    directory = os.path.join(CACHE_DIR, 'fake-proxmox')
+    certfile, keyfile = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    if not (os.path.exists(certfile) and os.path.exists(keyfile)):
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        try:
+            subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '3650',
+                            '-subj', '/CN=fake-proxmox', '-keyout', keyfile, '-out', certfile],
+                           check=True, capture_output=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise RuntimeError(f"No se pudo generar el certificado del servidor falso (¿openssl instalado?): {e}")
+    return certfile, keyfile
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='API de Proxmox simulada para pruebas y benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8006)
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.0, help='Segundos por petición')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Latencia extra aleatoria máxima')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='Multiplicador de la duración de las tareas')
+    parser.add_argument('--lock-timeout', type=float, default=10.0)
+    parser.add_argument('--api-workers', type=int, default=0, help='Peticiones atendidas a la vez (0 = sin límite)')
+    args = parser.parse_args()
+
+    fake = FakeProxmox(nodes=args.nodes, latency=args.latency, jitter=args.jitter, time_scale=args.time_scale,
+                       lock_timeout=args.lock_timeout, api_workers=args.api_workers, host=args.host,
+                       port=args.port).start()
+    print(f"🧪 Proxmox simulado en https://{fake.address}/api2/json (nodos: {', '.join(fake.nodes)})")
+    print(f"   PROXMOX_HOST={fake.address} PROXMOX_USER=root@pam PROXMOX_TOKEN_NAME=fake PROXMOX_TOKEN_VALUE=fake")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
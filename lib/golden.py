@@ -0,0 +1,220 @@
+"""
+Aprovisionamiento por clonado desde plantillas "golden".
+
+En modo clon la primera VM que necesita una combinación (imagen, storage)
+construye una VM plantilla importando la imagen cloud una única vez y la
+convierte en template. El resto de VMs se crean con `qemu(template).clone`
+(linked clone si el storage lo soporta, full clone si no) y después se les
+aplica la configuración cloud-init, red y tamaño de disco de su VMSpec.
+"""
+import re
+import threading
+
+from lib.inventory import split_tags
+from lib.logger import log
+from lib.specs import resolve_image_path
+
+TEMPLATE_TAG = 'golden-template'
+DEFAULT_VMID_BASE = 9000
+
+# Storages donde Proxmox permite linked clones (los de tipo fichero sólo con qcow2)
+LINKED_CLONE_TYPES = {'lvmthin', 'zfspool', 'rbd', 'nfs', 'dir', 'cifs', 'glusterfs', 'btrfs'}
+FILE_STORAGE_TYPES = {'nfs', 'dir', 'cifs', 'glusterfs'}
+
+# Parámetros de qemu.create que la plantilla ya aporta y no se reaplican al clon
+CREATE_ONLY_PARAMS = {'vmid', 'scsi0', 'scsihw', 'ide2', 'boot', 'serial0', 'vga', 'agent', 'ostype'}
+
+
+def template_name(image_key, storage, node=None):
+    base = f"tmpl-{image_key}-{storage}" + (f"-{node}" if node else '')
+    return re.sub(r'[^a-z0-9-]', '-', base.lower())
+
+
+def disk_size_gb(drive):
+    """'NFS:9000/base-9000-disk-0.qcow2,size=2252M' -> 2.2 (GB)"""
+    match = re.search(r'size=(\d+(?:\.\d+)?)([KMGT])', drive or '')
+    if not match:
+        return 0
+    value, unit = float(match.group(1)), match.group(2)
+    return value * {'K': 1 / 1024 ** 2, 'M': 1 / 1024, 'G': 1, 'T': 1024}[unit]
+
+
+class GoldenTemplates:
+    def __init__(self, client, config):
+        self.client = client
+        self.proxmox = client.api
+        self.config = config
+        prov = config.get('provisioning', {})
+        self.vmid_base = int(prov.get('template_vmid_base', DEFAULT_VMID_BASE))
+        self.force_full = bool(prov.get('full_clone', False))
+        self.task_timeout = config.get('execution', {}).get('task_timeout', 1800)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._templates = {}
+        self._storage_info = {}
+        # Ids de plantilla: un único asignador para todos los hilos, con los ids ya
+        # elegidos reservados hasta que su qemu.create termina
+        self._vmid_lock = threading.Lock()
+        self._reserved = set()
+        self._spec_vmids = set()
+
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+    def storage_info(self, storage):
+        if storage not in self._storage_info:
+            try:
+                self._storage_info[storage] = self.proxmox.storage(storage).get()
+            except Exception as e:
+                log.warning(f"⚠️ No se pudo leer la definición del storage {storage}: {e}")
+                self._storage_info[storage] = {}
+        return self._storage_info[storage]
+
+    def is_shared(self, storage):
+        return bool(int(self.storage_info(storage).get('shared', 0) or 0))
+
+    def supports_linked(self, storage):
+        return not self.force_full and self.storage_info(storage).get('type') in LINKED_CLONE_TYPES
+
+    # ------------------------------------------------------------------
+    # Plantillas
+    # ------------------------------------------------------------------
+    def _lock_for(self, key):
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def ensure_template(self, image_key, node, storage):
+        """Devuelve (node, vmid) de la plantilla para (imagen, storage), creándola si falta."""
+        # En storage local la plantilla sólo es clonable desde su propio nodo
+        scope_node = None if self.is_shared(storage) else node
+        key = (image_key, storage, scope_node)
+
+        with self._lock_for(key):
+            if key in self._templates:
+                return self._templates[key]
+
+            name = template_name(image_key, storage, scope_node)
+            existing = self.client.inventory.by_name(name)
+            if existing and existing.get('template'):
+                self._templates[key] = (existing['node'], existing['vmid'])
+                return self._templates[key]
+            if existing:
+                # Una VM con el nombre de la plantilla que no es template: construcción interrumpida
+                self._templates[key] = self._finish_template(existing, name)
+                return self._templates[key]
+
+            self._templates[key] = self._build_template(name, image_key, node, storage)
+            return self._templates[key]
+
+    def _finish_template(self, vm, name):
+        """Convierte en template una plantilla nuestra a medio crear; si no es nuestra, error claro."""
+        node, vmid = vm['node'], vm['vmid']
+        if TEMPLATE_TAG not in split_tags(vm.get('tags')) or vm.get('status') != 'stopped':
+            raise RuntimeError(f"La VM {vmid} en {node} se llama {name} pero no es una plantilla "
+                               f"(¿construcción interrumpida?): elimínala o renómbrala y vuelve a ejecutar")
+        log.warning(f"⚠️ Plantilla {name} (VM {vmid}) a medio crear: terminando la conversión a template")
+        try:
+            upid = self.proxmox.nodes(node).qemu(vmid).template.post()
+            self._wait(node, upid, f"conversión a template {name}")
+        except Exception as e:
+            raise RuntimeError(f"No se pudo terminar la plantilla {name} (VM {vmid} en {node}): {e}. "
+                               f"Elimínala y vuelve a ejecutar")
+        self.client.inventory.invalidate()
+        log.info(f"✅ Plantilla {name} lista (VM {vmid})")
+        return node, vmid
+
+    def reserve_vmids(self, vmids):
+        """vmids de las VMs de esta ejecución (aún sin crear): nunca se usan para plantillas."""
+        with self._vmid_lock:
+            self._spec_vmids.update(int(v) for v in vmids)
+
+    def _allocate_vmid(self):
+        """Primer id libre desde template_vmid_base; queda reservado hasta `_release_vmid`."""
+        with self._vmid_lock:
+            used = {vm['vmid'] for vm in self.client.inventory.refresh().all()}
+            used |= self._reserved | self._spec_vmids
+            vmid = self.vmid_base
+            while vmid in used:
+                vmid += 1
+            self._reserved.add(vmid)
+            return vmid
+
+    def _release_vmid(self, vmid):
+        with self._vmid_lock:
+            self._reserved.discard(vmid)
+
+    def _build_template(self, name, image_key, node, storage):
+        vmid = self._allocate_vmid()
+        try:
+            return self._create_template(vmid, name, image_key, node, storage)
+        finally:
+            # Creada (ya aparece en el inventario) o fallida: el id deja de estar reservado
+            self._release_vmid(vmid)
+
+    def _create_template(self, vmid, name, image_key, node, storage):
+        image_path = resolve_image_path(self.config, image_key)
+        log.info(f"🏗️  Creando plantilla {name} (VM {vmid}) en {node}:{storage} desde {image_key}...")
+
+        disk = f"{storage}:0,import-from={image_path},discard=on"
+        if self.storage_info(storage).get('type') in FILE_STORAGE_TYPES:
+            # qcow2 para que los linked clones sean posibles en storage de ficheros
+            disk += ",format=qcow2"
+
+        upid = self.proxmox.nodes(node).qemu.create(
+            vmid=vmid,
+            name=name,
+            memory=1024,
+            cores=1,
+            ostype='l26',
+            agent='1',
+            scsihw='virtio-scsi-pci',
+            scsi0=disk,
+            ide2=f"{storage}:cloudinit",
+            boot='order=scsi0',
+            serial0='socket',
+            vga='serial0',
+            tags=TEMPLATE_TAG,
+            description=f"Golden template {image_key} @ {storage} (proxmox-vm-creator)",
+        )
+        self._wait(node, upid, f"creación de plantilla {name}")
+
+        upid = self.proxmox.nodes(node).qemu(vmid).template.post()
+        self._wait(node, upid, f"conversión a template {name}")
+        log.info(f"✅ Plantilla {name} lista (VM {vmid})")
+        return node, vmid
+
+    def _wait(self, node, upid, what):
+        # Algunas versiones de PVE devuelven null en lugar de un UPID
+        if not upid or not isinstance(upid, str):
+            return
+        result = self.client.tasks.wait(node, upid, timeout=self.task_timeout)
+        if not result.ok:
+            raise RuntimeError(f"Fallo en {what}: {result.exitstatus}")
+
+    # ------------------------------------------------------------------
+    # Clonado
+    # ------------------------------------------------------------------
+    def provision(self, spec):
+        """Crea la VM de `spec` clonando su plantilla y aplica su configuración."""
+        tmpl_node, tmpl_vmid = self.ensure_template(spec.image, spec.node, spec.storage)
+        linked = self.supports_linked(spec.storage)
+
+        clone_args = {'newid': spec.vmid, 'name': spec.name, 'target': spec.node, 'full': 0 if linked else 1}
+        if not linked:
+            clone_args['storage'] = spec.storage
+        log.info(f"🧬 Clonando {'(linked)' if linked else '(full)'} plantilla {tmpl_vmid} -> VM {spec.vmid} en {spec.node}")
+        upid = self.proxmox.nodes(tmpl_node).qemu(tmpl_vmid).clone.post(**clone_args)
+        self._wait(tmpl_node, upid, f"clonado de VM {spec.vmid}")
+
+        vm = self.proxmox.nodes(spec.node).qemu(spec.vmid)
+        settings = {k: v for k, v in spec.api_params().items() if k not in CREATE_ONLY_PARAMS}
+        # El clon hereda tag y descripción de la plantilla: se quitan si la VM no define los suyos
+        inherited = [k for k in ('tags', 'description') if k not in settings]
+        if inherited:
+            settings['delete'] = ','.join(inherited)
+        vm.config.post(**settings)
+
+        current = disk_size_gb(vm.config.get().get('scsi0'))
+        if spec.disk_gb > current:
+            vm.resize.put(disk='scsi0', size=f"{spec.disk_gb}G")
+        return linked
@@ -0,0 +1,129 @@
+"""
+Staging de imágenes cloud en el storage local de cada nodo.
+
+Con `staging.enabled` cada imagen de `staging.sources` se descarga (vía
+`download-url` de Proxmox, que verifica el SHA256 y renombra el fichero
+temporal al terminar) al storage local de los nodos que la necesitan. El
+nombre del fichero incluye el checksum (`ubuntu24-<sha12>.img`), de modo que
+si el volumen ya existe el contenido es el verificado y no se descarga de
+nuevo. `resolve_image_path` usa esa copia local en lugar de la ruta NFS.
+"""
+import os
+
+from lib.logger import log
+from lib.parallel import run_parallel
+
+DEFAULT_STORAGE = 'local'
+DEFAULT_DIR = '/var/lib/vz/template/iso'
+
+
+def staging_config(config):
+    return config.get('staging', {}) or {}
+
+
+def staged_filename(image_key, sha256):
+    return f"{image_key}-{sha256.lower()[:12]}.img"
+
+
+def staged_path(config, image_key):
+    """Ruta local de la imagen en los nodos, o None si no se hace staging de ella."""
+    staging = staging_config(config)
+    if not staging.get('enabled'):
+        return None
+    source = (staging.get('sources') or {}).get(image_key) or {}
+    if not source.get('url') or not source.get('sha256'):
+        return None
+    return os.path.join(staging.get('dir', DEFAULT_DIR), staged_filename(image_key, source['sha256']))
+
+
+class ImageStager:
+    def __init__(self, client, config):
+        self.client = client
+        self.proxmox = client.api
+        self.config = config
+        staging = staging_config(config)
+        self.storage = staging.get('storage', DEFAULT_STORAGE)
+        self.sources = staging.get('sources') or {}
+        self.prune = bool(staging.get('prune', False))
+        self.timeout = int(staging.get('timeout', 1800))
+
+    def required(self, specs):
+        """{nodo: {imagen, ...}} con las imágenes que hay que tener en cada nodo."""
+        needed = {}
+        for spec in specs:
+            if spec.node and staged_path(self.config, spec.image):
+                needed.setdefault(spec.node, set()).add(spec.image)
+        return needed
+
+    def stage(self, specs):
+        """Asegura las imágenes en todos los nodos (en paralelo). Devuelve {(nodo, imagen)} fallidos."""
+        needed = self.required(specs)
+        if not needed:
+            return set()
+
+        log.info(f"📦 Staging de imágenes cloud en {len(needed)} nodo(s) ({self.storage})...")
+        nodes = sorted(needed)
+        results = run_parallel(nodes, lambda node: self._stage_node(node, needed[node]), max_workers=len(nodes))
+
+        failed = set()
+        for node, node_failed in zip(nodes, results):
+            failed.update((node, image_key) for image_key in node_failed)
+        return failed
+
+    def _stage_node(self, node, image_keys):
+        storage = self.proxmox.nodes(node).storage(self.storage)
+        try:
+            present = {item.get('volid') for item in storage.content.get(content='iso')}
+        except Exception as e:
+            log.error(f"❌ No se pudo listar {self.storage} en {node}: {e}")
+            return set(image_keys)
+
+        futures = {}
+        for image_key in sorted(image_keys):
+            source = self.sources[image_key]
+            filename = staged_filename(image_key, source['sha256'])
+            if f"{self.storage}:iso/{filename}" in present:
+                log.info(f"   ✓ {node}: {filename} ya presente (checksum verificado)")
+                continue
+
+            log.info(f"   ⬇️  {node}: descargando {image_key} -> {filename}")
+            try:
+                upid = storage('download-url').post(
+                    url=source['url'],
+                    content='iso',
+                    filename=filename,
+                    checksum=source['sha256'].lower(),
+                    **{'checksum-algorithm': 'sha256'}
+                )
+            except Exception as e:
+                log.error(f"❌ {node}: no se pudo iniciar la descarga de {image_key}: {e}")
+                futures[image_key] = None
+                continue
+            futures[image_key] = self.client.tasks.watch(node, upid, timeout=self.timeout)
+
+        failed = set()
+        for image_key, future in futures.items():
+            result = future.result() if future else None
+            if result and result.ok:
+                log.info(f"   ✅ {node}: {image_key} descargada y verificada ({result.elapsed:.0f}s)")
+            else:
+                log.error(f"❌ {node}: staging de {image_key} falló"
+                          f"{f' ({result.exitstatus})' if result else ''}")
+                failed.add(image_key)
+
+        if self.prune:
+            self._prune(node, storage, present, image_keys - failed)
+        return failed
+
+    def _prune(self, node, storage, present, image_keys):
+        """Borra versiones antiguas (otro checksum) de las imágenes ya staged."""
+        for image_key in image_keys:
+            current = f"{self.storage}:iso/{staged_filename(image_key, self.sources[image_key]['sha256'])}"
+            prefix = f"{self.storage}:iso/{image_key}-"
+            for volid in present:
+                if volid and volid.startswith(prefix) and volid.endswith('.img') and volid != current:
+                    try:
+                        storage.content(volid).delete()
+                        log.info(f"   🗑️  {node}: eliminada versión antigua {volid}")
+                    except Exception as e:
+                        log.warning(f"⚠️ {node}: no se pudo eliminar {volid}: {e}")
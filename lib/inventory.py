@@ -0,0 +1,98 @@
+"""
+Inventario del cluster a partir de una única llamada a `cluster/resources`.
+
+Un snapshot contiene estado, nodo, nombre, tags y recursos de todas las VMs
+del cluster. Se reutiliza durante `ttl` segundos y se invalida automáticamente
+tras cualquier escritura hecha con el cliente compartido (POST/PUT/DELETE), de
+modo que verificar cien VMs cuesta una o dos peticiones en lugar de doscientas.
+"""
+import re
+import threading
+import time
+
+DEFAULT_TTL = 5
+
+
+def split_tags(tags):
+    """'kubernetes;master' / 'kubernetes,master' -> {'kubernetes', 'master'}"""
+    if not tags:
+        return set()
+    if isinstance(tags, (list, tuple, set)):
+        return {str(t).strip() for t in tags if str(t).strip()}
+    return {t for t in re.split(r'[;,\s]+', str(tags)) if t}
+
+
+class Inventory:
+    def __init__(self, proxmox, ttl=DEFAULT_TTL):
+        self.proxmox = proxmox
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._taken = 0.0
+        self._by_vmid = {}
+        self._by_name = {}
+        self._by_node = {}
+        self._by_tag = {}
+
+    # ------------------------------------------------------------------
+    # Snapshot
+    # ------------------------------------------------------------------
+    def refresh(self):
+        """Toma un snapshot nuevo de cluster/resources (una petición)."""
+        resources = self.proxmox.cluster.resources.get(type='vm')
+        by_vmid, by_name, by_node, by_tag = {}, {}, {}, {}
+        for r in resources:
+            if r.get('vmid') is None:
+                continue
+            r = dict(r, vmid=int(r['vmid']))
+            by_vmid[r['vmid']] = r
+            if r.get('name'):
+                by_name[r['name']] = r
+            by_node.setdefault(r.get('node'), []).append(r)
+            for tag in split_tags(r.get('tags')):
+                by_tag.setdefault(tag, []).append(r)
+
+        with self._lock:
+            self._by_vmid, self._by_name, self._by_node, self._by_tag = by_vmid, by_name, by_node, by_tag
+            self._taken = time.monotonic()
+        return self
+
+    def invalidate(self):
+        with self._lock:
+            self._taken = 0.0
+
+    def _fresh(self):
+        with self._lock:
+            stale = time.monotonic() - self._taken > self.ttl
+        if stale:
+            self.refresh()
+        return self
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+    def all(self):
+        return list(self._fresh()._by_vmid.values())
+
+    def get(self, vmid):
+        return self._fresh()._by_vmid.get(int(vmid))
+
+    def by_name(self, name):
+        return self._fresh()._by_name.get(name)
+
+    def on_node(self, node):
+        return list(self._fresh()._by_node.get(node, []))
+
+    def with_tag(self, tag):
+        return list(self._fresh()._by_tag.get(tag, []))
+
+    def status(self, vmid):
+        """Estado ('running', 'stopped', ...) o None si la VM no existe."""
+        vm = self.get(vmid)
+        return vm.get('status') if vm else None
+
+    def exists(self, vmid):
+        return self.get(vmid) is not None
+
+    def node_of(self, vmid):
+        vm = self.get(vmid)
+        return vm.get('node') if vm else None
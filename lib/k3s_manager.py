@@ -1,12 +1,42 @@
 import os
+import shlex
 import subprocess
 import time
-from lib.logger import log
+from lib.logger import log, log_context
+from lib.manifests import ManifestError, ManifestStore, set_image_tag
 from lib.config import Config
+from lib.kube import KubeClient, KubeError, wait_until, watch_until
+from lib.parallel import run_parallel
+from lib.proxmox_client import get_client
+from lib.ssh import get_pool
+from lib.tracing import span, traced
 from rich.console import Console
 
 console = Console()
 
+NGINX_TEST = [
+    {
+        'apiVersion': 'apps/v1',
+        'kind': 'Deployment',
+        'metadata': {'name': 'nginx-test', 'namespace': 'default', 'labels': {'app': 'nginx-test'}},
+        'spec': {
+            'replicas': 1,
+            'selector': {'matchLabels': {'app': 'nginx-test'}},
+            'template': {
+                'metadata': {'labels': {'app': 'nginx-test'}},
+                'spec': {'containers': [{'name': 'nginx', 'image': 'nginx', 'ports': [{'containerPort': 80}]}]},
+            },
+        },
+    },
+    {
+        'apiVersion': 'v1',
+        'kind': 'Service',
+        'metadata': {'name': 'nginx-test', 'namespace': 'default'},
+        'spec': {'type': 'LoadBalancer', 'selector': {'app': 'nginx-test'},
+                 'ports': [{'port': 80, 'targetPort': 80}]},
+    },
+]
+
 
 class K3sManager:
     def __init__(self):
@@ -19,23 +49,130 @@ class K3sManager:
         self.master_taint = self.k3s_cfg.get('master_taint', 'node-role.kubernetes.io/master=true:NoSchedule')
         self.kubeconfig_path = os.path.expanduser('~/.kube/config')
         self.ssh_key = self.k3s_cfg.get('ssh_key', '~/.ssh/id_rsa')
+        # Workers que se unen a la vez (los masters siempre de uno en uno por etcd)
+        self.join_parallel = int(self.k3s_cfg.get('join_parallel', 5))
+        # Una conexión SSH multiplexada por host, compartida por todas las operaciones
+        self.ssh = get_pool(self.user, self.ssh_key)
+        # Deadline de cada espera de readiness (API server, MetalLB, LoadBalancer)
+        self.ready_timeout = int(self.k3s_cfg.get('ready_timeout', 300))
+        self.gates = []
+        self._kube_client = None
+        # Manifiestos kube-vip / MetalLB fijados y cacheados (k3s.offline para no usar la red)
+        self.manifests = ManifestStore.from_k3s_config(self.k3s_cfg)
 
         # Filter nodes
         self.masters = [vm for vm in self.cfg.vms if 'master' in vm.get('tags', '') or 'master' in vm.get('name', '')]
         self.workers = [vm for vm in self.cfg.vms if 'worker' in vm.get('tags', '') or 'worker' in vm.get('name', '')]
 
-    def _run_cmd(self, cmd, with_kubeconfig=False):
-        """Ejecuta un comando. Si with_kubeconfig=True, exporta KUBECONFIG primero."""
+    def _run_cmd(self, cmd, with_kubeconfig=False, secret=None, capture=False):
+        """Ejecuta un comando. Si with_kubeconfig=True, exporta KUBECONFIG primero.
+
+        secret: valor que no debe aparecer en el log (p.ej. el token de join).
+        capture: no mezclar la salida en la consola (ejecuciones concurrentes);
+        sólo se muestra si el comando falla.
+        """
         if with_kubeconfig:
             cmd = f"KUBECONFIG={self.kubeconfig_path} {cmd}"
-        log.info(f"   ⚙️  Exec: {cmd}")
+        shown = cmd.replace(secret, '***') if secret else cmd
+        log.info(f"   ⚙️  Exec: {shown}")
         try:
-            subprocess.run(cmd, shell=True, check=True, env={**os.environ, 'KUBECONFIG': self.kubeconfig_path})
+            with span(f"cmd {shlex.split(cmd)[0]}", 'cmd', command=shown):
+                subprocess.run(cmd, shell=True, check=True, env={**os.environ, 'KUBECONFIG': self.kubeconfig_path},
+                               capture_output=capture, text=capture)
             return True
         except subprocess.CalledProcessError as e:
-            log.error(f"   ❌ Error executing command: {e}")
+            log.error(f"   ❌ Error executing command: {shown} (exit {e.returncode})")
+            if capture and (e.stdout or e.stderr):
+                log.error(f"      {(e.stderr or e.stdout).strip()[-500:]}")
+            return False
+
+    def _remote(self, vm, command, timeout=120):
+        """Orden remota por la conexión SSH compartida del host."""
+        log.info(f"   ⚙️  SSH {vm['ip']}: {command}")
+        result = self.ssh.run(vm['ip'], command, timeout=timeout)
+        if not result.ok:
+            log.error(f"   ❌ Error en {vm['name']} ({vm['ip']}): {result.stderr.strip() or result.returncode}")
+        return result.ok
+
+    @property
+    def kube(self):
+        """Cliente de la API compartido: una sesión keep-alive para todo el despliegue."""
+        if self._kube_client is None:
+            self._kube_client = KubeClient.from_kubeconfig(self.kubeconfig_path)
+        return self._kube_client
+
+    def _apply(self, what, manifest):
+        """Server-side apply en bloque de un manifiesto (texto YAML u objetos)."""
+        try:
+            count = self.kube.apply(manifest)
+        except (KubeError, ManifestError) as e:
+            log.error(f"   ❌ Error aplicando {what}: {e}")
+            return False
+        log.info(f"   ✅ {what}: {count} objeto(s) aplicados")
+        return True
+
+    def _print_nodes(self):
+        from rich.table import Table
+
+        try:
+            nodes = self.kube.nodes()
+        except KubeError as e:
+            log.error(f"❌ No se pudieron leer los nodos: {e}")
             return False
+        table = Table(title="Kubernetes Nodes")
+        table.add_column("Name", style="cyan")
+        table.add_column("Status")
+        table.add_column("Roles", style="blue")
+        table.add_column("Version", style="yellow")
+        table.add_column("Internal IP", style="magenta")
+        for n in nodes:
+            table.add_row(n['name'], "🟢 Ready" if n['ready'] else "🔴 NotReady",
+                          ','.join(n['roles']) or '<none>', n['version'] or '', n['ip'] or '')
+        console.print(table)
+        return True
 
+    def _gate(self, name, check, timeout=None):
+        """Espera a una condición de readiness y registra cuánto tardó."""
+        gate = wait_until(name, check, timeout=timeout or self.ready_timeout)
+        self.gates.append(gate)
+        return gate
+
+    def _fetch_node_token(self, server_ip):
+        """Lee una sola vez el token de join del primer master."""
+        result = self.ssh.run(server_ip, 'sudo cat /var/lib/rancher/k3s/server/node-token')
+        token = result.stdout.strip()
+        if not result.ok or not token:
+            log.error(f"   ❌ No se pudo obtener el token de join: {result.stderr.strip()}")
+            return None
+        return token
+
+    def _join(self, vm, server_ip, token, server=False, capture=False):
+        """k3sup join con el token ya obtenido. Devuelve (ok, segundos)."""
+        if server:
+            extra = (f"--disable traefik --disable servicelb --flannel-iface={self.interface} "
+                     f"--node-ip={vm['ip']} --node-taint {self.master_taint}")
+        else:
+            extra = f"--flannel-iface={self.interface} --node-ip={vm['ip']}"
+        cmd = (
+            f"k3sup join "
+            f"--ip {vm['ip']} "
+            f"--user {self.user} "
+            f"--server-user {self.user} "
+            f"--server-ip {server_ip} "
+            f"{'--server ' if server else ''}"
+            f"--sudo "
+            f"--k3s-version {self.version} "
+            f"--node-token {shlex.quote(token)} "
+            f"--k3s-extra-args '{extra}' "
+            f"--ssh-key {self.ssh_key}"
+        )
+        start = time.monotonic()
+        with span(f"k3s join {vm['name']}", 'k3s', ip=vm['ip'], server=server), \
+                log_context(host=vm['name'], op='join'):
+            ok = self._run_cmd(cmd, secret=token, capture=capture)
+        return ok, time.monotonic() - start
+
+    @traced("k3s kubeconfig", 'k3s')
     def _setup_kubeconfig(self, master_ip):
         """Obtiene el kubeconfig del master y lo configura localmente."""
         log.info("   📋 Configurando kubeconfig...")
@@ -45,10 +182,9 @@ class K3sManager:
         os.makedirs(kube_dir, exist_ok=True)
 
         # Obtener kubeconfig del master
-        cmd = f"ssh -o StrictHostKeyChecking=no {self.user}@{master_ip} 'sudo cat /etc/rancher/k3s/k3s.yaml'"
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        result = self.ssh.run(master_ip, 'sudo cat /etc/rancher/k3s/k3s.yaml')
 
-        if result.returncode != 0:
+        if not result.ok:
             log.error(f"   ❌ Error obteniendo kubeconfig: {result.stderr}")
             return False
 
@@ -60,6 +196,7 @@ class K3sManager:
             f.write(kubeconfig_content)
 
         os.chmod(self.kubeconfig_path, 0o600)
+        self._kube_client = None
 
         # Exportar KUBECONFIG en el entorno actual
         os.environ['KUBECONFIG'] = self.kubeconfig_path
@@ -112,18 +249,25 @@ class K3sManager:
             f"--context k3s-ha "
             f"--ssh-key {self.ssh_key}"
         )
-        if not self._run_cmd(cmd): return
+        with span("k3s bootstrap", 'k3s', ip=first_master['ip']):
+            if not self._run_cmd(cmd): return
 
         # 1.5. Setup kubeconfig properly
         log.info("1️⃣.5️⃣  Configurando kubeconfig...")
-        time.sleep(10)  # Esperar a que K3s esté listo
-        if not self._setup_kubeconfig(first_master['ip']):
+        # Esperar a que K3s escriba su kubeconfig y a que el API server responda
+        master_ip = first_master['ip']
+        if not self._gate("k3s kubeconfig",
+                          lambda: self.ssh.run(master_ip, 'sudo test -s /etc/rancher/k3s/k3s.yaml', timeout=10).ok).ok:
+            return
+        if not self._setup_kubeconfig(master_ip):
             log.error("❌ No se pudo configurar kubeconfig")
             return
+        if not self._gate("API server", self.kube.api_ready).ok:
+            return
 
         # Verificar conexión al cluster
         log.info("   🔍 Verificando conexión al cluster...")
-        if not self._run_cmd("kubectl get nodes"):
+        if not self._print_nodes():
             log.error("❌ No se puede conectar al cluster")
             return
 
@@ -135,79 +279,102 @@ class K3sManager:
         log.info("3️⃣  Deploying MetalLB (LoadBalancer)...")
         self._deploy_metallb(first_master['ip'])
 
-        # 4. Join Other Masters
+        # Token de join: una sola lectura por SSH para todos los joins
+        token = self._fetch_node_token(first_master['ip'])
+        if not token:
+            return
+        durations = []
+
+        # 4. Join Other Masters (de uno en uno: etcd no admite altas simultáneas)
         for m in other_masters:
             log.info(f"4️⃣  Joining Master: {m['name']} ({m['ip']})")
-            cmd = (
-                f"k3sup join "
-                f"--ip {m['ip']} "
-                f"--user {self.user} "
-                f"--server-user {self.user} "
-                f"--server-ip {first_master['ip']} "
-                f"--server "
-                f"--sudo "
-                f"--k3s-version {self.version} "
-                f"--k3s-extra-args '--disable traefik --disable servicelb --flannel-iface={self.interface} --node-ip={m['ip']} --node-taint {self.master_taint}' "
-                f"--ssh-key {self.ssh_key}"
-            )
-            self._run_cmd(cmd)
+            ok, elapsed = self._join(m, first_master['ip'], token, server=True)
+            durations.append((m, 'Master', ok, elapsed))
+
+        # 5. Join Workers (concurrentes, hasta join_parallel a la vez)
+        if self.workers:
+            log.info(f"5️⃣  Joining {len(self.workers)} Worker(s) ({self.join_parallel} en paralelo)...")
+            phase_start = time.monotonic()
+            with span("k3s join workers", 'k3s', workers=len(self.workers)):
+                results = run_parallel(
+                    self.workers,
+                    lambda w: self._join(w, first_master['ip'], token, capture=self.join_parallel > 1),
+                    max_workers=self.join_parallel,
+                )
+            for w, (ok, elapsed) in zip(self.workers, results):
+                log.info(f"   {'✅' if ok else '❌'} Worker {w['name']} ({w['ip']}): {elapsed:.1f}s")
+                durations.append((w, 'Worker', ok, elapsed))
+            log.info(f"   ⏱️  Fase de workers: {time.monotonic() - phase_start:.1f}s")
+
+        self._print_join_report(durations)
+        self._print_gate_report()
+        log.info("🎉 Cluster Deployment Completed!")
+        self._print_nodes()
+        return durations
 
-        # 5. Join Workers
-        for w in self.workers:
-            log.info(f"5️⃣  Joining Worker: {w['name']} ({w['ip']})")
-            cmd = (
-                f"k3sup join "
-                f"--ip {w['ip']} "
-                f"--user {self.user} "
-                f"--server-user {self.user} "
-                f"--server-ip {first_master['ip']} "
-                f"--sudo "
-                f"--k3s-version {self.version} "
-                f"--k3s-extra-args '--flannel-iface={self.interface} --node-ip={w['ip']}' "
-                f"--ssh-key {self.ssh_key}"
-            )
-            self._run_cmd(cmd)
+    def _print_join_report(self, durations):
+        if not durations:
+            return
+        from rich.table import Table
 
-        log.info("🎉 Cluster Deployment Completed!")
-        self._run_cmd("kubectl get nodes -o wide")
+        table = Table(title="K3s Joins")
+        table.add_column("VM Name", style="cyan")
+        table.add_column("IP Address", style="magenta")
+        table.add_column("Role", style="blue")
+        table.add_column("Result")
+        table.add_column("Duration", justify="right", style="yellow")
+        for vm, role, ok, elapsed in durations:
+            table.add_row(vm['name'], vm['ip'], role, "🟢 Joined" if ok else "🔴 Failed", f"{elapsed:.1f}s")
+        console.print(table)
 
-    def _deploy_kubevip(self, master_ip):
-        # RBAC
-        self._run_cmd("curl -s https://kube-vip.io/manifests/rbac.yaml > kube-vip-rbac.yaml")
-        self._run_cmd("kubectl apply -f kube-vip-rbac.yaml") # Assumes ~/.kube/config is set by k3sup
+    def _print_gate_report(self):
+        if not self.gates:
+            return
+        from rich.table import Table
 
-        # DaemonSet Generation & Apply
-        # Note: This uses SSH to run remote k3s/ctr commands to generate manifest
+        table = Table(title="Readiness Gates")
+        table.add_column("Gate", style="cyan")
+        table.add_column("Result")
+        table.add_column("Waited", justify="right", style="yellow")
+        for gate in self.gates:
+            table.add_row(gate.name, "🟢 Ready" if gate.ok else "🔴 Timeout", f"{gate.elapsed:.1f}s")
+        console.print(table)
+
+    @traced("k3s kube-vip", 'k3s')
+    def _deploy_kubevip(self, master_ip):
+        # RBAC + DaemonSet: plantillas cacheadas, variables (interface, vip, versión) en Python
         log.info("   Generating Kube-VIP manifest...")
-        # Download template and replace variables (interface, vip, version)
-        url = "https://raw.githubusercontent.com/JamesTurland/JimsGarage/main/Kubernetes/K3S-Deploy/kube-vip"
-        cmd = (
-            f"curl -s {url} | "
-            f"sed 's/$interface/{self.interface}/g' | "
-            f"sed 's/$vip/{self.vip}/g' | "
-            f"sed 's/v0.8.2/v0.8.6/g' > kube-vip.yaml"
-        )
-        if self._run_cmd(cmd):
-            self._run_cmd("kubectl apply -f kube-vip.yaml")
-            log.info("   ✅ Kube-VIP applied.")
-        else:
-            log.error("   ❌ Failed to generate Kube-VIP manifest")
+        try:
+            version = self.manifests.manifests['kube-vip']['version']
+            rbac = self.manifests.fetch('kube-vip-rbac')
+            text = self.manifests.render('kube-vip', interface=self.interface, vip=self.vip, version=version)
+        except ManifestError as e:
+            log.error(f"   ❌ Failed to generate Kube-VIP manifest: {e}")
+            return False
+        # Plantillas sembradas en manifests_dir pueden traer el tag fijo
+        text = set_image_tag(text, 'ghcr.io/kube-vip/kube-vip', version)
+        return self._apply("Kube-VIP", rbac + "\n---\n" + text)
 
+    @traced("k3s metallb", 'k3s')
     def _deploy_metallb(self, master_ip=None):
-        # 1. Download and Apply MetalLB Native Manifest
-        log.info("   Downloading MetalLB Native Manifest...")
-        metallb_url = "https://raw.githubusercontent.com/metallb/metallb/v0.14.9/config/manifests/metallb-native.yaml"
-        # Download first, then apply (avoids URL parsing issues)
-        if not self._run_cmd(f"curl -sLO {metallb_url}"):
-            log.error("   Failed to download MetalLB manifest")
+        # 1. MetalLB Native Manifest (fijado y cacheado: sin red en re-despliegues)
+        log.info("   Loading MetalLB Native Manifest...")
+        try:
+            native = self.manifests.fetch('metallb-native')
+        except ManifestError as e:
+            log.error(f"   Failed to load MetalLB manifest: {e}")
             return False
-        if not self._run_cmd("kubectl apply -f metallb-native.yaml"):
-            log.error("   Failed to apply MetalLB manifest")
+        if not self._apply("MetalLB", native):
             return False
         
         log.info("   Waiting for MetalLB Controller to be ready...")
-        # Simple wait loop handled by kubectl wait usually, but generic sleep is safer for simple scripts
-        time.sleep(30) 
+        # El IPAddressPool pasa por el webhook del controller: ambos deben estar listos
+        kube = self.kube
+        if not self._gate("MetalLB controller", lambda: kube.deployment_ready('metallb-system', 'controller')).ok:
+            return False
+        if not self._gate("MetalLB webhook",
+                          lambda: kube.endpoints_ready('metallb-system', 'metallb-webhook-service')).ok:
+            return False
         
         # 2. Configure IPAddressPool
         log.info("   Configuring MetalLB IP Address Pool...")
@@ -234,11 +401,8 @@ spec:
   ipAddressPools:
   - dev-pool
 """
-        # Write config locally then apply
-        with open("metallb-config.yaml", "w") as f:
-            f.write(pool_config)
-            
-        self._run_cmd("kubectl apply -f metallb-config.yaml")
+        if not self._apply("MetalLB IP pool", pool_config):
+            return False
         log.info(f"   ✅ MetalLB configured with range: {lb_range}")
         return True
 
@@ -251,11 +415,11 @@ spec:
             log.error("❌ Kubeconfig not found. Run deployment first or setup kubeconfig manually.")
             return False
 
-        os.environ['KUBECONFIG'] = self.kubeconfig_path
-
         # Verificar conexión
-        if not self._run_cmd("kubectl get nodes"):
-            log.error("❌ Cannot connect to cluster")
+        try:
+            self.kube.api_ready()
+        except KubeError as e:
+            log.error(f"❌ Cannot connect to cluster: {e}")
             return False
 
         return self._deploy_metallb()
@@ -264,21 +428,20 @@ spec:
         """Despliega nginx de prueba con LoadBalancer."""
         log.info("🌐 Deploying nginx test application...")
 
-        os.environ['KUBECONFIG'] = self.kubeconfig_path
-
-        # Crear deployment
-        if not self._run_cmd("kubectl create deployment nginx-test --image=nginx"):
-            log.warning("   Deployment may already exist")
-
-        # Exponer con LoadBalancer
-        if not self._run_cmd("kubectl expose deployment nginx-test --port=80 --type=LoadBalancer"):
-            log.warning("   Service may already exist")
-
-        # Mostrar IP asignada
-        time.sleep(5)
-        self._run_cmd("kubectl get svc nginx-test")
-        log.info("✅ Nginx test deployed. Check EXTERNAL-IP above.")
+        # Deployment + Service LoadBalancer en un solo apply (idempotente)
+        if not self._apply("nginx-test", NGINX_TEST):
+            return False
 
+        # Esperar (con un watch) a que MetalLB asigne la IP externa
+        gate = watch_until("nginx-test LoadBalancer IP", self.kube, '/api/v1/namespaces/default/services',
+                           lambda svc: (svc.get('status', {}).get('loadBalancer', {}).get('ingress') or [{}])[0].get('ip'),
+                           timeout=120, params={'fieldSelector': 'metadata.name=nginx-test'})
+        self.gates.append(gate)
+        if gate.ok:
+            log.info(f"✅ Nginx test deployed at http://{gate.value}")
+        else:
+            log.warning("⚠️ Nginx test deployed but no EXTERNAL-IP was assigned yet.")
+        return gate.ok
 
     def stop_cluster(self):
         log.info("🛑 Stopping K3s Cluster...")
@@ -286,14 +449,12 @@ spec:
         # Stop Workers First
         for w in self.workers:
             log.info(f"   Stopping K3s Agent on Worker: {w['name']} ({w['ip']})")
-            cmd = f"ssh -o StrictHostKeyChecking=no {self.user}@{w['ip']} \"sudo systemctl stop k3s-agent\""
-            self._run_cmd(cmd)
+            self._remote(w, "sudo systemctl stop k3s-agent")
 
         # Stop Masters
         for m in self.masters:
             log.info(f"   Stopping K3s Server on Master: {m['name']} ({m['ip']})")
-            cmd = f"ssh -o StrictHostKeyChecking=no {self.user}@{m['ip']} \"sudo systemctl stop k3s\""
-            self._run_cmd(cmd)
+            self._remote(m, "sudo systemctl stop k3s")
             
         log.info("✅ Cluster Stopped.")
 
@@ -303,14 +464,12 @@ spec:
         # Start Masters First
         for m in self.masters:
             log.info(f"   Starting K3s Server on Master: {m['name']} ({m['ip']})")
-            cmd = f"ssh -o StrictHostKeyChecking=no {self.user}@{m['ip']} \"sudo systemctl start k3s\""
-            self._run_cmd(cmd)
+            self._remote(m, "sudo systemctl start k3s")
 
         # Start Workers
         for w in self.workers:
             log.info(f"   Starting K3s Agent on Worker: {w['name']} ({w['ip']})")
-            cmd = f"ssh -o StrictHostKeyChecking=no {self.user}@{w['ip']} \"sudo systemctl start k3s-agent\""
-            self._run_cmd(cmd)
+            self._remote(w, "sudo systemctl start k3s-agent")
             
         log.info("✅ Cluster Started.")
 
@@ -324,6 +483,8 @@ spec:
         table.add_column("IP Address", style="magenta")
         table.add_column("Role", style="blue")
         table.add_column("Proxmox Node", style="green")
+        table.add_column("VM State")
+        table.add_column("K8s Node")
         table.add_column("Service Status", style="yellow")
         
         nodes = []
@@ -331,21 +492,55 @@ spec:
             nodes.append({**m, 'role': 'Master', 'service': 'k3s'})
         for w in self.workers:
             nodes.append({**w, 'role': 'Worker', 'service': 'k3s-agent'})
-            
-        for node in nodes:
-            # Check service status
+
+        # 1. Una sola llamada a la API de Kubernetes (Ready, versión, IP interna)
+        k8s_by_ip = {}
+        try:
+            k8s_by_ip = {n['ip']: n for n in self.kube.nodes(timeout=3)}
+        except KubeError as e:
+            log.warning(f"⚠️ API de Kubernetes no disponible, se consultará por SSH: {e}")
+
+        # 2. Inventario Proxmox (nodo y estado real de cada VM) en un snapshot
+        inventory = None
+        client = get_client(self.cfg)
+        if client.connect():
             try:
-                cmd = f"ssh -o StrictHostKeyChecking=no -o ConnectTimeout=2 {self.user}@{node['ip']} \"systemctl is-active {node['service']}\""
-                result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-                status = "🟢 Active" if "active" in result.stdout else "🔴 Inactive"
-            except:
+                inventory = client.inventory.refresh()
+            except Exception as e:
+                log.warning(f"⚠️ No se pudo leer el inventario Proxmox: {e}")
+
+        # 3. SSH sólo para los nodos que la API no da por Ready, todos a la vez
+        to_probe = [n for n in nodes if not k8s_by_ip.get(n['ip'], {}).get('ready')]
+        probes = run_parallel(
+            to_probe,
+            lambda n: self.ssh.run(n['ip'], f"systemctl is-active {n['service']}", timeout=5),
+            max_workers=max(1, len(to_probe)),
+        )
+        probe_by_ip = {n['ip']: r for n, r in zip(to_probe, probes)}
+
+        for node in nodes:
+            k8s = k8s_by_ip.get(node['ip'])
+            if k8s:
+                k8s_status = f"{'🟢 Ready' if k8s['ready'] else '🔴 NotReady'} {k8s['version'] or ''}".strip()
+            else:
+                k8s_status = "—"
+
+            result = probe_by_ip.get(node['ip'])
+            if result is None:
+                status = "🟢 Active"
+            elif result.returncode in (124, 255):
                 status = "❓ Unreachable"
-            
+            else:
+                status = "🟢 Active" if result.stdout.strip() == "active" else "🔴 Inactive"
+
+            vm = inventory.by_name(node['name']) if inventory else None
             table.add_row(
                 node['name'],
                 node['ip'],
                 node['role'],
-                node.get('node', 'Unknown'),
+                vm['node'] if vm else node.get('node', 'Unknown'),
+                vm.get('status', '?') if vm else "?",
+                k8s_status,
                 status
             )
             
@@ -0,0 +1,323 @@
+"""
+Cliente mínimo de la API de Kubernetes a partir de un kubeconfig.
+
+Evita lanzar `kubectl` (un proceso y un handshake TLS por orden) cuando basta
+con una petición HTTP: usa una sesión keep-alive con el certificado de
+cliente / token del kubeconfig que escribe k3sup.
+
+`apply()` aplica manifiestos multi-documento con server-side apply: primero
+Namespaces y CRDs, después el resto de objetos en paralelo sobre la misma
+sesión. El mapeo kind -> recurso REST sale de la discovery API (cacheada).
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+import requests
+import yaml
+
+from lib.config import CACHE_DIR
+from lib.logger import log
+from lib.parallel import run_parallel
+from lib.tracing import tracer
+
+DEFAULT_TIMEOUT = 5
+FIELD_MANAGER = 'proxmox-vm-creator'
+
+# Se aplican antes (y en serie) porque el resto de objetos depende de ellos
+FIRST_KINDS = ('Namespace', 'CustomResourceDefinition')
+
+Gate = namedtuple('Gate', ['name', 'ok', 'elapsed', 'value'])
+
+
+class KubeError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status  # código HTTP si la API respondió con error
+
+
+class UnknownKindError(KubeError):
+    """El apiVersion/kind aún no está en la discovery (p.ej. un CRD recién creado)."""
+
+
+def _materialize(data_b64, suffix):
+    """Escribe un *-data del kubeconfig a un fichero 0600 (requests necesita rutas)."""
+    raw = base64.b64decode(data_b64)
+    path = os.path.join(CACHE_DIR, 'kube', f"{hashlib.sha256(raw).hexdigest()[:16]}.{suffix}")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(raw)
+        os.replace(tmp, path)
+    return path
+
+
+class KubeClient:
+    def __init__(self, server, verify=True, cert=None, token=None):
+        self.server = server.rstrip('/')
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.session.hooks['response'].append(tracer.http_hook)
+        if cert:
+            self.session.cert = cert
+        if token:
+            self.session.headers['Authorization'] = f"Bearer {token}"
+        self._resources = {}
+        self._discovery_lock = threading.Lock()
+
+    @classmethod
+    def from_kubeconfig(cls, path='~/.kube/config', context=None):
+        path = os.path.expanduser(path)
+        try:
+            with open(path) as f:
+                kc = yaml.safe_load(f) or {}
+        except OSError as e:
+            raise KubeError(f"No se pudo leer el kubeconfig {path}: {e}")
+
+        context = context or kc.get('current-context')
+        ctx = next((c['context'] for c in kc.get('contexts', []) if c['name'] == context), None)
+        if ctx is None:
+            raise KubeError(f"Contexto {context!r} no encontrado en {path}")
+        cluster = next((c['cluster'] for c in kc.get('clusters', []) if c['name'] == ctx['cluster']), None)
+        if cluster is None:
+            raise KubeError(f"Cluster {ctx['cluster']!r} no encontrado en {path}")
+        user = next((u['user'] for u in kc.get('users', []) if u['name'] == ctx.get('user')), {}) or {}
+
+        if cluster.get('insecure-skip-tls-verify'):
+            verify = False
+        elif cluster.get('certificate-authority-data'):
+            verify = _materialize(cluster['certificate-authority-data'], 'ca.crt')
+        else:
+            verify = cluster.get('certificate-authority', True)
+
+        cert = None
+        if user.get('client-certificate-data'):
+            cert = (_materialize(user['client-certificate-data'], 'crt'),
+                    _materialize(user['client-key-data'], 'key'))
+        elif user.get('client-certificate'):
+            cert = (user['client-certificate'], user.get('client-key'))
+
+        return cls(cluster['server'], verify=verify, cert=cert, token=user.get('token'))
+
+    # ------------------------------------------------------------------
+    # Peticiones
+    # ------------------------------------------------------------------
+    def request(self, method, path, timeout=DEFAULT_TIMEOUT, **kwargs):
+        try:
+            resp = self.session.request(method, f"{self.server}{path}", timeout=timeout, **kwargs)
+        except requests.RequestException as e:
+            raise KubeError(f"{method} {path}: {e}")
+        if resp.status_code >= 400:
+            raise KubeError(f"{method} {path}: HTTP {resp.status_code} {resp.text[:200]}", status=resp.status_code)
+        if not resp.content:
+            return {}
+        if 'json' not in resp.headers.get('Content-Type', ''):
+            return resp.text  # /readyz, /healthz...
+        return resp.json()
+
+    def get(self, path, params=None, timeout=DEFAULT_TIMEOUT):
+        return self.request('GET', path, params=params, timeout=timeout)
+
+    def watch(self, path, params=None, timeout=60):
+        """Itera los eventos (type, object) de un watch hasta que el servidor lo cierra."""
+        params = dict(params or {}, watch='true', timeoutSeconds=int(timeout))
+        try:
+            with self.session.get(f"{self.server}{path}", params=params, stream=True,
+                                  timeout=(DEFAULT_TIMEOUT, timeout + 5)) as resp:
+                if resp.status_code >= 400:
+                    raise KubeError(f"WATCH {path}: HTTP {resp.status_code} {resp.text[:200]}")
+                for line in resp.iter_lines():
+                    if line:
+                        event = json.loads(line)
+                        yield event.get('type'), event.get('object', {})
+        except requests.RequestException as e:
+            raise KubeError(f"WATCH {path}: {e}")
+
+    # ------------------------------------------------------------------
+    # Discovery y server-side apply
+    # ------------------------------------------------------------------
+    def _resource_for(self, api_version, kind):
+        """(plural, namespaced) del kind en ese apiVersion, vía discovery (cacheada)."""
+        with self._discovery_lock:
+            if api_version not in self._resources:
+                base = '/api/v1' if api_version == 'v1' else f'/apis/{api_version}'
+                try:
+                    listing = self.get(base)
+                except KubeError as e:
+                    # Grupo de un CRD recién creado que el API server aún no sirve
+                    if e.status == 404:
+                        raise UnknownKindError(f"Tipo desconocido {api_version}/{kind} (grupo aún no servido)",
+                                               status=404)
+                    raise
+                self._resources[api_version] = {
+                    r['kind']: (r['name'], r.get('namespaced', False))
+                    for r in listing.get('resources', []) if '/' not in r['name']
+                }
+            found = self._resources[api_version].get(kind)
+            if found is None:
+                # Puede ser un CRD recién creado: olvidar la discovery de ese grupo
+                self._resources.pop(api_version, None)
+                raise UnknownKindError(f"Tipo desconocido {api_version}/{kind}")
+            return found
+
+    def object_path(self, obj, namespace='default'):
+        api_version, kind = obj['apiVersion'], obj['kind']
+        plural, namespaced = self._resource_for(api_version, kind)
+        base = '/api/v1' if api_version == 'v1' else f'/apis/{api_version}'
+        ns = obj['metadata'].get('namespace', namespace)
+        prefix = f"{base}/namespaces/{ns}" if namespaced else base
+        return f"{prefix}/{plural}/{obj['metadata']['name']}"
+
+    def apply_object(self, obj, namespace='default'):
+        """Server-side apply de un objeto (crea o actualiza, idempotente)."""
+        path = self.object_path(obj, namespace)
+        return self.request(
+            'PATCH', path, timeout=30,
+            params={'fieldManager': FIELD_MANAGER, 'force': 'true'},
+            data=json.dumps(obj),
+            headers={'Content-Type': 'application/apply-patch+yaml'},
+        )
+
+    def apply(self, manifest, namespace='default', max_workers=8):
+        """Aplica un manifiesto (texto YAML multi-documento o lista de objetos) en bloque.
+
+        Devuelve el número de objetos aplicados; lanza KubeError con el primer fallo.
+        """
+        objects = load_objects(manifest) if isinstance(manifest, str) else list(manifest)
+        first = [o for o in objects if o['kind'] in FIRST_KINDS]
+        rest = [o for o in objects if o['kind'] not in FIRST_KINDS]
+
+        for obj in first:
+            self.apply_object(obj, namespace)
+        if any(o['kind'] == 'CustomResourceDefinition' for o in first):
+            # Los nuevos tipos tardan un instante en aparecer en la discovery
+            self._resources.clear()
+        run_parallel(rest, lambda o: self._apply_retrying(o, namespace), max_workers=max_workers)
+        return len(objects)
+
+    def _apply_retrying(self, obj, namespace, attempts=5):
+        for attempt in range(attempts):
+            try:
+                return self.apply_object(obj, namespace)
+            except UnknownKindError:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(1 + attempt)
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+    def nodes(self, timeout=DEFAULT_TIMEOUT):
+        """Nodos resumidos: nombre, Ready, versión de kubelet, IP interna y roles."""
+        summary = []
+        for item in self.get('/api/v1/nodes', timeout=timeout).get('items', []):
+            status = item.get('status', {})
+            ready = next((c.get('status') == 'True' for c in status.get('conditions', [])
+                          if c.get('type') == 'Ready'), False)
+            internal_ip = next((a['address'] for a in status.get('addresses', [])
+                                if a.get('type') == 'InternalIP'), None)
+            labels = item.get('metadata', {}).get('labels', {})
+            roles = sorted(k.split('/', 1)[1] for k in labels if k.startswith('node-role.kubernetes.io/'))
+            summary.append({
+                'name': item['metadata']['name'],
+                'ready': ready,
+                'version': status.get('nodeInfo', {}).get('kubeletVersion'),
+                'ip': internal_ip,
+                'roles': roles,
+            })
+        return summary
+
+    # ------------------------------------------------------------------
+    # Condiciones de readiness (devuelven un valor "verdadero" cuando se cumplen)
+    # ------------------------------------------------------------------
+    def api_ready(self):
+        return self.get('/readyz', timeout=3) == 'ok'
+
+    def deployment_ready(self, namespace, name):
+        dep = self.get(f'/apis/apps/v1/namespaces/{namespace}/deployments/{name}')
+        status = dep.get('status', {})
+        wanted = dep.get('spec', {}).get('replicas', 1)
+        return (status.get('observedGeneration', 0) >= dep['metadata'].get('generation', 0)
+                and status.get('readyReplicas', 0) >= wanted
+                and status.get('updatedReplicas', 0) >= wanted)
+
+    def endpoints_ready(self, namespace, name):
+        """True si el Service tiene al menos un endpoint listo (p.ej. un webhook)."""
+        ep = self.get(f'/api/v1/namespaces/{namespace}/endpoints/{name}')
+        return any(subset.get('addresses') for subset in ep.get('subsets') or [])
+
+    def service_ingress(self, namespace, name):
+        """IP (o hostname) asignada por el LoadBalancer, o None."""
+        svc = self.get(f'/api/v1/namespaces/{namespace}/services/{name}')
+        for ingress in svc.get('status', {}).get('loadBalancer', {}).get('ingress') or []:
+            return ingress.get('ip') or ingress.get('hostname')
+        return None
+
+
+def load_objects(text):
+    """Documentos de un YAML multi-documento (expande `kind: List`)."""
+    objects = []
+    for doc in yaml.safe_load_all(text):
+        if not doc:
+            continue
+        if doc.get('kind') == 'List':
+            objects.extend(doc.get('items', []))
+        else:
+            objects.append(doc)
+    return objects
+
+
+def _gate_done(name, start, value, timeout=None, last_error=None):
+    gate = Gate(name, bool(value), time.monotonic() - start, value)
+    if gate.ok:
+        log.info(f"   ⏱️  {name}: listo en {gate.elapsed:.1f}s")
+    else:
+        log.error(f"   ⏰ {name}: no estuvo listo en {timeout}s{f' ({last_error})' if last_error else ''}")
+    tracer.record(f"gate {name}", 'gate', start, gate.elapsed, ok=gate.ok)
+    return gate
+
+
+def watch_until(name, client, path, predicate, timeout=300, params=None):
+    """Como wait_until, pero reaccionando a los eventos de un watch en vez de sondear."""
+    start = time.monotonic()
+    deadline = start + timeout
+    last_error = None
+    while time.monotonic() < deadline:
+        remaining = max(1, int(deadline - time.monotonic()))
+        try:
+            for _, obj in client.watch(path, params=params, timeout=remaining):
+                value = predicate(obj)
+                if value:
+                    return _gate_done(name, start, value)
+        except KubeError as e:
+            last_error = e
+            time.sleep(1)
+    return _gate_done(name, start, None, timeout, last_error)
+
+
+def wait_until(name, check, timeout=300, interval=1.0, max_interval=5.0):
+    """Sondea check() hasta que devuelve algo verdadero o vence el deadline.
+
+    Los errores de la API (aún arrancando, recurso todavía no creado...) cuentan
+    como "no listo". Devuelve un Gate con lo que tardó realmente.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    last_error = None
+    while True:
+        try:
+            value = check()
+            if value:
+                return _gate_done(name, start, value)
+        except KubeError as e:
+            last_error = e
+        if time.monotonic() >= deadline:
+            return _gate_done(name, start, None, timeout, last_error)
+        time.sleep(interval)
+        interval = min(max_interval, interval * 1.5)
@@ -0,0 +1,250 @@
+"""
+Logger compartido por los módulos de lib/ y las acciones del menú.
+
+La consola se escribe al momento; los ficheros de la ejecución se escriben
+desde un único hilo (QueueHandler -> QueueListener), de modo que los hilos que
+crean/borran VMs en paralelo nunca esperan al disco. `setup_run_logging()`
+activa por proceso:
+
+- logs/<prefix>_<run>.log    log humano de la ejecución (con campos de contexto)
+- logs/<prefix>_<run>.jsonl  el mismo log, un objeto JSON por línea
+- <prefix>.log               log general acumulado, rotado por tamaño y comprimido (.gz)
+
+`run` es el id de correlación de la ejecución (timestamp YYYYMMDD_HHMMSS): es
+el mismo de `summary_<run>.json` y de las trazas `trace_<run>.jsonl`. Con
+`log_context(vmid=..., node=..., op=...)` cada línea emitida dentro del bloque
+lleva esos campos, así que las líneas de VMs en paralelo se pueden separar:
+
+    grep 'vmid=3001' logs/vm_creation_20260115_153045.log
+    jq 'select(.vmid == 3001)' logs/vm_creation_20260115_153045.jsonl
+
+Los ficheros de ejecuciones anteriores se comprimen pasados
+`logging.compress_after_days` y se borran pasados `logging.keep_days`.
+"""
+import atexit
+import contextvars
+import glob
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+log = logging.getLogger('proxmox_vm_creator')
+
+DEFAULTS = {
+    'level': 'INFO',
+    'dir': 'logs',
+    'json': True,               # logs/<prefix>_<run>.jsonl
+    'max_bytes': 10 * 1024 * 1024,  # rotación del log general
+    'backups': 5,
+    'compress_after_days': 1,   # comprimir logs de ejecuciones anteriores (0 = no)
+    'keep_days': 30,            # borrar logs y trazas comprimidos más antiguos (0 = nunca)
+}
+
+FILE_FORMAT = '%(asctime)s - %(levelname)s%(ctx_text)s - %(message)s'
+CONSOLE_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Escribe en el sys.stdout del momento (el modo headless lo redirige a stderr)."""
+
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, _):
+        pass
+
+
+if not log.handlers:
+    _handler = _StdoutHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    log.addHandler(_handler)
+    log.setLevel(logging.INFO)
+    # create_vm.py escribe por el root logger; evitar líneas duplicadas
+    log.propagate = False
+
+
+# ----------------------------------------------------------------------
+# Contexto por VM / tarea
+# ----------------------------------------------------------------------
+_context = contextvars.ContextVar('log_context', default={})
+
+
+@contextmanager
+def log_context(**fields):
+    """Añade campos (vmid, node, op, action...) a cada línea emitida en este hilo dentro del bloque."""
+    token = _context.set({**_context.get(), **{k: v for k, v in fields.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class _ContextFilter(logging.Filter):
+    """Copia id de ejecución y contexto al registro en el hilo que lo emite (antes de la cola)."""
+
+    def filter(self, record):
+        record.run = _run.get('id')
+        record.ctx = _context.get()
+        return True
+
+
+class _FileFormatter(logging.Formatter):
+    def format(self, record):
+        ctx = getattr(record, 'ctx', None) or {}
+        record.ctx_text = (' [' + ' '.join(f"{k}={v}" for k, v in ctx.items()) + ']') if ctx else ''
+        return super().format(record)
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'run': getattr(record, 'run', None),
+            'thread': record.threadName,
+            **(getattr(record, 'ctx', None) or {}),
+            'msg': record.getMessage().strip(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# ----------------------------------------------------------------------
+# Rotación y limpieza
+# ----------------------------------------------------------------------
+def _gzip_file(source, dest):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def _rotating_handler(path, max_bytes, backups):
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                   encoding='utf-8', delay=True)
+    handler.namer = lambda name: name + '.gz'
+    handler.rotator = _gzip_file
+    return handler
+
+
+def housekeeping(directory, compress_after_days, keep_days, current=()):
+    """Comprime logs/trazas de ejecuciones anteriores y borra los comprimidos caducados.
+
+    Los summary_*.json no se tocan (son el registro de cada ejecución).
+    """
+    now = time.time()
+    compressed = removed = 0
+    patterns = ('*.log', '*.jsonl', '*.chrome.json', '*.prof')
+    for pattern in patterns:
+        for path in glob.glob(os.path.join(directory, pattern)):
+            if path in current or not compress_after_days:
+                continue
+            if now - os.path.getmtime(path) > compress_after_days * 86400:
+                try:
+                    _gzip_file(path, path + '.gz')
+                    compressed += 1
+                except OSError:
+                    pass
+    if keep_days:
+        for path in glob.glob(os.path.join(directory, '*.gz')):
+            if now - os.path.getmtime(path) > keep_days * 86400:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+    return compressed, removed
+
+
+# ----------------------------------------------------------------------
+# Ejecución
+# ----------------------------------------------------------------------
+_run = {}
+_run_lock = threading.Lock()
+
+
+def run_id():
+    """Id de correlación de la ejecución en curso (None si no hay logs de ejecución)."""
+    return _run.get('id')
+
+
+def run_files():
+    return dict(_run.get('files', {}))
+
+
+def setup_run_logging(prefix='vm_creation', settings=None, run=None):
+    """Activa los logs a fichero de esta ejecución (una vez por proceso). Devuelve el id de ejecución."""
+    with _run_lock:
+        if _run.get('id'):
+            return _run['id']
+        settings = dict(DEFAULTS, **(settings or {}))
+        run = run or datetime.now().strftime('%Y%m%d_%H%M%S')
+        directory = settings['dir']
+        os.makedirs(directory, exist_ok=True)
+
+        files = {'log': os.path.join(directory, f"{prefix}_{run}.log"), 'general': f"{prefix}.log"}
+        human = logging.FileHandler(files['log'], encoding='utf-8')
+        human.setFormatter(_FileFormatter(FILE_FORMAT))
+        general = _rotating_handler(files['general'], int(settings['max_bytes']), int(settings['backups']))
+        general.setFormatter(_FileFormatter(FILE_FORMAT))
+        handlers = [human, general]
+        if settings['json']:
+            files['jsonl'] = os.path.join(directory, f"{prefix}_{run}.jsonl")
+            structured = logging.FileHandler(files['jsonl'], encoding='utf-8')
+            structured.setFormatter(_JsonFormatter())
+            handlers.append(structured)
+
+        housekeeping(directory, float(settings['compress_after_days']), float(settings['keep_days']),
+                     current=set(files.values()))
+
+        # Los hilos encolan; un único hilo del listener escribe en disco
+        records = queue.SimpleQueue()
+        to_files = logging.handlers.QueueHandler(records)
+        to_files.addFilter(_ContextFilter())
+        listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+        listener.start()
+        atexit.register(stop_run_logging)
+
+        level = getattr(logging, str(settings['level']).upper(), logging.INFO)
+        root = logging.getLogger()
+        root.setLevel(level)
+        if not any(isinstance(h, _StdoutHandler) for h in root.handlers):
+            console = _StdoutHandler()
+            console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+            root.addHandler(console)
+        root.addHandler(to_files)
+        log.setLevel(level)
+        log.addHandler(to_files)
+
+        _run.update(id=run, files=files, listener=listener, handler=to_files)
+        return run
+
+
+def stop_run_logging():
+    """Vacía la cola y cierra los ficheros de la ejecución."""
+    with _run_lock:
+        listener = _run.pop('listener', None)
+        handler = _run.pop('handler', None)
+        if listener is None:
+            return
+        listener.stop()
+        for handler_ in listener.handlers:
+            handler_.close()
+        logging.getLogger().removeHandler(handler)
+        log.removeHandler(handler)
+        _run.clear()
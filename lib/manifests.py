@@ -0,0 +1,189 @@
+"""
+Caché local de manifiestos Kubernetes (kube-vip, MetalLB) y renderizado en Python.
+
+Cada manifiesto fijado (URL + versión) se descarga una sola vez y se guarda
+por contenido (`blobs/<sha256>.yaml`), con un índice `URL+versión -> sha256`.
+Las siguientes ejecuciones no tocan la red y, si el manifiesto fija un
+sha256, el contenido se verifica. En modo offline sólo se usan la caché y un
+directorio de ficheros pre-sembrados (`<nombre>.yaml` o `<nombre>-<versión>.yaml`).
+
+Las plantillas de kube-vip (RBAC y DaemonSet) van en el repo
+(`lib/k3s_manifests/`): no dependen de ninguna rama que se mueva y la versión
+sólo cambia el tag de la imagen. Las URLs remotas deben llevar `{version}` o
+fijar `sha256`.
+"""
+import hashlib
+import json
+import os
+import re
+
+import requests
+
+from lib.config import CACHE_DIR
+from lib.logger import log
+
+BUNDLED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'k3s_manifests')
+
+# Manifiestos conocidos: 'file' = plantilla del repo (BUNDLED_DIR), 'url' = descarga
+# ({version} se sustituye en la URL).
+MANIFESTS = {
+    'kube-vip-rbac': {
+        'file': 'kube-vip-rbac.yaml',
+        'version': 'v0.8.6',
+    },
+    'kube-vip': {
+        'file': 'kube-vip.yaml',
+        'version': 'v0.8.6',
+    },
+    'metallb-native': {
+        'url': 'https://raw.githubusercontent.com/metallb/metallb/{version}/config/manifests/metallb-native.yaml',
+        'version': 'v0.14.9',
+    },
+}
+
+
+class ManifestError(Exception):
+    pass
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ManifestStore:
+    def __init__(self, overrides=None, offline=False, seed_dir=None, cache_dir=None):
+        self.cache_dir = cache_dir or os.path.join(CACHE_DIR, 'manifests')
+        self.offline = offline
+        self.seed_dir = os.path.expanduser(seed_dir) if seed_dir else None
+        self.manifests = {name: dict(spec) for name, spec in MANIFESTS.items()}
+        for name, spec in (overrides or {}).items():
+            manifest = self.manifests.setdefault(name, {})
+            if 'url' in spec:
+                manifest.pop('file', None)
+            manifest.update(spec)
+        self._index_path = os.path.join(self.cache_dir, 'index.json')
+
+    @classmethod
+    def from_k3s_config(cls, k3s_cfg):
+        overrides = dict(k3s_cfg.get('manifests') or {})
+        # Atajos de versión en la sección k3s
+        for name, key in (('kube-vip', 'kube_vip_version'), ('kube-vip-rbac', 'kube_vip_version'),
+                          ('metallb-native', 'metallb_version')):
+            if k3s_cfg.get(key):
+                overrides.setdefault(name, {}).setdefault('version', k3s_cfg[key])
+        return cls(overrides, offline=bool(k3s_cfg.get('offline', False)),
+                   seed_dir=k3s_cfg.get('manifests_dir'))
+
+    # ------------------------------------------------------------------
+    # Índice y blobs
+    # ------------------------------------------------------------------
+    def _load_index(self):
+        try:
+            with open(self._index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_atomic(self, path, text):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.cache_dir, 'blobs', f"{digest}.yaml")
+
+    def _key(self, spec):
+        return f"{spec['url']}@{spec.get('version', '')}"
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def url(self, name):
+        """URL de descarga del manifiesto, o None si es una plantilla del repo."""
+        spec = self.manifests[name]
+        if 'url' not in spec:
+            return None
+        return spec['url'].format(version=spec.get('version', ''))
+
+    def fetch(self, name):
+        """Texto del manifiesto: semilla -> plantilla del repo, o caché -> semilla -> red (una sola vez)."""
+        if name not in self.manifests:
+            raise ManifestError(f"Manifiesto desconocido: {name}")
+        spec = self.manifests[name]
+        pinned = spec.get('sha256')
+        if 'url' not in spec:
+            return self._bundled(name, spec, pinned)
+
+        if '{version}' not in spec['url'] and not pinned:
+            log.warning(f"⚠️ La URL de {name} no fija versión ni sha256: el contenido puede cambiar entre despliegues")
+        spec = dict(spec, url=self.url(name))
+        key = self._key(spec)
+
+        index = self._load_index()
+        digest = index.get(key)
+        if digest and os.path.exists(self._blob_path(digest)):
+            with open(self._blob_path(digest)) as f:
+                text = f.read()
+            if _sha256(text) == digest and (not pinned or pinned == digest):
+                return text
+            log.warning(f"⚠️ Manifiesto {name} en caché corrupto o con otro sha256, se descarta")
+
+        text = self._from_seed(name, spec.get('version'))
+        if text is None:
+            if self.offline:
+                raise ManifestError(f"Modo offline: {name} ({spec.get('version')}) no está en caché ni en "
+                                    f"{self.seed_dir or 'manifests_dir'}")
+            log.info(f"   ⬇️  Descargando manifiesto {name} ({spec.get('version')})...")
+            try:
+                resp = requests.get(spec['url'], timeout=30)
+                resp.raise_for_status()
+            except requests.RequestException as e:
+                raise ManifestError(f"No se pudo descargar {name}: {e}")
+            text = resp.text
+
+        digest = _sha256(text)
+        if pinned and pinned != digest:
+            raise ManifestError(f"sha256 de {name} no coincide: esperado {pinned}, obtenido {digest}")
+
+        self._write_atomic(self._blob_path(digest), text)
+        index = self._load_index()
+        index[key] = digest
+        self._write_atomic(self._index_path, json.dumps(index, indent=2, sort_keys=True))
+        return text
+
+    def _bundled(self, name, spec, pinned):
+        text = self._from_seed(name, spec.get('version'))
+        if text is None:
+            path = os.path.join(BUNDLED_DIR, spec['file'])
+            try:
+                with open(path) as f:
+                    text = f.read()
+            except OSError as e:
+                raise ManifestError(f"No se pudo leer la plantilla {name}: {e}")
+        if pinned and pinned != _sha256(text):
+            raise ManifestError(f"sha256 de {name} no coincide: esperado {pinned}, obtenido {_sha256(text)}")
+        return text
+
+    def _from_seed(self, name, version):
+        if not self.seed_dir:
+            return None
+        for filename in (f"{name}-{version}.yaml", f"{name}.yaml", name):
+            path = os.path.join(self.seed_dir, filename)
+            if os.path.isfile(path):
+                with open(path) as f:
+                    return f.read()
+        return None
+
+    def render(self, name, **variables):
+        """Manifiesto con las variables `$var` sustituidas (equivalente al antiguo sed)."""
+        text = self.fetch(name)
+        for var, value in variables.items():
+            text = text.replace(f"${var}", str(value))
+        return text
+
+
+def set_image_tag(text, image, tag):
+    """'ghcr.io/kube-vip/kube-vip:v0.8.2' -> ':<tag>' para la imagen dada."""
+    return re.sub(rf"({re.escape(image)}):v[0-9][\w.\-]*", rf"\g<1>:{tag}", text)
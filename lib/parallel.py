@@ -0,0 +1,79 @@
+"""
+Ejecución concurrente con límites por clave (nodo, storage, ...).
+
+Las operaciones masivas sobre Proxmox se pueden lanzar en paralelo salvo
+cuando comparten un recurso que Proxmox bloquea (p.ej. el mismo storage en
+el mismo nodo). `run_parallel` sólo despacha un elemento cuando todas sus
+claves tienen capacidad libre, de modo que los hilos del pool nunca quedan
+bloqueados esperando un lock y los elementos de otros nodos siguen avanzando.
+Cada elemento corre con una copia del contexto del llamante (p.ej. los campos
+de `log_context`), igual que si se ejecutara en el mismo hilo.
+"""
+import contextvars
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def run_parallel(items, fn, max_workers=4, limits=()):
+    """Ejecuta fn(item) para cada elemento y devuelve los resultados en orden.
+
+    limits: secuencia de (key_fn, max_concurrentes). Dos elementos con la misma
+    key_fn(item) no superan nunca max_concurrentes ejecuciones simultáneas.
+    Si alguna llamada lanza una excepción, el resto se completa igualmente y
+    se relanza la primera al final.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    if not items:
+        return results
+
+    max_workers = max(1, int(max_workers or 1))
+    item_keys = [[key_fn(item) for key_fn, _ in limits] for item in items]
+    busy = [defaultdict(int) for _ in limits]
+    pending = list(range(len(items)))
+    errors = []
+
+    def has_capacity(i):
+        return all(busy[j][key] < cap for j, (key, (_, cap)) in enumerate(zip(item_keys[i], limits)))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = {}
+        while pending or running:
+            for i in list(pending):
+                if len(running) >= max_workers:
+                    break
+                if not has_capacity(i):
+                    continue
+                pending.remove(i)
+                for j, key in enumerate(item_keys[i]):
+                    busy[j][key] += 1
+                running[pool.submit(contextvars.copy_context().run, fn, items[i])] = i
+
+            if not running:
+                # Ningún límite puede satisfacerse (cap <= 0): evitar bucle infinito
+                raise ValueError("Límites de concurrencia inválidos: ningún elemento puede ejecutarse")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                for j, key in enumerate(item_keys[i]):
+                    busy[j][key] -= 1
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    errors.append(e)
+
+    if errors:
+        raise errors[0]
+    return results
+
+
+def bulk_limits(config, parallel=None, per_node=None):
+    """(máx. simultáneas, máx. por nodo) de las operaciones masivas (execution.bulk_*).
+
+    Los argumentos explícitos (flags de línea de comandos) mandan sobre config.yaml.
+    """
+    exec_cfg = config.get('execution', {}) or {}
+    parallel = int(parallel or exec_cfg.get('bulk_parallel', 16))
+    per_node = int(per_node or exec_cfg.get('bulk_per_node', 4))
+    return max(1, parallel), max(1, per_node)
@@ -0,0 +1,326 @@
+"""
+Cambios de configuración en lote sobre muchas VMs.
+
+Los scripts declaran qué quieren cambiar (quitar el drive cloud-init, fijar
+`cicustom`, añadir `ssd=1` a un disco, crecer un disco...) y el motor, por VM:
+
+1. lee la config una vez y calcula sólo lo que falta (re-ejecutar no cambia nada)
+2. junta todos los cambios en un único `config` POST con el `digest` leído; si
+   otro proceso cambió la config entretanto, Proxmox lo rechaza y se reintenta
+   con la config nueva en vez de pisarla
+3. crece los discos (`resize`, en caliente)
+4. si la VM está encendida, consulta `pending`: sólo las VMs con algún cambio
+   pendiente (los que Proxmox aplica en caliente, como `name` o `tags`, no lo
+   necesitan) se reinician, como mucho una vez
+
+Las VMs se parchean en paralelo con un máximo por nodo (ver lib/parallel.py).
+Los reinicios van después, por olas del planificador de lib/restarts.py:
+masters de uno en uno y workers en olas, esperando a que cada ola esté lista.
+
+    engine = PatchEngine(client, cfg.data)
+    results = engine.apply(targets, [DropCloudInit(), DriveOption('scsi0', ssd=1)])
+"""
+import re
+import time
+
+from lib.logger import log, log_context
+from lib.parallel import bulk_limits, run_parallel
+from lib.restarts import RestartPlanner, vm_addresses
+from lib.tracing import span
+
+DEFAULTS = {
+    'retries': 3,           # reintentos si la config cambió entre lectura y escritura (digest)
+    'timeout': 600,         # segundos por tarea de config/resize
+}
+
+_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+_SIZE = re.compile(r'^\+?(\d+(?:\.\d+)?)([KMGT]?)$', re.IGNORECASE)
+_DRIVE_KEY = re.compile(r'^(ide|sata|scsi|virtio)\d+$')
+
+
+def patch_settings(config):
+    """Sección `patches:` de config.yaml con sus valores por defecto."""
+    return dict(DEFAULTS, **(config.get('patches') or {}))
+
+
+def size_bytes(text):
+    """'200G' -> bytes ('+10G' -> el incremento)."""
+    match = _SIZE.match(str(text).strip())
+    if not match:
+        raise ValueError(f"Tamaño inválido: '{text}'")
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+
+def split_drive(value):
+    """'local-lvm:vm-1-disk-0,ssd=1,size=32G' -> ('local-lvm:vm-1-disk-0', {'ssd': '1', 'size': '32G'})"""
+    parts = str(value).split(',')
+    return parts[0], dict(p.split('=', 1) for p in parts[1:] if '=' in p)
+
+
+def join_drive(volume, options):
+    return ','.join([volume] + [f"{k}={v}" for k, v in options.items()])
+
+
+# ----------------------------------------------------------------------
+# Cambios declarados
+# ----------------------------------------------------------------------
+# Cada cambio recibe la config actual (con lo ya planificado por los cambios
+# anteriores) y devuelve (updates, deletes, resizes) con lo que falta.
+
+class DropCloudInit:
+    """Quita el drive cloud-init (ide2/scsi1... con 'cloudinit' en el volumen)."""
+
+    def plan(self, config):
+        return {}, [key for key, value in config.items()
+                    if _DRIVE_KEY.match(key) and 'cloudinit' in str(value)], []
+
+    def __repr__(self):
+        return 'DropCloudInit()'
+
+
+class Set:
+    """Fija opciones de la VM: Set(cicustom='vendor=...', vga='std')."""
+
+    def __init__(self, **options):
+        self.options = options
+
+    def plan(self, config):
+        return {k: v for k, v in self.options.items() if str(config.get(k)) != str(v)}, [], []
+
+    def __repr__(self):
+        return f"Set({', '.join(f'{k}={v!r}' for k, v in self.options.items())})"
+
+
+class DriveOption:
+    """Fija opciones de un disco existente: DriveOption('scsi0', ssd=1, discard='on')."""
+
+    def __init__(self, disk, **options):
+        self.disk = disk
+        self.options = {k: str(v) for k, v in options.items()}
+
+    def plan(self, config):
+        if self.disk not in config:
+            raise ValueError(f"la VM no tiene el disco {self.disk}")
+        volume, current = split_drive(config[self.disk])
+        if all(current.get(k) == v for k, v in self.options.items()):
+            return {}, [], []
+        return {self.disk: join_drive(volume, dict(current, **self.options))}, [], []
+
+    def __repr__(self):
+        return f"DriveOption({self.disk!r}, {', '.join(f'{k}={v}' for k, v in self.options.items())})"
+
+
+class Resize:
+    """Crece un disco hasta `size` ('200G') o en `size` ('+10G'). Nunca encoge."""
+
+    def __init__(self, disk, size):
+        self.disk = disk
+        self.size = str(size)
+
+    def plan(self, config):
+        if self.disk not in config:
+            raise ValueError(f"la VM no tiene el disco {self.disk}")
+        if self.size.startswith('+'):
+            return {}, [], [(self.disk, self.size)]
+        _, options = split_drive(config[self.disk])
+        current = size_bytes(options.get('size', '0'))
+        return {}, [], [(self.disk, self.size)] if size_bytes(self.size) > current else []
+
+    def __repr__(self):
+        return f"Resize({self.disk!r}, {self.size!r})"
+
+
+def merge(changes, config):
+    """Junta los cambios sobre `config` en un solo (updates, deletes, resizes)."""
+    working = dict(config)
+    updates, deletes, resizes = {}, [], []
+    for change in changes:
+        change_updates, change_deletes, change_resizes = change.plan(working)
+        for key, value in change_updates.items():
+            working[key] = updates[key] = value
+            if key in deletes:
+                deletes.remove(key)
+        for key in change_deletes:
+            working.pop(key, None)
+            updates.pop(key, None)
+            if key in config and key not in deletes:
+                deletes.append(key)
+        resizes.extend(change_resizes)
+    return updates, deletes, resizes
+
+
+def describe(updates, deletes, resizes):
+    parts = [f"{k}={v}" for k, v in updates.items()] + [f"-{k}" for k in deletes]
+    return parts + [f"{disk} -> {size}" for disk, size in resizes]
+
+
+def _modified(error):
+    return 'detected modified configuration' in str(error)
+
+
+class PatchEngine:
+    def __init__(self, client, config, parallel=None, per_node=None, timeout=None):
+        self.client = client
+        self.config = config
+        self.settings = patch_settings(config)
+        self.parallel, self.per_node = bulk_limits(config, parallel, per_node)
+        self.timeout = int(timeout or self.settings['timeout'])
+
+    def _wait(self, node, upid, timeout=None):
+        return self.client.tasks.wait(node, upid, timeout=timeout or self.timeout)
+
+    def _limits(self):
+        return [(lambda vm: vm['node'], self.per_node)]
+
+    # ------------------------------------------------------------------
+    # Config
+    # ------------------------------------------------------------------
+    def _write(self, vm, changes, result):
+        """Lectura + un único POST con digest (reintenta si la config cambió). Devuelve los resizes."""
+        api = self.client.get_vm(vm['node'], vm['vmid'])
+        retries = max(1, int(self.settings['retries']))
+        for attempt in range(1, retries + 1):
+            config = api.config.get()
+            updates, deletes, resizes = merge(changes, config)
+            result['changes'] = describe(updates, deletes, resizes)
+            result['touched'] = list(updates) + deletes
+            if not updates and not deletes:
+                return resizes
+            params = dict(updates, digest=config.get('digest'))
+            if deletes:
+                params['delete'] = ','.join(deletes)
+            try:
+                upid = api.config.post(**params)
+            except Exception as e:
+                if _modified(e) and attempt < retries:
+                    log.debug(f"VM {vm['vmid']}: config modificada por otro proceso, reintentando ({attempt})")
+                    continue
+                raise
+            if upid:
+                task = self._wait(vm['node'], upid)
+                if not task.ok:
+                    raise RuntimeError(f"config: {task.exitstatus}")
+            return resizes
+        return []
+
+    def _resize(self, vm, resizes):
+        api = self.client.get_vm(vm['node'], vm['vmid'])
+        for disk, size in resizes:
+            upid = api.resize.put(disk=disk, size=size)
+            # PVE >= 8 devuelve una tarea; antes el resize era síncrono
+            if upid:
+                task = self._wait(vm['node'], upid)
+                if not task.ok:
+                    raise RuntimeError(f"resize {disk}: {task.exitstatus}")
+
+    def _pending(self, vm, keys):
+        """Opciones de `keys` que Proxmox dejó pendientes del próximo arranque."""
+        if not keys:
+            return []
+        entries = self.client.get_vm(vm['node'], vm['vmid']).pending.get()
+        return [e['key'] for e in entries if e['key'] in keys and ('pending' in e or e.get('delete'))]
+
+    # ------------------------------------------------------------------
+    # Reinicio
+    # ------------------------------------------------------------------
+    def restart(self, results):
+        """Reinicia por olas (masters de uno en uno) las VMs de `results` que quedaron con cambios pendientes."""
+        todo = {r['vmid']: r for r in results if r['ok'] and r['pending'] and not r['restarted']}
+        if not todo:
+            return results
+        inventory = self.client.inventory.refresh()
+        targets = []
+        for vmid, result in todo.items():
+            vm = inventory.get(vmid)
+            if vm is None:
+                result.update(ok=False, detail=f"{result['detail']}, no está en el inventario para reiniciar")
+            else:
+                targets.append(vm)
+
+        planner = RestartPlanner(self.client, self.config, parallel=self.parallel, per_node=self.per_node,
+                                 addresses=vm_addresses(self.client.cfg.vms))
+        for restarted in planner.restart(targets):
+            result = todo[restarted['vmid']]
+            result['elapsed'] += restarted['elapsed']
+            result['detail'] += f", {restarted['detail']}"
+            if not restarted['ok']:
+                result['ok'] = False
+                continue
+            # Reiniciada, o ya sin pending (p.ej. otro proceso la reinició entretanto)
+            result['pending'] = []
+            result['restarted'] = restarted['wave'] is not None
+        return results
+
+    # ------------------------------------------------------------------
+    # Aplicar
+    # ------------------------------------------------------------------
+    def apply(self, targets, changes, restart=True, dry_run=False):
+        """Aplica los cambios a las VMs del inventario `targets`, en paralelo.
+
+        changes: lista de cambios o función vm -> lista (cambios distintos por VM).
+        restart=True reinicia al final, por olas, las VMs con cambios pendientes; restart=False
+        los deja pendientes para llamar después a `restart()`.
+
+        Devuelve una lista de resultados por VM (vmid, name, node, ok, elapsed, detail,
+        changes, pending, restarted).
+        """
+        def patch_one(vm):
+            start = time.monotonic()
+            result = dict(vmid=vm['vmid'], name=vm.get('name'), node=vm['node'], ok=False, detail='',
+                          changes=[], pending=[], restarted=False)
+            running = vm.get('status') == 'running'
+            with span(f"patch {vm['vmid']}", 'vm', node=vm['node']), \
+                    log_context(vmid=vm['vmid'], node=vm['node'], op='patch'):
+                try:
+                    vm_changes = changes(vm) if callable(changes) else changes
+                    if dry_run:
+                        config = self.client.get_vm(vm['node'], vm['vmid']).config.get()
+                        result['changes'] = describe(*merge(vm_changes, config))
+                        result.update(ok=True, detail='dry-run' if result['changes'] else 'sin cambios')
+                    else:
+                        resizes = self._write(vm, vm_changes, result)
+                        self._resize(vm, resizes)
+                        if running:
+                            result['pending'] = self._pending(vm, result['touched'])
+                        result['ok'] = True
+                        if not result['changes']:
+                            result['detail'] = 'sin cambios'
+                        elif result['pending']:
+                            result['detail'] = f"aplicado, pendiente: {', '.join(result['pending'])}"
+                        else:
+                            result['detail'] = 'aplicado'
+                except Exception as e:
+                    result['detail'] = str(e)
+                result.pop('touched', None)
+                result['elapsed'] = time.monotonic() - start
+            return result
+
+        results = run_parallel(targets, patch_one, max_workers=self.parallel, limits=self._limits())
+        if restart and not dry_run:
+            self.restart(results)
+        return results
+
+
+def report(results, total):
+    """Tabla final de los scripts de parches: una línea por VM y el resumen."""
+    for r in results:
+        icon = '✅' if r['ok'] else '❌'
+        if r['ok'] and not r['changes']:
+            icon = '⚪'
+        changes = f" [{', '.join(r['changes'])}]" if r['changes'] else ''
+        log.info(f"  {icon} VM {r['vmid']} ({r['name']}) en {r['node']}: {r['detail']}{changes} ({r['elapsed']:.1f}s)")
+
+    failed = [r for r in results if not r['ok']]
+    pending = [r for r in results if r['ok'] and r['pending']]
+    log.info("\n" + "=" * 60)
+    log.info(f"✅ Correctas: {len(results) - len(failed)}   ❌ Fallidas: {len(failed)}   "
+             f"🔄 Reiniciadas: {sum(1 for r in results if r['restarted'])}")
+    if results:
+        log.info(f"⏱️  Total: {total:.1f}s (VM más lenta: {max(r['elapsed'] for r in results):.1f}s, "
+                 f"suma: {sum(r['elapsed'] for r in results):.1f}s)")
+    if pending:
+        log.info(f"⏳ {len(pending)} VM(s) con cambios pendientes del próximo arranque "
+                 f"(python restart_vms.py): {', '.join(str(r['vmid']) for r in pending)}")
+    for r in failed:
+        log.error(f"   • VM {r['vmid']} ({r['name']}) en {r['node']}: {r['detail']}")
+    log.info("=" * 60)
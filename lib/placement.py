@@ -0,0 +1,176 @@
+"""
+Colocación automática de VMs (`node: auto` o sin `node`).
+
+Con un único `cluster/resources` se obtiene la capacidad de cada nodo
+(memoria y CPUs ya comprometidas por sus VMs) y de cada storage. Las VMs se
+ordenan de mayor a menor (first-fit decreasing) y cada una va al nodo válido
+con mejor puntuación:
+
+- pack   (default) el nodo que queda más lleno tras colocarla (bin-packing)
+- spread el nodo que queda más vacío
+
+Anti-afinidad por rol: dos VMs con el mismo tag de `placement.anti_affinity`
+(por defecto `master`) nunca comparten nodo, contando también las que ya
+existen en el cluster. Las VMs que ya existen conservan su nodo.
+"""
+from lib.inventory import split_tags
+from lib.logger import log
+
+AUTO = 'auto'
+GB = 1024 ** 3
+MB = 1024 ** 2
+
+
+def needs_placement(spec):
+    return not spec.node or str(spec.node).lower() == AUTO
+
+
+def _roles(tags, name, roles):
+    found = split_tags(tags) & roles
+    # Misma convención que K3sManager: 'master' en el nombre también cuenta
+    found.update(r for r in roles if r in (name or ''))
+    return found
+
+
+class NodeCapacity:
+    __slots__ = ('node', 'mem_total', 'mem_used', 'cpu_total', 'cpu_used', 'storage_free', 'shared_free', 'roles')
+
+    def __init__(self, node, mem_total, cpu_total, shared_free):
+        self.node = node
+        self.mem_total = mem_total
+        self.mem_used = 0
+        self.cpu_total = cpu_total
+        self.cpu_used = 0
+        # storage -> espacio libre; None = storage compartido (el espacio está en shared_free)
+        self.storage_free = {}
+        # Los storages compartidos (NFS, Ceph...) descuentan espacio para todos los nodos
+        self.shared_free = shared_free
+        self.roles = set()
+
+    def _pool(self, storage):
+        return self.shared_free if self.storage_free.get(storage, 0) is None else self.storage_free
+
+    def fits(self, mem, cpu, storage, disk):
+        if storage not in self.storage_free:
+            return False
+        return (self.mem_used + mem <= self.mem_total
+                and self.cpu_used + cpu <= self.cpu_total
+                and self._pool(storage).get(storage, 0) >= disk)
+
+    def load_after(self, mem, cpu):
+        """Fracción de uso (memoria o CPU, la mayor) tras colocar la VM."""
+        return max((self.mem_used + mem) / self.mem_total, (self.cpu_used + cpu) / self.cpu_total)
+
+    def take(self, mem, cpu, storage, disk, roles):
+        self.mem_used += mem
+        self.cpu_used += cpu
+        if storage:
+            pool = self._pool(storage)
+            pool[storage] = pool.get(storage, 0) - disk
+        self.roles.update(roles)
+
+
+class Scheduler:
+    def __init__(self, proxmox, config):
+        self.proxmox = proxmox
+        placement = config.get('placement', {}) or {}
+        self.strategy = placement.get('strategy', 'pack')
+        self.allowed = set(placement.get('nodes') or [])
+        self.roles = set(placement.get('anti_affinity', ['master']))
+        self.cpu_ratio = float(placement.get('cpu_overcommit', 4))
+        self.mem_ratio = float(placement.get('memory_overcommit', 1))
+        self.reserve_mb = int(placement.get('reserve_memory_mb', 2048))
+
+    def capacity(self):
+        """{nodo: NodeCapacity} y {vmid: recurso} a partir de un cluster/resources."""
+        resources = self.proxmox.cluster.resources.get()
+        nodes, vms, shared_free = {}, {}, {}
+        for r in resources:
+            if r.get('type') == 'node' and r.get('status') == 'online' and r.get('maxmem') and r.get('maxcpu'):
+                if self.allowed and r['node'] not in self.allowed:
+                    continue
+                mem_total = r.get('maxmem', 0) * self.mem_ratio - self.reserve_mb * MB
+                nodes[r['node']] = NodeCapacity(r['node'], mem_total, r.get('maxcpu', 0) * self.cpu_ratio,
+                                                shared_free)
+
+        for r in resources:
+            node = nodes.get(r.get('node'))
+            if r.get('type') == 'qemu' and r.get('vmid') is not None:
+                vms[int(r['vmid'])] = r
+                if node and not r.get('template'):
+                    node.take(r.get('maxmem', 0), r.get('maxcpu', 0), None, 0,
+                              _roles(r.get('tags'), r.get('name'), self.roles))
+            elif r.get('type') == 'storage' and node and r.get('status', 'available') == 'available':
+                free = r.get('maxdisk', 0) - r.get('disk', 0)
+                if r.get('shared'):
+                    node.storage_free[r['storage']] = None
+                    shared_free[r['storage']] = free
+                else:
+                    node.storage_free[r['storage']] = free
+        return nodes, vms
+
+    def place(self, specs):
+        """Devuelve (specs con nodo asignado, {vmid: nodo}) para las VMs sin nodo."""
+        specs = list(specs)
+        auto = [i for i, s in enumerate(specs) if needs_placement(s)]
+        if not auto:
+            return tuple(specs), {}
+
+        nodes, existing = self.capacity()
+
+        # Las VMs con nodo fijo (que aún no existen) también consumen capacidad
+        for spec in specs:
+            node = nodes.get(spec.node)
+            if node and not needs_placement(spec) and spec.vmid not in existing:
+                node.take(spec.memory * MB, spec.cores, spec.storage, spec.disk_gb * GB,
+                          _roles(spec.tags, spec.name, self.roles))
+
+        # First-fit decreasing: primero las VMs grandes
+        auto.sort(key=lambda i: (specs[i].memory, specs[i].cores, specs[i].disk_gb), reverse=True)
+        placements = {}
+        for i in auto:
+            spec = specs[i]
+            current = existing.get(spec.vmid)
+            if current:
+                # Ya existe: se queda donde está
+                specs[i] = spec.with_node(current['node'])
+                placements[spec.vmid] = current['node']
+                continue
+
+            chosen = self._choose(nodes, spec)
+            if chosen is None:
+                error = f"Sin nodo con capacidad para {spec.memory}MB/{spec.cores} cores/{spec.disk_gb}G en {spec.storage}"
+                specs[i] = spec.with_node(None, error=error)
+                log.warning(f"⚠️ VM {spec.vmid} ({spec.name}): {error}")
+                continue
+
+            chosen.take(spec.memory * MB, spec.cores, spec.storage, spec.disk_gb * GB,
+                        _roles(spec.tags, spec.name, self.roles))
+            specs[i] = spec.with_node(chosen.node)
+            placements[spec.vmid] = chosen.node
+        return tuple(specs), placements
+
+    def _choose(self, nodes, spec):
+        mem, cpu, disk = spec.memory * MB, spec.cores, spec.disk_gb * GB
+        roles = _roles(spec.tags, spec.name, self.roles)
+        best, best_score = None, None
+        # Orden por nombre: a igual puntuación gana siempre el mismo nodo
+        for name in sorted(nodes):
+            node = nodes[name]
+            if roles & node.roles or not node.fits(mem, cpu, spec.storage, disk):
+                continue
+            score = node.load_after(mem, cpu)
+            if self.strategy == 'spread':
+                score = -score
+            if best is None or score > best_score:
+                best, best_score = node, score
+        return best
+
+
+def log_placements(specs, placements):
+    if not placements:
+        return
+    log.info(f"\n🧭 Colocación automática ({len(placements)} VM(s)):")
+    for spec in specs:
+        if spec.vmid in placements:
+            log.info(f"   • VM {spec.vmid} ({spec.name}) -> {placements[spec.vmid]}")
@@ -0,0 +1,156 @@
+"""
+Arranque, apagado y stop de muchas VMs a la vez.
+
+Cada VM se despacha en un hilo con un máximo por nodo (ver lib/parallel.py):
+se lanza la acción y se espera su tarea con el TaskWatcher compartido, que
+sigue todas las tareas del nodo con un solo listado por ciclo. Que la tarea
+termine bien es la transición de estado (qmstart OK = encendida, qmshutdown
+OK = apagada), así que no hace falta sondear el estado de cada VM ni dormir
+entre VMs. Encender 50 VMs tarda lo que la más lenta, no 50 × (petición + 2 s).
+
+Apagado: ACPI (`shutdown` con `timeout`); si el invitado no termina a tiempo y
+`force_stop` está activo, se escala a `stop`. Al final un único snapshot del
+inventario da el estado real de todas las VMs para la tabla.
+"""
+import time
+
+from lib.logger import log, log_context
+from lib.parallel import bulk_limits, run_parallel
+from lib.tracing import span
+
+DEFAULTS = {
+    'shutdown_timeout': 180,  # segundos de apagado ACPI antes de forzar stop
+    'force_stop': True,       # stop duro si el apagado ACPI no termina
+    'timeout': 300,           # segundos por tarea de start/stop
+}
+
+# Acción -> estado de la VM en el que no hay nada que hacer
+_DONE_WHEN = {'start': 'running', 'shutdown': 'stopped', 'stop': 'stopped'}
+
+
+def power_settings(config):
+    """Sección `power:` de config.yaml con sus valores por defecto."""
+    return dict(DEFAULTS, **(config.get('power') or {}))
+
+
+class PowerEngine:
+    def __init__(self, client, config, parallel=None, per_node=None):
+        self.client = client
+        self.settings = power_settings(config)
+        self.parallel, self.per_node = bulk_limits(config, parallel, per_node)
+
+    def _wait(self, node, upid, timeout=None):
+        return self.client.tasks.wait(node, upid, timeout=timeout or int(self.settings['timeout']))
+
+    # ------------------------------------------------------------------
+    # Una VM (también las usa lib/restarts.py)
+    # ------------------------------------------------------------------
+    def start_vm(self, vm, phases):
+        """Arranca la VM y espera la tarea. Devuelve (ok, detalle)."""
+        api = self.client.get_vm(vm['node'], vm['vmid'])
+        result = self._wait(vm['node'], api.status.start.post())
+        phases['start'] = result.elapsed
+        return (True, 'encendida') if result.ok else (False, f"start: {result.exitstatus}")
+
+    def stop_vm(self, vm, phases):
+        """Stop duro (como quitar la corriente). Devuelve (ok, detalle)."""
+        api = self.client.get_vm(vm['node'], vm['vmid'])
+        result = self._wait(vm['node'], api.status.stop.post())
+        phases['stop'] = result.elapsed
+        return (True, 'detenida') if result.ok else (False, f"stop: {result.exitstatus}")
+
+    def shutdown_vm(self, vm, phases, timeout=None, force=None):
+        """Apagado ACPI; si no termina en `timeout` y `force`, stop. Devuelve (ok, detalle)."""
+        timeout = int(timeout or self.settings['shutdown_timeout'])
+        force = self.settings['force_stop'] if force is None else force
+        api = self.client.get_vm(vm['node'], vm['vmid'])
+        # El margen cubre el arranque de la tarea; la propia tarea falla al vencer `timeout`
+        result = self._wait(vm['node'], api.status.shutdown.post(timeout=timeout), timeout=timeout + 30)
+        phases['shutdown'] = result.elapsed
+        if result.ok:
+            return True, 'apagada'
+        if not force:
+            return False, f"shutdown: {result.exitstatus}"
+        log.warning(f"⚠️ VM {vm['vmid']}: el apagado ACPI no terminó ({result.exitstatus}), forzando stop")
+        ok, detail = self.stop_vm(vm, phases)
+        return (True, 'apagada (stop forzado)') if ok else (False, detail)
+
+    # ------------------------------------------------------------------
+    # Muchas VMs
+    # ------------------------------------------------------------------
+    def _run(self, action, targets, dry_run, **kwargs):
+        def one(vm):
+            start = time.monotonic()
+            result = dict(vmid=vm['vmid'], name=vm.get('name'), node=vm['node'], ok=True, elapsed=0.0,
+                          detail='', phases={}, changed=False, status=vm.get('status'))
+            if vm.get('status') == _DONE_WHEN[action]:
+                result['detail'] = 'ya encendida' if action == 'start' else 'ya apagada'
+                return result
+            if dry_run:
+                result['detail'] = f"dry-run: {action}"
+                return result
+            with span(f"{action} {vm['vmid']}", 'vm', node=vm['node']), \
+                    log_context(vmid=vm['vmid'], node=vm['node'], op=action):
+                try:
+                    ok, detail = getattr(self, f"{action}_vm")(vm, result['phases'], **kwargs)
+                except Exception as e:
+                    ok, detail = False, str(e)
+            result.update(ok=ok, detail=detail, changed=ok, elapsed=time.monotonic() - start)
+            return result
+
+        with span(f"power {action}", 'app', vms=len(targets)):
+            results = run_parallel(targets, one, max_workers=self.parallel,
+                                   limits=[(lambda vm: vm['node'], self.per_node)])
+        return self._final_status(results) if not dry_run else results
+
+    def _final_status(self, results):
+        """Estado real de todas las VMs con un único snapshot del inventario."""
+        try:
+            inventory = self.client.inventory.refresh()
+        except Exception as e:
+            log.warning(f"⚠️ No se pudo leer el estado final del cluster: {e}")
+            return results
+        for r in results:
+            r['status'] = inventory.status(r['vmid'])
+        return results
+
+    def start(self, targets, dry_run=False):
+        """Arranca las VMs del inventario `targets` (las encendidas se saltan).
+
+        Devuelve una lista de resultados por VM (vmid, name, node, ok, elapsed, detail,
+        phases, changed, status final).
+        """
+        return self._run('start', targets, dry_run)
+
+    def shutdown(self, targets, timeout=None, force=None, dry_run=False):
+        """Apagado ACPI de las VMs con escalado a stop (ver `shutdown_vm`)."""
+        return self._run('shutdown', targets, dry_run, timeout=timeout, force=force)
+
+    def stop(self, targets, dry_run=False):
+        """Stop duro de las VMs."""
+        return self._run('stop', targets, dry_run)
+
+
+def report(results, total, action):
+    """Tabla final: una línea por VM con el estado del snapshot final y el resumen."""
+    icons = {'running': '🟢', 'stopped': '⚪', None: '❓'}
+    for r in results:
+        icon = '✅' if r['ok'] else '❌'
+        if r['ok'] and not r['changed']:
+            icon = '⚪'
+        phases = ', '.join(f"{phase} {secs:.1f}s" for phase, secs in r['phases'].items())
+        log.info(f"  {icon} VM {r['vmid']} ({r['name']}) en {r['node']}: {r['detail']} - "
+                 f"{icons.get(r['status'], '🟡')} {r['status'] or 'no encontrada'} "
+                 f"({r['elapsed']:.1f}s{'; ' + phases if phases else ''})")
+
+    failed = [r for r in results if not r['ok']]
+    log.info("\n" + "=" * 60)
+    log.info(f"✅ {action}: {sum(1 for r in results if r['changed'])}   "
+             f"⚪ Sin cambios: {sum(1 for r in results if r['ok'] and not r['changed'])}   "
+             f"❌ Fallidas: {len(failed)}")
+    if results:
+        log.info(f"⏱️  Total: {total:.1f}s (VM más lenta: {max(r['elapsed'] for r in results):.1f}s, "
+                 f"suma: {sum(r['elapsed'] for r in results):.1f}s)")
+    for r in failed:
+        log.error(f"   • VM {r['vmid']} ({r['name']}) en {r['node']}: {r['detail']}")
+    log.info("=" * 60)
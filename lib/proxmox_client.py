@@ -0,0 +1,234 @@
+"""
+Cliente Proxmox compartido por todas las acciones.
+
+- Una sola sesión HTTP keep-alive con pool de conexiones (segura entre hilos).
+- API tokens (PROXMOX_TOKEN_NAME / PROXMOX_TOKEN_VALUE): sin login.
+- Usuario/password: el ticket PVE y el token CSRF se guardan en disco y se
+  reutilizan hasta que caducan, así una serie de acciones cuesta un solo login.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from proxmoxer import ProxmoxAPI
+from proxmoxer.backends.https import ProxmoxHTTPAuth, ProxmoxHTTPAuthBase
+
+from lib.config import CACHE_DIR, Config
+from lib.inventory import Inventory
+from lib.logger import log
+from lib.tasks import TaskWatcher
+from lib.tracing import tracer
+
+requests.packages.urllib3.disable_warnings()
+
+# Los tickets PVE son válidos 2h. proxmoxer los renueva a partir de 1h de edad,
+# así que un ticket cacheado sirve mientras le quede margen para renovarse.
+TICKET_LIFETIME = 7200 - 300
+
+# Conexiones keep-alive por host (create_vm --parallel y acciones masivas)
+POOL_SIZE = 32
+
+
+class _TicketAuth(ProxmoxHTTPAuth):
+    """Auth por ticket que puede rehidratarse desde caché y avisa al renovarse."""
+
+    def __init__(self, username, base_url, password=None, ticket=None, csrf=None,
+                 age=0, on_renew=None, **kwargs):
+        self.on_renew = on_renew
+        if ticket:
+            ProxmoxHTTPAuthBase.__init__(self, **kwargs)
+            self.base_url = base_url
+            self.username = username
+            self.pve_auth_ticket = ticket
+            self.csrf_prevention_token = csrf
+            self.birth_time = time.monotonic() - age
+        else:
+            super().__init__(username, password, base_url=base_url, **kwargs)
+
+    def _get_new_tokens(self, password=None, otp=None):
+        super()._get_new_tokens(password=password, otp=otp)
+        if self.on_renew:
+            self.on_renew(self)
+
+
+class ProxmoxClient:
+    def __init__(self, cfg=None):
+        self.cfg = cfg or Config()
+        self.api = None
+        self._tasks = None
+        self._inventory = None
+        self._auth = None
+        self._password = None
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Conexión
+    # ------------------------------------------------------------------
+    def connect(self):
+        """Conecta (una sola vez por proceso). Devuelve True si hay sesión."""
+        with self._lock:
+            if self.api is not None:
+                return True
+
+            px = self.cfg.proxmox
+            if not px['host'] or not px['user'] or not (px['password'] or px['token_value']):
+                log.error("❌ Faltan credenciales de Proxmox (verifica .env o config.yaml)")
+                return False
+
+            try:
+                if px['token_name'] and px['token_value']:
+                    self.api = ProxmoxAPI(
+                        px['host'],
+                        user=px['user'],
+                        token_name=px['token_name'],
+                        token_value=px['token_value'],
+                        verify_ssl=px['verify_ssl']
+                    )
+                else:
+                    self.api = self._connect_with_ticket(px)
+            except Exception as e:
+                log.error(f"❌ Error de conexión a Proxmox {px['host']}: {e}")
+                self.api = None
+                return False
+
+            session = self.api._store['session']
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            if self._auth is not None:
+                session.hooks['response'].append(self._reauth_hook)
+            session.hooks['response'].append(self._invalidate_hook)
+            session.hooks['response'].append(tracer.http_hook)
+            return True
+
+    def _connect_with_ticket(self, px):
+        # proxmoxer no permite inyectar el objeto auth: se crea el backend con un
+        # token de relleno (no hace peticiones) y se sustituye la autenticación.
+        api = ProxmoxAPI(px['host'], user=px['user'], token_name='-', token_value='-',
+                         verify_ssl=px['verify_ssl'])
+        base_url = api._backend.get_base_url()
+        self._password = px['password']
+
+        cached = self._load_ticket(px)
+        auth_kwargs = {'verify_ssl': px['verify_ssl'], 'timeout': 5}
+        if cached:
+            self._auth = _TicketAuth(px['user'], base_url, ticket=cached['ticket'], csrf=cached['csrf'],
+                                     age=time.time() - cached['created'], on_renew=self._save_ticket,
+                                     **auth_kwargs)
+        else:
+            self._auth = _TicketAuth(px['user'], base_url, password=self._password,
+                                     on_renew=self._save_ticket, **auth_kwargs)
+
+        api._backend.auth = self._auth
+        api._store['session'].auth = self._auth
+        return api
+
+    def _reauth_hook(self, resp, *args, **kwargs):
+        """Si el ticket cacheado fue revocado (401), hace login y reintenta una vez."""
+        if resp.status_code != 401 or resp.request.headers.get('X-Reauth'):
+            return resp
+
+        sent_ticket = resp.request.headers.get('Cookie', '')
+        with self._lock:
+            # Otro hilo pudo haber renovado ya el ticket
+            if self._auth.pve_auth_ticket in sent_ticket:
+                log.warning("🔑 Ticket Proxmox expirado o revocado, iniciando sesión de nuevo...")
+                self._auth._get_new_tokens(password=self._password)
+
+        retry = resp.request.copy()
+        retry.headers['X-Reauth'] = '1'
+        retry.headers.pop('Cookie', None)
+        retry.prepare_cookies(self._auth.get_cookies())
+        if retry.method != 'GET':
+            retry.headers['CSRFPreventionToken'] = self._auth.csrf_prevention_token
+        resp.content  # liberar la conexión antes de reenviar
+        return resp.connection.send(retry, **kwargs)
+
+    def _invalidate_hook(self, resp, *args, **kwargs):
+        """Cualquier escritura deja obsoleto el snapshot del inventario."""
+        if self._inventory is not None and resp.request.method != 'GET':
+            self._inventory.invalidate()
+        return resp
+
+    # ------------------------------------------------------------------
+    # Caché de tickets en disco
+    # ------------------------------------------------------------------
+    def _ticket_file(self, px=None):
+        px = px or self.cfg.proxmox
+        key = hashlib.sha256(f"{px['host']}|{px['user']}".encode()).hexdigest()[:16]
+        return os.path.join(CACHE_DIR, f"ticket-{key}.json")
+
+    def _load_ticket(self, px):
+        try:
+            with open(self._ticket_file(px)) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - cached.get('created', 0) >= TICKET_LIFETIME:
+            return None
+        return cached
+
+    def _save_ticket(self, auth):
+        path = self._ticket_file()
+        try:
+            os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({
+                    'ticket': auth.pve_auth_ticket,
+                    'csrf': auth.csrf_prevention_token,
+                    'created': time.time(),
+                }, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            log.debug(f"No se pudo cachear el ticket Proxmox: {e}")
+
+    def forget_ticket(self):
+        """Borra el ticket cacheado (logout local)."""
+        try:
+            os.remove(self._ticket_file())
+        except OSError:
+            pass
+
+    # ------------------------------------------------------------------
+    # Accesos directos
+    # ------------------------------------------------------------------
+    @property
+    def inventory(self):
+        """Inventario compartido (snapshot de cluster/resources con TTL)."""
+        with self._lock:
+            if self._inventory is None:
+                self._inventory = Inventory(self.api)
+            return self._inventory
+
+    @property
+    def tasks(self):
+        """TaskWatcher compartido: todas las esperas de UPIDs pasan por aquí."""
+        with self._lock:
+            if self._tasks is None:
+                self._tasks = TaskWatcher(self.api)
+            return self._tasks
+
+    def get_node(self, node):
+        return self.api.nodes(node)
+
+    def get_vm(self, node, vmid):
+        return self.api.nodes(node).qemu(vmid)
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def get_client(cfg=None):
+    """Devuelve el cliente compartido del proceso (se conecta con connect())."""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = ProxmoxClient(cfg)
+        return _shared_client
@@ -0,0 +1,176 @@
+"""
+Modo reconcile: compara las VMSpec con el cluster y aplica sólo la diferencia.
+
+El plan se calcula con un snapshot de `cluster/resources` más un
+`config.get()` por VM existente (en paralelo). Cada VM acaba en una acción:
+
+- create    no existe: se crea como en un despliegue normal
+- update    existe con configuración distinta: un único config POST (con digest)
+- resize    sólo el disco es menor que el pedido
+- noop      ya coincide: no se escribe nada
+- conflict  vmid/nombre/nodo no cuadran: no se toca, se informa
+"""
+from collections import namedtuple
+from urllib.parse import unquote
+
+from lib.golden import CREATE_ONLY_PARAMS, disk_size_gb
+from lib.inventory import split_tags
+from lib.logger import log, log_context
+from lib.parallel import run_parallel
+
+Action = namedtuple('Action', ['kind', 'spec', 'changes', 'resize', 'reason', 'digest'])
+
+# Campos que no se pueden comparar (Proxmox no los devuelve en claro)
+IGNORED_PARAMS = CREATE_ONLY_PARAMS | {'cipassword'}
+
+DEFAULTS = {'onboot': 0, 'sockets': 1, 'description': ''}
+
+
+def _parse_net(value):
+    """'virtio=BC:24:11:AA:BB:CC,bridge=vmbr0,firewall=1' -> ('virtio', mac, {opciones})"""
+    parts = str(value or '').split(',')
+    model, _, mac = parts[0].partition('=')
+    options = dict(p.split('=', 1) for p in parts[1:] if '=' in p)
+    return model, mac, options
+
+
+def _same(key, desired, current):
+    if key == 'tags':
+        return split_tags(desired) == split_tags(current)
+    if key == 'sshkeys':
+        return unquote(str(desired)).strip() == unquote(str(current or '')).strip()
+    if key == 'net0':
+        d_model, _, d_opts = _parse_net(desired)
+        c_model, _, c_opts = _parse_net(current)
+        return d_model == c_model and d_opts.get('bridge') == c_opts.get('bridge')
+    if current is None:
+        current = DEFAULTS.get(key)
+    return str(desired).strip() == str(current).strip()
+
+
+def diff_config(params, current):
+    """Cambios (para config POST) necesarios para que `current` coincida con `params`."""
+    changes = {}
+    for key, desired in params.items():
+        if key in IGNORED_PARAMS or _same(key, desired, current.get(key)):
+            continue
+        if key == 'net0' and current.get('net0'):
+            # Conservar la MAC y el resto de opciones de la NIC existente
+            d_model, _, d_opts = _parse_net(desired)
+            _, mac, c_opts = _parse_net(current['net0'])
+            options = dict(c_opts, **d_opts)
+            desired = f"{d_model}={mac}," + ','.join(f"{k}={v}" for k, v in options.items())
+        changes[key] = desired
+    return changes
+
+
+class Reconciler:
+    def __init__(self, client, max_workers=8):
+        self.client = client
+        self.proxmox = client.api
+        self.max_workers = max_workers
+
+    # ------------------------------------------------------------------
+    # Plan
+    # ------------------------------------------------------------------
+    def plan(self, specs):
+        inventory = self.client.inventory.refresh()
+        actions = [None] * len(specs)
+        existing = []
+
+        for i, spec in enumerate(specs):
+            current = inventory.get(spec.vmid)
+            by_name = inventory.by_name(spec.name)
+            if spec.error:
+                actions[i] = Action('conflict', spec, {}, None, spec.error, None)
+            elif current is None:
+                if by_name:
+                    reason = f"el nombre {spec.name} ya lo usa la VM {by_name['vmid']}"
+                    actions[i] = Action('conflict', spec, {}, None, reason, None)
+                else:
+                    actions[i] = Action('create', spec, {}, None, '', None)
+            elif current.get('name') != spec.name:
+                reason = f"VM {spec.vmid} existe con otro nombre ({current.get('name')})"
+                actions[i] = Action('conflict', spec, {}, None, reason, None)
+            elif spec.node and current.get('node') != spec.node:
+                reason = f"está en {current.get('node')}, no en {spec.node} (no se migra)"
+                actions[i] = Action('conflict', spec, {}, None, reason, None)
+            else:
+                existing.append((i, spec, current['node']))
+
+        configs = run_parallel(
+            existing,
+            lambda item: self.proxmox.nodes(item[2]).qemu(item[1].vmid).config.get(),
+            max_workers=self.max_workers,
+        )
+        for (i, spec, _), config in zip(existing, configs):
+            actions[i] = self._compare(spec, config)
+        return actions
+
+    def _compare(self, spec, config):
+        changes = diff_config(spec.api_params(), config)
+        current_gb = disk_size_gb(config.get('scsi0'))
+        resize = f"{spec.disk_gb}G" if current_gb and spec.disk_gb > current_gb else None
+
+        reason = ''
+        if current_gb and spec.disk_gb < current_gb:
+            reason = f"disco actual {current_gb:.0f}G > {spec.disk_gb}G (no se reduce)"
+
+        if changes:
+            kind = 'update'
+        elif resize:
+            kind = 'resize'
+        else:
+            kind = 'noop'
+        return Action(kind, spec, changes, resize, reason, config.get('digest'))
+
+    # ------------------------------------------------------------------
+    # Aplicación
+    # ------------------------------------------------------------------
+    def apply(self, actions):
+        """Aplica en paralelo las acciones update/resize. Devuelve [(action, ok)]."""
+        todo = [a for a in actions if a.kind in ('update', 'resize')]
+        results = run_parallel(todo, self._apply_one, max_workers=self.max_workers)
+        return list(zip(todo, results))
+
+    def _apply_one(self, action):
+        with log_context(vmid=action.spec.vmid, node=action.spec.node, op=action.kind):
+            return self._apply(action)
+
+    def _apply(self, action):
+        spec = action.spec
+        vm = self.proxmox.nodes(spec.node).qemu(spec.vmid)
+        try:
+            if action.changes:
+                # digest: falla si la config cambió desde que se calculó el plan
+                upid = vm.config.post(digest=action.digest, **action.changes)
+                if upid and isinstance(upid, str):
+                    result = self.client.tasks.wait(spec.node, upid)
+                    if not result.ok:
+                        raise RuntimeError(result.exitstatus)
+                log.info(f"   ✏️  VM {spec.vmid} ({spec.name}): {', '.join(sorted(action.changes))}")
+            if action.resize:
+                vm.resize.put(disk='scsi0', size=action.resize)
+                log.info(f"   📏 VM {spec.vmid} ({spec.name}): scsi0 -> {action.resize}")
+            return True
+        except Exception as e:
+            log.error(f"❌ VM {spec.vmid} ({spec.name}): no se pudo reconciliar: {e}")
+            return False
+
+
+def log_plan(actions):
+    icons = {'create': '➕', 'update': '✏️ ', 'resize': '📏', 'noop': '✓ ', 'conflict': '⚠️ '}
+    log.info(f"\n{'VMID':<6} {'Nombre':<25} {'Nodo':<10} {'Acción':<9} Detalle")
+    log.info("-" * 80)
+    for a in actions:
+        detail = ', '.join(sorted(a.changes))
+        if a.resize:
+            detail = ', '.join(filter(None, [detail, f"disco -> {a.resize}"]))
+        detail = ', '.join(filter(None, [detail, a.reason]))
+        log.info(f"{a.spec.vmid:<6} {a.spec.name:<25} {str(a.spec.node):<10} "
+                 f"{icons[a.kind]} {a.kind:<7} {detail}")
+    counts = {}
+    for a in actions:
+        counts[a.kind] = counts.get(a.kind, 0) + 1
+    log.info("-" * 80)
+    log.info("Plan: " + ', '.join(f"{k}={v}" for k, v in sorted(counts.items())))
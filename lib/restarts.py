@@ -0,0 +1,245 @@
+"""
+Reinicio escalonado de las VMs que tienen cambios de hardware pendientes.
+
+Una pasada de lectura (`pending` de cada VM encendida, en paralelo) decide qué
+VMs necesitan un ciclo de apagado: las que tienen alguna opción pendiente del
+próximo arranque (p.ej. `ssd=1` de fix_and_optimize.py). Las apagadas no se
+tocan: toman la config al arrancar.
+
+Las VMs elegidas se reinician por olas según su rol:
+
+- masters de uno en uno, para no perder el quórum de etcd
+- workers (y el resto) en olas de `wave_size`, con un máximo por nodo
+
+Cada VM se apaga por ACPI (`shutdown`) y, si el invitado no termina en
+`shutdown_timeout`, se fuerza `stop`; después arranca y se espera a que esté
+lista antes de pasar a la siguiente ola: guest agent (`agent/ping`) si lo
+tiene, si no un puerto TCP (`ready_port`, SSH) en su IP de vms.yaml y, sin IP,
+un tiempo mínimo (`settle_seconds`). Si una ola falla, las siguientes no se
+ejecutan (el plano de control nunca queda con dos masters caídos).
+
+Dos o más masters sin guest agent ni IP sólo se pueden esperar por tiempo:
+el plan se rechaza salvo con `force`.
+"""
+import socket
+import time
+
+from lib.inventory import split_tags
+from lib.logger import log, log_context
+from lib.parallel import bulk_limits, run_parallel
+from lib.power import PowerEngine
+from lib.snapshots import agent_enabled
+from lib.tracing import span
+
+DEFAULTS = {
+    'wave_size': 3,           # workers reiniciados a la vez
+    'shutdown_timeout': 180,  # segundos de apagado ACPI antes de forzar stop
+    'force_stop': True,       # stop duro si el apagado ACPI no termina
+    'ready_timeout': 300,     # segundos esperando al guest agent (o al puerto) tras arrancar
+    'ready_port': 22,         # puerto TCP sondeado en las VMs sin guest agent (None = no sondear)
+    'settle_seconds': 60,     # espera mínima tras arrancar una VM sin guest agent ni IP
+    'abort_on_failure': True,  # no seguir con las siguientes olas si una falla
+}
+
+MASTER_TAGS = {'master', 'control-plane', 'server'}
+
+
+def restart_settings(config):
+    """Sección `restarts:` de config.yaml con sus valores por defecto."""
+    return dict(DEFAULTS, **(config.get('restarts') or {}))
+
+
+def role(vm):
+    """'master' o 'worker' según tags (o el nombre, p.ej. k3s-master-01)."""
+    tags = split_tags(vm.get('tags'))
+    if tags & MASTER_TAGS:
+        return 'master'
+    if 'worker' in tags:
+        return 'worker'
+    return 'master' if 'master' in str(vm.get('name') or '') else 'worker'
+
+
+def vm_addresses(vms):
+    """vmid -> IP de las VMs de vms.yaml con IP fija (para el sondeo TCP sin guest agent)."""
+    return {vm['vmid']: vm['ip'] for vm in vms if vm.get('ip') and vm['ip'] != 'dhcp'}
+
+
+def pending_keys(entries):
+    """Opciones de `pending` que esperan al próximo arranque."""
+    return [e['key'] for e in entries if 'pending' in e or e.get('delete')]
+
+
+def waves(plans, wave_size):
+    """Masters de uno en uno primero; después el resto en olas de `wave_size`."""
+    masters = [p for p in plans if p['role'] == 'master']
+    others = [p for p in plans if p['role'] != 'master']
+    size = max(1, int(wave_size))
+    return [[p] for p in masters] + [others[i:i + size] for i in range(0, len(others), size)]
+
+
+class RestartPlanner:
+    def __init__(self, client, config, parallel=None, per_node=None, wave_size=None, addresses=None):
+        self.client = client
+        self.addresses = dict(addresses or {})  # vmid -> IP (vms.yaml) para el sondeo TCP
+        self.settings = restart_settings(config)
+        self.parallel, self.per_node = bulk_limits(config, parallel, per_node)
+        self.wave_size = max(1, int(wave_size or self.settings['wave_size']))
+        self.power = PowerEngine(client, config, parallel=parallel, per_node=per_node)
+
+    # ------------------------------------------------------------------
+    # Plan
+    # ------------------------------------------------------------------
+    def _read(self, vm):
+        plan = dict(vmid=vm['vmid'], name=vm.get('name'), node=vm['node'], role=role(vm),
+                    running=vm.get('status') == 'running', pending=[], agent=False,
+                    ip=self.addresses.get(vm['vmid']), error=None)
+        if not plan['running']:
+            return plan
+        try:
+            entries = self.client.get_vm(vm['node'], vm['vmid']).pending.get()
+        except Exception as e:
+            return dict(plan, error=str(e))
+        agent = next((e for e in entries if e['key'] == 'agent'), {})
+        return dict(plan, pending=pending_keys(entries),
+                    agent=agent_enabled({'agent': agent.get('pending', agent.get('value', 0))}))
+
+    def plan(self, targets, force=False):
+        """Lee `pending` de las VMs encendidas en paralelo. Devuelve (a reiniciar, resto)."""
+        with span('restart plan', 'app', vms=len(targets)):
+            plans = run_parallel(targets, self._read, max_workers=self.parallel,
+                                 limits=[(lambda vm: vm['node'], self.per_node)])
+        todo = [p for p in plans if p['running'] and p['error'] is None and (p['pending'] or force)]
+        return todo, [p for p in plans if p not in todo]
+
+    # ------------------------------------------------------------------
+    # Ciclo de una VM
+    # ------------------------------------------------------------------
+    def _agent_ready(self, plan, timeout):
+        """Sondea agent/ping con backoff hasta que responde o vence el deadline."""
+        api = self.client.get_vm(plan['node'], plan['vmid'])
+        deadline = time.monotonic() + timeout
+        interval = 1.0
+        while True:
+            try:
+                api.agent.ping.post()
+                return True
+            except Exception:
+                pass
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
+            interval = min(5.0, interval * 1.5)
+
+    def _port_ready(self, ip, port, timeout):
+        """Intenta conectar por TCP con backoff hasta que acepta o vence el deadline."""
+        deadline = time.monotonic() + timeout
+        interval = 1.0
+        while True:
+            try:
+                with socket.create_connection((ip, port), timeout=min(5.0, interval * 2)):
+                    return True
+            except OSError:
+                pass
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
+            interval = min(5.0, interval * 1.5)
+
+    def _wait_ready(self, plan, phases):
+        """Espera a que la VM reiniciada esté lista. Devuelve (ok, cómo se comprobó)."""
+        timeout = int(self.settings['ready_timeout'])
+        port = self.settings['ready_port']
+        begin = time.monotonic()
+        try:
+            if plan['agent']:
+                if not self._agent_ready(plan, timeout):
+                    return False, f"el guest agent no responde tras {timeout}s"
+                return True, 'guest agent listo'
+            if plan['ip'] and port:
+                if not self._port_ready(plan['ip'], int(port), timeout):
+                    return False, f"sin guest agent y {plan['ip']}:{port} no responde tras {timeout}s"
+                return True, f"sin guest agent, {plan['ip']}:{port} responde"
+            settle = float(self.settings['settle_seconds'])
+            time.sleep(settle)
+            return True, f"sin guest agent ni IP, espera de {settle:g}s"
+        finally:
+            phases['ready'] = time.monotonic() - begin
+
+    def _cycle(self, plan, phases):
+        """shutdown ACPI (stop si no termina) -> start -> lista. Devuelve (ok, detalle)."""
+        ok, detail = self.power.shutdown_vm(plan, phases, timeout=self.settings['shutdown_timeout'],
+                                            force=self.settings['force_stop'])
+        if not ok:
+            return False, detail
+        ok, detail = self.power.start_vm(plan, phases)
+        if not ok:
+            return False, detail
+
+        detail = 'reiniciada (stop forzado)' if 'stop' in phases else 'reiniciada'
+        ready, how = self._wait_ready(plan, phases)
+        return ready, f"{detail}, {how}"
+
+    def _restart_one(self, plan):
+        start = time.monotonic()
+        result = dict(vmid=plan['vmid'], name=plan['name'], node=plan['node'], role=plan['role'],
+                      wave=plan['wave'], pending=plan['pending'], ok=False, detail='', phases={})
+        with span(f"restart {plan['vmid']}", 'vm', node=plan['node'], role=plan['role'], wave=plan['wave']), \
+                log_context(vmid=plan['vmid'], node=plan['node'], op='restart'):
+            try:
+                result['ok'], result['detail'] = self._cycle(plan, result['phases'])
+            except Exception as e:
+                result['detail'] = str(e)
+        result['elapsed'] = time.monotonic() - start
+        return result
+
+    # ------------------------------------------------------------------
+    # Olas
+    # ------------------------------------------------------------------
+    def restart(self, targets, force=False, dry_run=False):
+        """Reinicia por olas las VMs de `targets` con cambios pendientes (todas las encendidas con force).
+
+        Devuelve una lista de resultados por VM (vmid, name, node, role, wave, pending, ok,
+        elapsed, detail, phases); las VMs que no necesitan reinicio aparecen con wave=None.
+        """
+        todo, rest = self.plan(targets, force=force)
+        plan_waves = waves(todo, self.wave_size)
+        for number, wave in enumerate(plan_waves, 1):
+            for plan in wave:
+                plan['wave'] = number
+
+        def skipped(plan, detail, ok=True):
+            return dict(vmid=plan['vmid'], name=plan['name'], node=plan['node'], role=plan['role'],
+                        wave=plan.get('wave'), pending=plan['pending'], ok=ok, elapsed=0.0, detail=detail,
+                        phases={})
+
+        results = [skipped(p, p['error'] if p['error'] else 'sin cambios pendientes' if p['running']
+                           else 'apagada (aplica la config al arrancar)', ok=p['error'] is None) for p in rest]
+
+        # Masters que sólo se pueden esperar por tiempo: uno puede seguir arrancando cuando se apaga el siguiente
+        blind = [p for p in todo if p['role'] == 'master' and not p['agent']
+                 and not (p['ip'] and self.settings['ready_port'])]
+        if len(blind) > 1 and not force:
+            log.error(f"❌ {len(blind)} masters sin guest agent ni IP que sondear "
+                      f"({', '.join(str(p['vmid']) for p in blind)}): no se reinician en olas seguidas sin --force")
+            return results + [skipped(p, 'no reiniciada: masters sin guest agent ni IP (usar restart_vms.py --force)', ok=False)
+                              for wave in plan_waves for p in wave]
+        if dry_run:
+            return results + [skipped(p, f"dry-run: ola {p['wave']} ({p['role']})"
+                                         f"{', pendiente: ' + ', '.join(p['pending']) if p['pending'] else ''}")
+                              for wave in plan_waves for p in wave]
+
+        aborted = False
+        for number, wave in enumerate(plan_waves, 1):
+            if aborted:
+                results += [skipped(p, 'no reiniciada: falló una ola anterior', ok=False) for p in wave]
+                continue
+            log.info(f"🌊 Ola {number}/{len(plan_waves)}: "
+                     f"{', '.join(str(p['vmid']) for p in wave)} ({wave[0]['role']})")
+            with span(f"restart wave {number}", 'app', vms=len(wave)):
+                wave_results = run_parallel(wave, self._restart_one, max_workers=self.parallel,
+                                            limits=[(lambda p: p['node'], self.per_node)])
+            results += wave_results
+            if any(not r['ok'] for r in wave_results) and self.settings['abort_on_failure']:
+                log.error(f"❌ La ola {number} falló: no se reinician las siguientes")
+                aborted = True
+        return results
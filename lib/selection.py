@@ -0,0 +1,92 @@
+"""
+Selección de VMs para las operaciones masivas (borrado, snapshots, rollback...).
+
+Se resuelve contra un único snapshot del inventario (`cluster/resources`):
+por defecto las VMs declaradas en vms.yaml que existen en el cluster, o todas
+las del cluster con `all_vms`. Los filtros se combinan entre sí (AND):
+
+- tags   la VM tiene alguno de los tags
+- nodes  la VM está en alguno de los nodos
+- ids    vmid dentro de alguno de los rangos ("3001-3010,3020")
+- names  nombre exacto
+
+Las plantillas nunca se seleccionan salvo con `templates=True`. El nodo de
+cada VM es siempre el real del inventario, no el de vms.yaml.
+"""
+from lib.inventory import split_tags
+
+
+def parse_ids(text):
+    """'3001-3010,3020' -> [(3001, 3010), (3020, 3020)]"""
+    ranges = []
+    for part in str(text or '').replace(' ', '').split(','):
+        if not part:
+            continue
+        low, _, high = part.partition('-')
+        try:
+            low, high = int(low), int(high or low)
+        except ValueError:
+            raise ValueError(f"Rango de vmid inválido: '{part}'")
+        ranges.append((min(low, high), max(low, high)))
+    return ranges
+
+
+class Selector:
+    def __init__(self, tags=None, nodes=None, ids=None, names=None, all_vms=False, templates=False):
+        self.tags = split_tags(tags)
+        self.nodes = set(nodes or [])
+        self.ids = parse_ids(ids) if isinstance(ids, str) else list(ids or [])
+        self.names = set(names or [])
+        self.all_vms = all_vms
+        self.templates = templates
+
+    @staticmethod
+    def add_arguments(parser):
+        """Añade --tag/--node/--ids/--name/--all/--include-templates a un ArgumentParser."""
+        group = parser.add_argument_group('selección de VMs')
+        group.add_argument('--tag', action='append', help='Sólo VMs con este tag (repetible)')
+        group.add_argument('--node', action='append', help='Sólo VMs en este nodo (repetible)')
+        group.add_argument('--ids', help='Rangos de vmid, p.ej. 3001-3010,3020')
+        group.add_argument('--name', action='append', help='Nombre exacto de VM (repetible)')
+        group.add_argument('--all', dest='all_vms', action='store_true',
+                           help='Todas las VMs del cluster, no sólo las de vms.yaml')
+        group.add_argument('--include-templates', action='store_true', help='Incluir plantillas')
+        return parser
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(tags=args.tag, nodes=args.node, ids=args.ids, names=args.name,
+                   all_vms=args.all_vms, templates=args.include_templates)
+
+    def matches(self, vm):
+        if vm.get('template') and not self.templates:
+            return False
+        if self.tags and not self.tags & split_tags(vm.get('tags')):
+            return False
+        if self.nodes and vm.get('node') not in self.nodes:
+            return False
+        if self.ids and not any(low <= vm['vmid'] <= high for low, high in self.ids):
+            return False
+        if self.names and vm.get('name') not in self.names:
+            return False
+        return True
+
+    def select(self, inventory, declared=()):
+        """VMs (recursos del inventario) que cumplen el selector, ordenadas por vmid."""
+        if self.all_vms:
+            candidates = inventory.all()
+        else:
+            candidates = [vm for vm in (inventory.get(d['vmid']) for d in declared) if vm]
+        return sorted((vm for vm in candidates if self.matches(vm)), key=lambda vm: vm['vmid'])
+
+    def describe(self):
+        parts = ['todas las VMs del cluster' if self.all_vms else 'VMs de vms.yaml']
+        if self.tags:
+            parts.append(f"tags={','.join(sorted(self.tags))}")
+        if self.nodes:
+            parts.append(f"nodos={','.join(sorted(self.nodes))}")
+        if self.ids:
+            parts.append('ids=' + ','.join(f"{a}-{b}" if a != b else str(a) for a, b in self.ids))
+        if self.names:
+            parts.append(f"nombres={','.join(sorted(self.names))}")
+        return ', '.join(parts)
@@ -0,0 +1,300 @@
+"""
+Snapshots y rollback en paralelo de muchas VMs.
+
+Una pasada de lectura (config + snapshots existentes de cada VM, en paralelo)
+decide qué hacer con cada VM y en qué storage está su disco principal; después
+las tareas `qmsnapshot` se lanzan en paralelo con un máximo por nodo y por
+storage (los storages compartidos cuentan una vez para todo el cluster) y se
+siguen juntas con el TaskWatcher. Snapshotear el cluster entero tarda lo que
+el snapshot más lento, no la suma.
+
+Consistencia: por defecto los snapshots son sólo de disco. Con el QEMU guest
+agent habilitado y respondiendo, la propia tarea de Proxmox congela los
+sistemas de ficheros del invitado (guest-fsfreeze-freeze/thaw) alrededor del
+snapshot; el motor comprueba el agente con `agent/ping` y anota si cada
+snapshot quedó congelado ('fs-freeze') o sólo 'crash-consistent'. Guardar la
+RAM (`vmstate`) es opcional y mucho más lento.
+
+Rollback: cada VM se detiene (stop duro si corre), vuelve al snapshot y
+opcionalmente arranca en la misma tarea; todas a la vez con los mismos límites.
+
+Retención: con `keep=N` se conservan los N snapshots más recientes cuyo nombre
+empieza por el prefijo fijo del patrón (p.ej. 'auto-' en 'auto-%Y%m%d-%H%M').
+"""
+import re
+import time
+from datetime import datetime
+
+from lib.logger import log, log_context
+from lib.parallel import bulk_limits, run_parallel
+from lib.tracing import span
+
+DEFAULTS = {
+    'per_storage': 4,       # snapshots simultáneos sobre un mismo storage
+    'vmstate': False,       # incluir la RAM (sólo VMs encendidas)
+    'require_freeze': False,  # fallar si el guest agent no responde (en vez de crash-consistent)
+    'keep': 0,              # 0 = sin poda
+    'timeout': 600,         # segundos por tarea
+}
+
+_DISK_KEY = re.compile(r'^(scsi|virtio|sata|ide|efidisk|tpmstate)\d+$')
+
+
+def snapshot_settings(config):
+    """Sección `snapshots:` de config.yaml con sus valores por defecto."""
+    return dict(DEFAULTS, **(config.get('snapshots') or {}))
+
+
+def expand_name(pattern, when=None):
+    """'auto-%Y%m%d-%H%M' -> 'auto-20260101-1200' (los nombres fijos no cambian)."""
+    return (when or datetime.now()).strftime(pattern) if '%' in pattern else pattern
+
+
+def retention_prefix(pattern):
+    """Parte fija del patrón: los snapshots que la comparten entran en la retención."""
+    return pattern.split('%', 1)[0]
+
+
+def disk_storages(config):
+    """[storage, ...] de los discos de una config de VM, el principal primero."""
+    disks = []
+    for key in sorted(config):
+        if not _DISK_KEY.match(key):
+            continue
+        value = str(config[key])
+        if 'media=cdrom' in value or value.startswith('none'):
+            continue
+        storage = value.split(':', 1)[0]
+        disks.append((0 if key in ('scsi0', 'virtio0') else 1, key, storage))
+    return [storage for _, _, storage in sorted(disks)]
+
+
+def agent_enabled(config):
+    """`agent: 1` o `agent: enabled=1,...`"""
+    value = str(config.get('agent', '0'))
+    first = value.split(',', 1)[0]
+    return first in ('1', 'enabled=1')
+
+
+def task_ok(result):
+    # Un thaw/freeze con avisos deja la tarea en 'WARNINGS: n' pero el snapshot existe
+    return result.ok or str(result.exitstatus).startswith('WARNINGS')
+
+
+class SnapshotEngine:
+    def __init__(self, client, config, parallel=None, per_node=None, per_storage=None, timeout=None):
+        self.client = client
+        self.settings = snapshot_settings(config)
+        self.parallel, self.per_node = bulk_limits(config, parallel, per_node)
+        self.per_storage = max(1, int(per_storage or self.settings['per_storage']))
+        self.timeout = int(timeout or self.settings['timeout'])
+        self._shared = None
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+    def shared_storages(self):
+        """Storages compartidos del cluster (una petición, se recuerda)."""
+        if self._shared is None:
+            try:
+                resources = self.client.api.cluster.resources.get(type='storage')
+                self._shared = {r['storage'] for r in resources if int(r.get('shared', 0) or 0)}
+            except Exception as e:
+                log.warning(f"⚠️ No se pudo leer los storages del cluster: {e}")
+                self._shared = set()
+        return self._shared
+
+    def storage_key(self, plan):
+        storage = plan['storage']
+        return ('*', storage) if storage in self.shared_storages() else (plan['node'], storage)
+
+    def _read(self, vm):
+        """Config y snapshots existentes de una VM del inventario."""
+        api = self.client.get_vm(vm['node'], vm['vmid'])
+        plan = dict(vmid=vm['vmid'], name=vm.get('name'), node=vm['node'],
+                    running=vm.get('status') == 'running')
+        try:
+            config = api.config.get()
+            snaps = [s for s in api.snapshot.get() if s.get('name') != 'current']
+        except Exception as e:
+            return dict(plan, error=str(e), storage=None, snapshots=[], agent=False)
+        storages = disk_storages(config)
+        return dict(plan, error=None, storage=storages[0] if storages else None,
+                    snapshots=snaps, agent=agent_enabled(config))
+
+    def plan(self, targets):
+        """Lee todas las VMs en paralelo (máx. por nodo)."""
+        with span('snapshot plan', 'app', vms=len(targets)):
+            return run_parallel(targets, self._read, max_workers=self.parallel,
+                                limits=[(lambda vm: vm['node'], self.per_node)])
+
+    # ------------------------------------------------------------------
+    # Snapshot
+    # ------------------------------------------------------------------
+    def _agent_alive(self, plan):
+        try:
+            self.client.get_vm(plan['node'], plan['vmid']).agent.ping.post()
+            return True
+        except Exception:
+            return False
+
+    def _wait(self, node, upid):
+        return self.client.tasks.wait(node, upid, timeout=self.timeout)
+
+    def _take(self, plan, name, description, vmstate, require_freeze):
+        vmid, node = plan['vmid'], plan['node']
+        api = self.client.get_vm(node, vmid)
+        vmstate = bool(vmstate and plan['running'])
+        if vmstate or not plan['running']:
+            consistency = 'ram' if vmstate else 'apagada'
+        elif plan['agent'] and self._agent_alive(plan):
+            consistency = 'fs-freeze'
+        else:
+            if require_freeze:
+                return False, 'guest agent no disponible (require_freeze)', None
+            consistency = 'crash-consistent'
+
+        result = self._wait(node, api.snapshot.post(snapname=name, description=description,
+                                                   vmstate=int(vmstate)))
+        if task_ok(result):
+            return True, 'creado', consistency
+        if not vmstate:
+            return False, str(result.exitstatus), consistency
+
+        # La RAM puede no caber en el storage: repetir sólo disco
+        log.debug(f"VM {vmid}: snapshot con RAM falló ({result.exitstatus}), repitiendo sólo disco")
+        result = self._wait(node, api.snapshot.post(snapname=name, description=description, vmstate=0))
+        if task_ok(result):
+            return True, 'creado sin RAM', 'fs-freeze' if plan['agent'] and self._agent_alive(plan) \
+                else 'crash-consistent'
+        return False, str(result.exitstatus), consistency
+
+    def _prune(self, plan, prefix, keep, current):
+        """Borra los snapshots más antiguos con el prefijo, dejando `keep` (incluido el nuevo)."""
+        matching = [s for s in plan['snapshots'] if s['name'].startswith(prefix) and s['name'] != current]
+        matching.sort(key=lambda s: int(s.get('snaptime', 0) or 0), reverse=True)
+        pruned, errors = [], []
+        api = self.client.get_vm(plan['node'], plan['vmid'])
+        for snap in matching[max(0, keep - 1):]:
+            try:
+                if task_ok(self._wait(plan['node'], api.snapshot(snap['name']).delete())):
+                    pruned.append(snap['name'])
+                    continue
+                errors.append(snap['name'])
+            except Exception:
+                errors.append(snap['name'])
+        return pruned, errors
+
+    def snapshot(self, targets, pattern, description='', vmstate=None, require_freeze=None, keep=None,
+                 dry_run=False):
+        """Crea el snapshot `pattern` (admite strftime) en las VMs del inventario `targets`.
+
+        Devuelve una lista de resultados por VM (vmid, name, node, ok, elapsed, detail,
+        consistency, pruned).
+        """
+        vmstate = self.settings['vmstate'] if vmstate is None else vmstate
+        require_freeze = self.settings['require_freeze'] if require_freeze is None else require_freeze
+        keep = int(self.settings['keep'] if keep is None else keep)
+        name = expand_name(pattern)
+        prefix = retention_prefix(pattern)
+
+        plans = self.plan(targets)
+        if dry_run:
+            return [dict(vmid=p['vmid'], name=p['name'], node=p['node'], ok=p['error'] is None, elapsed=0.0,
+                         detail=p['error'] or ('ya existe' if any(s['name'] == name for s in p['snapshots'])
+                                               else f"dry-run ({p['storage']})"),
+                         consistency=None, pruned=[]) for p in plans]
+
+        def snapshot_one(plan):
+            start = time.monotonic()
+            result = dict(vmid=plan['vmid'], name=plan['name'], node=plan['node'], ok=False,
+                          detail=plan['error'], consistency=None, pruned=[])
+            if plan['error'] is None:
+                with span(f"snapshot {plan['vmid']}", 'vm', node=plan['node'], storage=plan['storage']) as attrs, \
+                        log_context(vmid=plan['vmid'], node=plan['node'], op='snapshot'):
+                    if any(s['name'] == name for s in plan['snapshots']):
+                        result.update(ok=True, detail='ya existe')
+                    else:
+                        try:
+                            ok, detail, consistency = self._take(plan, name, description, vmstate,
+                                                                 require_freeze)
+                        except Exception as e:
+                            ok, detail, consistency = False, str(e), None
+                        result.update(ok=ok, detail=detail, consistency=consistency)
+                        if ok and keep > 0:
+                            pruned, errors = self._prune(plan, prefix, keep, name)
+                            result['pruned'] = pruned
+                            if errors:
+                                result['detail'] += f" (no se pudieron podar: {', '.join(errors)})"
+                    attrs['consistency'] = result['consistency']
+            result['elapsed'] = time.monotonic() - start
+            return result
+
+        return run_parallel(plans, snapshot_one, max_workers=self.parallel, limits=self._limits())
+
+    def _limits(self):
+        return [(lambda p: p['node'], self.per_node),
+                (lambda p: self.storage_key(p) if p['storage'] else p['vmid'], self.per_storage)]
+
+    # ------------------------------------------------------------------
+    # Rollback
+    # ------------------------------------------------------------------
+    def _restore(self, plan, snap, start, phases):
+        """stop (si corre) -> rollback (+ arranque). Devuelve (ok, detalle); tiempos en `phases`."""
+        vmid, node = plan['vmid'], plan['node']
+        api = self.client.get_vm(node, vmid)
+        if plan['running']:
+            # El estado actual se descarta: stop duro, no apagado ACPI
+            result = self._wait(node, api.status.stop.post())
+            phases['stop'] = result.elapsed
+            if not result.ok:
+                return False, f"stop: {result.exitstatus}"
+
+        # Un snapshot con RAM deja la VM encendida por sí solo; si no, `start=1`
+        # arranca la VM dentro de la misma tarea de rollback (PVE >= 7.2)
+        with_ram = bool(int(snap.get('vmstate', 0) or 0))
+        params = {'start': 1} if start and not with_ram else {}
+        result = self._wait(node, api.snapshot(snap['name']).rollback.post(**params))
+        phases['rollback'] = result.elapsed
+        if not task_ok(result):
+            return False, f"rollback: {result.exitstatus}"
+        if with_ram:
+            return True, 'restaurada (con RAM, encendida)'
+        return True, 'restaurada y arrancada' if start else 'restaurada'
+
+    def rollback(self, targets, name, start=False, dry_run=False):
+        """Vuelve las VMs del inventario `targets` al snapshot `name`, todas a la vez.
+
+        Devuelve una lista de resultados por VM (vmid, name, node, ok, elapsed, detail,
+        phases={'stop': s, 'rollback': s}).
+        """
+        plans = self.plan(targets)
+
+        def find(plan):
+            return next((s for s in plan['snapshots'] if s['name'] == name), None)
+
+        if dry_run:
+            return [dict(vmid=p['vmid'], name=p['name'], node=p['node'], ok=bool(p['error'] is None and find(p)),
+                         elapsed=0.0, phases={},
+                         detail=p['error'] or (f"dry-run: {'stop + ' if p['running'] else ''}rollback"
+                                               f"{' + start' if start else ''}" if find(p)
+                                               else f"no tiene el snapshot '{name}'")) for p in plans]
+
+        def rollback_one(plan):
+            start_t = time.monotonic()
+            result = dict(vmid=plan['vmid'], name=plan['name'], node=plan['node'], ok=False,
+                          detail=plan['error'], phases={})
+            snap = find(plan) if plan['error'] is None else None
+            if plan['error'] is None and snap is None:
+                result['detail'] = f"no tiene el snapshot '{name}'"
+            elif snap is not None:
+                with span(f"rollback {plan['vmid']}", 'vm', node=plan['node'], snapshot=name), \
+                        log_context(vmid=plan['vmid'], node=plan['node'], op='rollback'):
+                    try:
+                        result['ok'], result['detail'] = self._restore(plan, snap, start, result['phases'])
+                    except Exception as e:
+                        result['detail'] = str(e)
+            result['elapsed'] = time.monotonic() - start_t
+            return result
+
+        return run_parallel(plans, rollback_one, max_workers=self.parallel, limits=self._limits())
@@ -0,0 +1,377 @@
+"""
+Compilación de vms.yaml a especificaciones de VM inmutables.
+
+Una sola pasada carga config.yaml, templates.yaml y las variables de entorno,
+resuelve plantillas y defaults de cada VM y calcula sus parámetros de la API
+de Proxmox. El resultado se cachea (memoria y disco) con una clave derivada
+del contenido de los ficheros y de las variables de entorno relevantes, así
+que dry-runs y validaciones repetidas no vuelven a parsear nada.
+"""
+import hashlib
+import json
+import os
+import re
+from types import MappingProxyType
+from urllib.parse import quote
+
+import yaml
+
+from lib.config import CACHE_DIR
+from lib.images import staged_path
+
+SPEC_CACHE_VERSION = 2
+
+# Variables de entorno que influyen en la especificación resultante
+ENV_KEYS = (
+    'DEFAULT_STORAGE', 'DEFAULT_MEMORY', 'DEFAULT_CORES', 'DEFAULT_DISK_SIZE',
+    'NETWORK_BRIDGE', 'NETWORK_NETMASK', 'NETWORK_GATEWAY', 'NETWORK_NAMESERVER',
+    'VM_DEFAULT_USER', 'VM_DEFAULT_PASSWORD', 'VM_SSH_KEYS',
+)
+
+_memory_cache = {}
+
+_DISK_SIZE = re.compile(r'^\s*(\d+)\s*([GT]?)B?\s*$', re.IGNORECASE)
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+def parse_disk_gb(value):
+    """'20G', '20GB', '1T' o 20 -> GB enteros. ValueError si el tamaño no se entiende."""
+    match = _DISK_SIZE.match(str(value))
+    if not match:
+        raise ValueError(f"disk_size inválido: {value!r} (usar GB o TB enteros, p.ej. 20G o 1T)")
+    size = int(match.group(1))
+    return size * 1024 if match.group(2).upper() == 'T' else size
+
+
+def _disk_gb_or_zero(value):
+    # Una spec con disk_size inválido lleva el error en `error`: no debe romper su construcción
+    try:
+        return parse_disk_gb(value)
+    except ValueError:
+        return 0
+
+
+class VMSpec:
+    """VM resuelta (plantilla + defaults + env) y sus parámetros para qemu.create."""
+
+    __slots__ = ('vmid', 'name', 'node', 'storage', 'image', 'memory', 'cores',
+                 'disk_size', 'disk_gb', 'ip', 'tags', 'start', 'vm', 'params', 'error')
+
+    def __init__(self, vm, params, error=None):
+        values = {
+            'vmid': vm['vmid'],
+            'name': vm['name'],
+            'node': vm.get('node'),
+            'storage': vm.get('storage', 'local-lvm'),
+            'image': vm.get('image', 'ubuntu22'),
+            'memory': vm.get('memory', 2048),
+            'cores': vm.get('cores', 2),
+            'disk_size': vm.get('disk_size', '20G'),
+            'disk_gb': _disk_gb_or_zero(vm.get('disk_size', '20G')),
+            'ip': vm.get('ip'),
+            'tags': vm.get('tags'),
+            'start': bool(vm.get('start', False)),
+            'vm': _freeze(vm),
+            'params': _freeze(params) if params is not None else None,
+            'error': error,
+        }
+        for k, v in values.items():
+            object.__setattr__(self, k, v)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("VMSpec es inmutable")
+
+    def __repr__(self):
+        return f"VMSpec(vmid={self.vmid}, name={self.name!r}, node={self.node!r})"
+
+    def to_dict(self):
+        """Copia mutable de la VM resuelta (para código que espera un dict)."""
+        return _thaw(self.vm)
+
+    def api_params(self):
+        """Copia mutable de los parámetros de qemu.create."""
+        return _thaw(self.params)
+
+    def with_node(self, node, error=None):
+        """Copia de la spec asignada a otro nodo (los parámetros no dependen del nodo)."""
+        params = self.api_params() if self.params is not None else None
+        return VMSpec(dict(self.to_dict(), node=node), params, error=error or self.error)
+
+
+# ----------------------------------------------------------------------
+# Resolución (lógica pura: sin E/S ni llamadas a la API)
+# ----------------------------------------------------------------------
+def env_snapshot():
+    return {k: os.getenv(k) for k in ENV_KEYS}
+
+
+def merge_vm(vm, templates, config, env):
+    """Aplica plantilla y defaults (config.yaml + env) sin mutar las entradas."""
+    vm = dict(vm)
+    if 'template' in vm and vm['template'] in templates:
+        base = dict(templates[vm['template']])
+        base.update(vm)
+        vm = base
+
+    defaults = dict(config.get('defaults', {}))
+    env_defaults = {
+        'storage': env.get('DEFAULT_STORAGE'),
+        'memory': env.get('DEFAULT_MEMORY'),
+        'cores': env.get('DEFAULT_CORES'),
+        'disk_size': env.get('DEFAULT_DISK_SIZE'),
+    }
+    for k, v in env_defaults.items():
+        if v is not None:
+            defaults[k] = int(v) if k in ['memory', 'cores'] else v
+
+    for k, v in defaults.items():
+        if k not in vm:
+            vm[k] = v
+    return vm
+
+
+def resolve_image_path(config, image_key):
+    defaults = config.get('defaults', {})
+    if 'images' not in defaults:
+        raise ValueError("Configuración de imágenes faltante")
+    if image_key not in defaults['images']:
+        raise ValueError(f"Imagen {image_key} no existe")
+
+    # Copia local verificada en cada nodo (staging) en lugar de importar desde NFS
+    local_path = staged_path(config, image_key)
+    if local_path:
+        return local_path
+
+    image_path = defaults['images'][image_key]
+
+    # Convertir NFS_SERVER:iso/filename a path absoluto
+    if image_path.startswith('NFS_SERVER:iso/'):
+        filename = image_path.replace('NFS_SERVER:iso/', '')
+        image_path = f"/mnt/pve/NFS_SERVER/template/iso/{filename}"
+    elif image_path.startswith('NFS_SERVER:'):
+        filename = image_path.replace('NFS_SERVER:', '')
+        image_path = f"/mnt/pve/NFS_SERVER/{filename}"
+    return image_path
+
+
+def cloudinit_password(vm, config, env):
+    creds = vm.get('credentials', config.get('credentials', {})) or {}
+    default_password = env.get('VM_DEFAULT_PASSWORD') or creds.get('password')
+    if 'password' in creds or default_password:
+        return creds.get('password', default_password)
+    return None
+
+
+def build_params(vm, config, env):
+    """Parámetros de nodes(node).qemu.create para una VM ya resuelta."""
+    params = {
+        'vmid': vm['vmid'],
+        'name': vm['name'],
+        'memory': vm.get('memory', 2048),
+        'cores': vm.get('cores', 2),
+        'sockets': vm.get('sockets', 1),
+        'ostype': vm.get('ostype', 'l26'),
+        'onboot': 1 if vm.get('onboot', False) else 0,
+        'agent': '1',  # QEMU Agent habilitado
+    }
+
+    image_path = resolve_image_path(config, vm.get('image', 'ubuntu22'))
+    storage = vm.get('storage', 'local-lvm')
+    disk_gb = parse_disk_gb(vm.get('disk_size', '20G'))
+
+    # Importar disco desde imagen cloud
+    params['scsihw'] = 'virtio-scsi-pci'
+    params['scsi0'] = f"{storage}:0,import-from={image_path},discard=on"
+
+    # Redimensionar disco si es necesario
+    if disk_gb > 20:  # Las imágenes cloud suelen ser 2-3GB
+        params['scsi0'] += f",size={disk_gb}G"
+
+    # Cloud-init drive
+    params['ide2'] = f"{storage}:cloudinit"
+
+    # Red
+    net_cfg = config.get('network', {})
+    bridge = vm.get('bridge', env.get('NETWORK_BRIDGE') or net_cfg.get('bridge', 'vmbr0'))
+    model = vm.get('model', net_cfg.get('model', 'virtio'))
+    params['net0'] = f"{model},bridge={bridge}"
+
+    # Boot desde disco
+    params['boot'] = 'order=scsi0'
+
+    # Serial console para cloud-init
+    params['serial0'] = 'socket'
+    params['vga'] = 'serial0'
+
+    if 'tags' in vm:
+        params['tags'] = vm['tags']
+
+    if 'description' in vm:
+        params['description'] = vm['description']
+
+    # Credenciales cloud-init (prioridad: VM > .env > config.yaml)
+    creds = vm.get('credentials', config.get('credentials', {})) or {}
+    default_user = env.get('VM_DEFAULT_USER') or creds.get('user', 'ubuntu')
+    params['ciuser'] = creds.get('user', default_user)
+    password = cloudinit_password(vm, config, env)
+    if password:
+        params['cipassword'] = password
+
+    # Configuración de red (prioridad: VM > .env > config.yaml)
+    net_type = vm.get('network_type', config.get('defaults', {}).get('network_type', 'dhcp'))
+    if net_type == 'static' and 'ip' in vm:
+        ip = vm['ip']
+        mask = vm.get('netmask', env.get('NETWORK_NETMASK') or net_cfg.get('netmask', '24'))
+        gw = vm.get('gateway', env.get('NETWORK_GATEWAY') or net_cfg.get('gateway'))
+        params['ipconfig0'] = f"ip={ip}/{mask},gw={gw}"
+        params['nameserver'] = vm.get('nameserver', env.get('NETWORK_NAMESERVER') or net_cfg.get('nameserver', '8.8.8.8'))
+    else:
+        params['ipconfig0'] = 'ip=dhcp'
+
+    # SSH keys (prioridad: VM > .env > config.yaml)
+    keys = creds.get('ssh_keys') or []
+    env_keys = env.get('VM_SSH_KEYS')
+    if env_keys and not keys:
+        keys = [k.strip() for k in env_keys.split(',') if k.strip()]
+    cleaned_keys = [k.strip() for k in keys if k and k.strip()]
+    if cleaned_keys:
+        # Proxmox requiere keys URL-encoded, separadas por %0A (newline)
+        params['sshkeys'] = '%0A'.join(quote(key, safe='') for key in cleaned_keys)
+
+    # ⭐ SNIPPET ÚNICO para TODAS las VMs
+    if 'snippet' in config.get('defaults', {}):
+        params['cicustom'] = f"vendor={config['defaults']['snippet']}"
+
+    return params
+
+
+def compile_vm(vm, templates, config, env):
+    merged = merge_vm(vm, templates, config, env)
+    try:
+        return VMSpec(merged, build_params(merged, config, env))
+    except ValueError as e:
+        return VMSpec(merged, None, error=str(e))
+
+
+# ----------------------------------------------------------------------
+# Carga con caché por contenido
+# ----------------------------------------------------------------------
+def _read_bytes(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return b''
+
+
+def _cache_key(blobs, env):
+    h = hashlib.sha256(f"v{SPEC_CACHE_VERSION}".encode())
+    for blob in blobs:
+        h.update(hashlib.sha256(blob).digest())
+    h.update(json.dumps(env, sort_keys=True).encode())
+    return h.hexdigest()[:24]
+
+
+def load_specs(config_file='config.yaml', vms_file='vms.yaml', templates_file='templates.yaml', use_cache=True):
+    """Devuelve una tupla de VMSpec para vms_file (cacheada por contenido)."""
+    config_blob = _read_bytes(config_file)
+    vms_blob = _read_bytes(vms_file)
+    templates_blob = _read_bytes(templates_file)
+    env = env_snapshot()
+    key = _cache_key((config_blob, vms_blob, templates_blob), env)
+
+    if use_cache and key in _memory_cache:
+        return _memory_cache[key]
+
+    config = yaml.safe_load(config_blob) or {}
+    cache_path = os.path.join(CACHE_DIR, f"specs-v{SPEC_CACHE_VERSION}-{key}.json")
+
+    templates = None
+    vms = None
+
+    def parse():
+        nonlocal templates, vms
+        if vms is None:
+            templates = (yaml.safe_load(templates_blob) or {}).get('templates', {}) if templates_blob else {}
+            vms = (yaml.safe_load(vms_blob) or {}).get('vms', [])
+        return templates, vms
+
+    specs = _load_cached(cache_path, config, env, parse) if use_cache else None
+    if specs is None:
+        templates, vms = parse()
+        specs = tuple(compile_vm(vm, templates, config, env) for vm in vms)
+        if use_cache:
+            _store_cached(cache_path, specs)
+
+    _memory_cache[key] = specs
+    return specs
+
+
+def _load_cached(path, config, env, parse):
+    """Specs del fichero de caché; las contraseñas se recalculan desde vms.yaml/templates.yaml."""
+    try:
+        with open(path) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    specs = []
+    for index, entry in enumerate(entries):
+        vm, params = entry['vm'], entry['params']
+        if entry.get('vm_password'):
+            # Sólo se vuelven a leer los YAML si alguna VM define su propia contraseña
+            templates, vms = parse()
+            if index >= len(vms):
+                return None
+            merged = merge_vm(vms[index], templates, config, env)
+            vm = dict(vm, credentials=dict(vm.get('credentials') or {},
+                                           password=(merged.get('credentials') or {}).get('password')))
+        if params is not None:
+            # La contraseña cloud-init no se guarda en disco: se recalcula
+            password = cloudinit_password(vm, config, env)
+            if password:
+                params['cipassword'] = password
+        specs.append(VMSpec(vm, params, error=entry.get('error')))
+    return tuple(specs)
+
+
+def _store_cached(path, specs):
+    entries = []
+    for spec in specs:
+        params = spec.api_params() if spec.params is not None else None
+        if params:
+            params.pop('cipassword', None)
+        entry = {'vm': spec.to_dict(), 'params': params, 'error': spec.error}
+        creds = entry['vm'].get('credentials')
+        if isinstance(creds, dict) and 'password' in creds:
+            entry['vm']['credentials'] = {k: v for k, v in creds.items() if k != 'password'}
+            entry['vm_password'] = True
+        entries.append(entry)
+    try:
+        os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+        # Las cachés de versiones anteriores guardaban la contraseña en claro
+        for name in os.listdir(CACHE_DIR):
+            if name.startswith('specs-') and not name.startswith(f"specs-v{SPEC_CACHE_VERSION}-"):
+                os.remove(os.path.join(CACHE_DIR, name))
+        tmp = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entries, f, default=str)
+        os.replace(tmp, path)
+    except OSError:
+        pass
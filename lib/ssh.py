@@ -0,0 +1,103 @@
+"""
+Ejecución remota por SSH con una conexión multiplexada por host.
+
+Usa ControlMaster de OpenSSH: la primera orden a un host abre la conexión
+maestra (TCP + intercambio de claves + auth) y las siguientes viajan como
+canales sobre ella, sin handshake. La conexión sobrevive `persist` segundos
+tras la última orden, así que también se reutiliza entre acciones del menú.
+Cada orden tiene timeout y devuelve su salida capturada.
+"""
+import os
+import subprocess
+import threading
+import time
+from collections import namedtuple
+
+from lib.config import CACHE_DIR
+from lib.logger import log
+from lib.parallel import run_parallel
+from lib.tracing import tracer
+
+DEFAULT_TIMEOUT = 60
+DEFAULT_PERSIST = 600
+
+
+class SSHResult(namedtuple('SSHResult', ['host', 'returncode', 'stdout', 'stderr', 'elapsed'])):
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+
+class SSHPool:
+    def __init__(self, user, key=None, connect_timeout=5, persist=DEFAULT_PERSIST):
+        self.user = user
+        self.key = os.path.expanduser(key) if key else None
+        self.connect_timeout = connect_timeout
+        self.persist = persist
+        # El socket vive en un path corto (límite de ~104 bytes de los sockets unix)
+        self.control_dir = os.path.join(CACHE_DIR, 'ssh')
+        os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+
+    def _options(self):
+        opts = [
+            '-o', 'StrictHostKeyChecking=no',
+            '-o', 'UserKnownHostsFile=/dev/null',
+            '-o', 'LogLevel=ERROR',
+            '-o', 'BatchMode=yes',
+            '-o', f'ConnectTimeout={self.connect_timeout}',
+            '-o', 'ControlMaster=auto',
+            '-o', f'ControlPersist={self.persist}',
+            '-o', f'ControlPath={self.control_dir}/%C',
+        ]
+        if self.key:
+            opts += ['-i', self.key]
+        return opts
+
+    def _target(self, host):
+        return f"{self.user}@{host}"
+
+    def run(self, host, command, timeout=DEFAULT_TIMEOUT, stdin=None):
+        """Ejecuta `command` en el host y devuelve un SSHResult (nunca lanza)."""
+        argv = ['ssh', *self._options(), self._target(host), command]
+        start = time.monotonic()
+        try:
+            proc = subprocess.run(argv, input=stdin, capture_output=True, text=True, timeout=timeout)
+            result = SSHResult(host, proc.returncode, proc.stdout, proc.stderr, time.monotonic() - start)
+        except subprocess.TimeoutExpired:
+            log.debug(f"⏰ SSH {host}: timeout ({timeout}s) ejecutando: {command}")
+            result = SSHResult(host, 124, '', f'timeout after {timeout}s', time.monotonic() - start)
+        except OSError as e:
+            result = SSHResult(host, 255, '', str(e), time.monotonic() - start)
+        tracer.record(f"ssh {host}", 'ssh', start, result.elapsed, command=command, returncode=result.returncode)
+        return result
+
+    def run_many(self, hosts, command, timeout=DEFAULT_TIMEOUT, max_workers=8):
+        """Ejecuta la misma orden en varios hosts a la vez. Devuelve {host: SSHResult}."""
+        hosts = list(hosts)
+        results = run_parallel(hosts, lambda h: self.run(h, command, timeout=timeout),
+                               max_workers=min(max_workers, max(1, len(hosts))))
+        return dict(zip(hosts, results))
+
+    def is_connected(self, host):
+        """True si ya hay una conexión maestra viva hacia el host."""
+        argv = ['ssh', *self._options(), '-O', 'check', self._target(host)]
+        return subprocess.run(argv, capture_output=True).returncode == 0
+
+    def close(self, host):
+        argv = ['ssh', *self._options(), '-O', 'exit', self._target(host)]
+        subprocess.run(argv, capture_output=True)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(user, key=None, **kwargs):
+    """Pool compartido del proceso para (usuario, clave)."""
+    pool_key = (user, key)
+    with _pools_lock:
+        if pool_key not in _pools:
+            _pools[pool_key] = SSHPool(user, key, **kwargs)
+        return _pools[pool_key]
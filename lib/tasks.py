@@ -0,0 +1,184 @@
+"""
+Seguimiento multiplexado de tareas Proxmox (UPIDs).
+
+En lugar de un bucle `tasks(upid).status.get()` por tarea, TaskWatcher agrupa
+todas las tareas pendientes por nodo y las resuelve con un único listado
+`nodes(node).tasks.get(...)` por nodo y por ciclo. El intervalo entre ciclos
+crece con la edad de la tarea más reciente (rápido al principio, más lento
+después) y cada tarea tiene un deadline.
+"""
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, wait as wait_futures
+
+from lib.logger import log
+from lib.tracing import tracer
+
+TaskResult = namedtuple('TaskResult', ['node', 'upid', 'ok', 'exitstatus', 'elapsed'])
+
+DEFAULT_TIMEOUT = 1800
+
+
+def upid_starttime(upid):
+    """Epoch de inicio codificado en el UPID (UPID:node:pid:pstart:starttime:...)."""
+    try:
+        return int(upid.split(':')[4], 16)
+    except (IndexError, ValueError):
+        return None
+
+
+class _Watch:
+    __slots__ = ('node', 'upid', 'future', 'started', 'deadline')
+
+    def __init__(self, node, upid, timeout):
+        self.node = node
+        self.upid = upid
+        self.future = Future()
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout if timeout else None
+
+
+class TaskWatcher:
+    def __init__(self, proxmox, min_interval=0.5, max_interval=5.0, default_timeout=DEFAULT_TIMEOUT):
+        self.proxmox = proxmox
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.default_timeout = default_timeout
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def watch(self, node, upid, timeout=None, callback=None):
+        """Registra un UPID y devuelve un Future que se resuelve con un TaskResult."""
+        with self._cond:
+            watch = self._pending.get(upid)
+            if watch is None:
+                watch = _Watch(node, upid, timeout if timeout is not None else self.default_timeout)
+                self._pending[upid] = watch
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._loop, name='task-watcher', daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+        # UPID ya seguido: el callback va al Future compartido (fuera del lock: puede ejecutarse ya)
+        if callback:
+            watch.future.add_done_callback(lambda f: callback(f.result()))
+        return watch.future
+
+    def wait(self, node, upid, timeout=None):
+        """Bloquea hasta que la tarea termina. Devuelve TaskResult."""
+        return self.watch(node, upid, timeout).result()
+
+    def wait_all(self, futures, timeout=None):
+        """Espera un conjunto de Futures devueltos por watch()."""
+        futures = list(futures)
+        wait_futures(futures, timeout=timeout)
+        return [f.result() for f in futures if f.done()]
+
+    # ------------------------------------------------------------------
+    # Bucle de sondeo
+    # ------------------------------------------------------------------
+    def _loop(self):
+        try:
+            while True:
+                with self._cond:
+                    if not self._pending:
+                        self._thread = None
+                        return
+                    by_node = {}
+                    for watch in self._pending.values():
+                        by_node.setdefault(watch.node, []).append(watch)
+
+                try:
+                    for node, watches in by_node.items():
+                        self._poll_node(node, watches)
+                    self._expire()
+                except Exception as e:
+                    # Un fallo en un ciclo no debe dejar las tareas sin resolver: se reintenta
+                    log.warning(f"⚠️ Error en el ciclo de sondeo de tareas, se reintenta: {e}")
+                    with self._cond:
+                        self._cond.wait(self.max_interval)
+                    continue
+
+                with self._cond:
+                    if not self._pending:
+                        continue
+                    youngest = min(time.monotonic() - w.started for w in self._pending.values())
+                    interval = min(self.max_interval, max(self.min_interval, youngest / 4))
+                    self._cond.wait(interval)
+        except BaseException as e:
+            log.error(f"❌ El seguimiento de tareas se detuvo: {e}")
+            self._fail_pending(f"watcher: {e}")
+            raise
+
+    def _fail_pending(self, exitstatus):
+        """Resuelve como fallidas todas las tareas pendientes y libera el hilo."""
+        with self._cond:
+            if self._thread is threading.current_thread():
+                self._thread = None
+            watches = list(self._pending.values())
+            self._pending.clear()
+        for watch in watches:
+            if not watch.future.done():
+                watch.future.set_result(TaskResult(watch.node, watch.upid, False, exitstatus,
+                                                   time.monotonic() - watch.started))
+
+    def _poll_node(self, node, watches):
+        wanted = {w.upid for w in watches}
+        known_starts = [s for s in (upid_starttime(u) for u in wanted) if s is not None]
+        params = {'source': 'all', 'limit': max(50, len(watches) * 4)}
+        if known_starts:
+            params['since'] = min(known_starts) - 1
+
+        try:
+            listing = self.proxmox.nodes(node).tasks.get(**params)
+        except Exception as e:
+            log.debug(f"⚠️ Listado de tareas en {node} falló: {e}")
+            listing = None
+
+        seen = {}
+        for task in listing or []:
+            if task.get('upid') in wanted:
+                seen[task['upid']] = task
+
+        for watch in watches:
+            task = seen.get(watch.upid)
+            if task is None:
+                # No aparece (listado truncado, PVE sin 'since' o error): consulta directa
+                self._poll_single(watch)
+            elif task.get('endtime'):
+                self._resolve(watch, task.get('status', 'unknown'))
+
+    def _poll_single(self, watch):
+        try:
+            task = self.proxmox.nodes(watch.node).tasks(watch.upid).status.get()
+        except Exception as e:
+            log.debug(f"⚠️ Error verificando tarea {watch.upid}: {e}")
+            return
+        if task.get('status') == 'stopped':
+            self._resolve(watch, task.get('exitstatus', 'unknown'))
+
+    def _resolve(self, watch, exitstatus):
+        with self._cond:
+            if self._pending.pop(watch.upid, None) is None:
+                return
+        elapsed = time.monotonic() - watch.started
+        fields = watch.upid.split(':')
+        try:
+            tracer.record(f"task {fields[5] if len(fields) > 5 else '?'}", 'task', watch.started, elapsed,
+                          node=watch.node, upid=watch.upid, exitstatus=exitstatus)
+        finally:
+            # Ya salió de _pending: el Future se resuelve aunque falle la traza
+            if not watch.future.done():
+                watch.future.set_result(TaskResult(watch.node, watch.upid, exitstatus == 'OK', exitstatus, elapsed))
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._cond:
+            expired = [w for w in self._pending.values() if w.deadline is not None and now >= w.deadline]
+        for watch in expired:
+            log.warning(f"⏰ Timeout esperando la tarea {watch.upid}")
+            self._resolve(watch, 'timeout')
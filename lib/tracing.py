@@ -0,0 +1,293 @@
+"""
+Trazas de tiempo por acción: a dónde se va el tiempo (pveproxy, tareas de
+storage, SSH, K3s... o nuestros propios bucles).
+
+Cada span registra nombre, categoría, inicio, duración, hilo y atributos:
+
+- http   cada llamada a la API de Proxmox o de Kubernetes (endpoint, latencia, status)
+- task   cada tarea Proxmox seguida por TaskWatcher (tipo, nodo, exitstatus)
+- ssh    cada orden remota del pool SSH
+- cmd    cada subproceso local (k3sup)
+- gate   cada espera de readiness de K3s
+- k3s / vm / action   fases del despliegue, VMs individuales y la acción completa
+
+Se activa con `tracing.enabled` en config.yaml o PROXMOX_TRACE=1. Al terminar
+la acción se escribe `logs/trace_<ts>.jsonl` (un span por línea), opcionalmente
+`logs/trace_<ts>.chrome.json` (abrir en chrome://tracing o ui.perfetto.dev para
+verlo como Gantt) y un resumen por endpoint en el log. Con `tracing.profile` o
+PROXMOX_PROFILE=1 el hilo principal de la acción corre además bajo cProfile
+(`logs/profile_<ts>.prof`).
+Desactivado, un span cuesta una comprobación de un booleano.
+"""
+import functools
+import json
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from lib.logger import log
+
+Span = namedtuple('Span', ['name', 'cat', 'start', 'dur', 'thread', 'args'])
+
+# Segmentos de la ruta que identifican un recurso concreto: se agrupan en el resumen
+_PLACEHOLDERS = {
+    'nodes': '{node}', 'qemu': '{vmid}', 'lxc': '{vmid}', 'storage': '{storage}',
+    'tasks': '{upid}', 'snapshot': '{snap}', 'namespaces': '{ns}',
+}
+_API_PREFIX = re.compile(r'^/api2/json')
+
+
+def _env_flag(name):
+    return os.getenv(name, '').lower() in ('1', 'true', 'yes')
+
+
+def endpoint(method, url):
+    """'GET https://pve:8006/api2/json/nodes/pve1/qemu/101/config' -> 'GET /nodes/{node}/qemu/{vmid}/config'."""
+    path = _API_PREFIX.sub('', urlsplit(url).path)
+    parts = path.split('/')
+    for i in range(1, len(parts)):
+        prev = parts[i - 1]
+        if prev in _PLACEHOLDERS and parts[i]:
+            parts[i] = _PLACEHOLDERS[prev]
+        elif parts[i].isdigit():
+            parts[i] = '{id}'
+    return f"{method} {'/'.join(parts)}"
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullSpan()
+
+
+class _ActiveSpan:
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start')
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self.args
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.record(self.name, self.cat, self.start, time.monotonic() - self.start, **self.args)
+        return False
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = _env_flag('PROXMOX_TRACE')
+        self.profile = _env_flag('PROXMOX_PROFILE')
+        self.chrome = True
+        self.out_dir = 'logs'
+        self.top = 15
+        self._spans = []
+        self._lock = threading.Lock()
+        self._active = False
+        # Identificador de la acción en curso (nombre de los ficheros de traza)
+        self.run_id = None
+        self._t0 = time.monotonic()
+        self._epoch = time.time()
+
+    def configure(self, settings=None):
+        """Aplica la sección `tracing:` de config.yaml (las variables de entorno mandan)."""
+        settings = settings or {}
+        self.enabled = _env_flag('PROXMOX_TRACE') or bool(settings.get('enabled', self.enabled))
+        self.profile = _env_flag('PROXMOX_PROFILE') or bool(settings.get('profile', self.profile))
+        self.chrome = bool(settings.get('chrome', self.chrome))
+        self.out_dir = settings.get('dir', self.out_dir)
+        self.top = int(settings.get('top', self.top))
+        return self
+
+    # ------------------------------------------------------------------
+    # Registro
+    # ------------------------------------------------------------------
+    def span(self, name, cat='app', /, **args):
+        """Context manager que mide el bloque. Devuelve un dict para añadir atributos."""
+        if not self.enabled:
+            return _NULL
+        return _ActiveSpan(self, name, cat, args)
+
+    def record(self, name, cat, start, dur, /, **args):
+        """Registra un span ya medido (start en time.monotonic())."""
+        if not self.enabled:
+            return
+        span = Span(name, cat, start, dur, threading.current_thread().name, args)
+        with self._lock:
+            self._spans.append(span)
+
+    def http_hook(self, resp, *args, **kwargs):
+        """Hook de respuesta de requests: un span por llamada HTTP (hasta recibir cabeceras)."""
+        if self.enabled:
+            elapsed = resp.elapsed.total_seconds()
+            req = resp.request
+            self.record(endpoint(req.method, req.url), 'http', time.monotonic() - elapsed, elapsed,
+                        host=urlsplit(req.url).hostname, status=resp.status_code)
+        return resp
+
+    def spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def reset(self):
+        with self._lock:
+            self._spans = []
+        self._t0 = time.monotonic()
+        self._epoch = time.time()
+
+    # ------------------------------------------------------------------
+    # Acción completa
+    # ------------------------------------------------------------------
+    @contextmanager
+    def action(self, name, run_id=None):
+        """Mide una acción entera y exporta sus trazas al terminar.
+
+        Las acciones anidadas (p.ej. create_vm invocado desde el menú) son sólo
+        un span más dentro de la acción exterior.
+        """
+        if self._active or not (self.enabled or self.profile):
+            with self.span(name, 'action'):
+                yield None
+            return
+
+        run_id = run_id or datetime.now().strftime('%Y%m%d_%H%M%S')
+        self._active = True
+        self.run_id = run_id
+        self.reset()
+        profiler = None
+        if self.profile:
+            import cProfile  # sólo al perfilar: no cuesta nada al arrancar
+            profiler = cProfile.Profile()
+        try:
+            with self.span(name, 'action'):
+                if profiler:
+                    profiler.enable()
+                try:
+                    yield run_id
+                finally:
+                    if profiler:
+                        profiler.disable()
+        finally:
+            self._active = False
+            if profiler:
+                self._dump_profile(profiler, run_id)
+            if self.enabled:
+                self.export(run_id)
+                self.log_summary()
+
+    # ------------------------------------------------------------------
+    # Exportación
+    # ------------------------------------------------------------------
+    def paths(self, run_id):
+        return {
+            'jsonl': os.path.join(self.out_dir, f"trace_{run_id}.jsonl"),
+            'chrome': os.path.join(self.out_dir, f"trace_{run_id}.chrome.json"),
+            'profile': os.path.join(self.out_dir, f"profile_{run_id}.prof"),
+        }
+
+    def export(self, run_id):
+        spans = sorted(self.spans(), key=lambda s: s.start)
+        paths = self.paths(run_id)
+        os.makedirs(self.out_dir, exist_ok=True)
+        with open(paths['jsonl'], 'w') as f:
+            for s in spans:
+                f.write(json.dumps({
+                    'name': s.name, 'cat': s.cat,
+                    'ts': round(self._epoch + s.start - self._t0, 6),
+                    'dur': round(s.dur, 6), 'thread': s.thread, **s.args,
+                }, default=str) + '\n')
+        written = [paths['jsonl']]
+
+        if self.chrome:
+            threads = {}
+            events = []
+            for s in spans:
+                tid = threads.setdefault(s.thread, len(threads) + 1)
+                events.append({
+                    'name': s.name, 'cat': s.cat, 'ph': 'X', 'pid': 1, 'tid': tid,
+                    'ts': int((s.start - self._t0) * 1e6), 'dur': max(1, int(s.dur * 1e6)),
+                    'args': s.args,
+                })
+            events.extend({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': name}}
+                          for name, tid in threads.items())
+            with open(paths['chrome'], 'w') as f:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+            written.append(paths['chrome'])
+
+        log.info(f"🧵 Trazas ({len(spans)} spans): {', '.join(written)}")
+        return written
+
+    def summary(self):
+        """[(cat, name, count, total, max)] ordenado por tiempo total."""
+        agg = {}
+        for s in self.spans():
+            if s.cat == 'action':
+                continue
+            entry = agg.setdefault((s.cat, s.name), [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += s.dur
+            entry[2] = max(entry[2], s.dur)
+        rows = [(cat, name, n, total, worst) for (cat, name), (n, total, worst) in agg.items()]
+        return sorted(rows, key=lambda r: r[3], reverse=True)
+
+    def log_summary(self):
+        rows = self.summary()
+        if not rows:
+            return
+        by_cat = {}
+        for cat, _, n, total, _ in rows:
+            count, secs = by_cat.get(cat, (0, 0.0))
+            by_cat[cat] = (count + n, secs + total)
+
+        log.info("\n⏱️  Tiempo por categoría (suma de spans, puede solaparse en paralelo):")
+        for cat, (n, total) in sorted(by_cat.items(), key=lambda kv: kv[1][1], reverse=True):
+            log.info(f"   {cat:<6} {n:>6} × {total:>9.2f}s")
+        log.info(f"⏱️  Top {min(self.top, len(rows))} por tiempo total:")
+        for cat, name, n, total, worst in rows[:self.top]:
+            log.info(f"   {total:>9.2f}s  {n:>5}×  máx {worst:>7.2f}s  [{cat}] {name}")
+
+    def _dump_profile(self, profiler, run_id):
+        import io
+        import pstats
+        path = self.paths(run_id)['profile']
+        os.makedirs(self.out_dir, exist_ok=True)
+        profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(self.top)
+        log.debug(out.getvalue())
+        log.info(f"🔬 Perfil cProfile: {path} (python -m pstats {path})")
+
+
+# Tracer del proceso: todas las capas registran aquí
+tracer = Tracer()
+span = tracer.span
+record = tracer.record
+
+
+def traced(name, cat='app'):
+    """Decorador: un span por llamada a la función."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name, cat):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
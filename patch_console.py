@@ -1,68 +1,69 @@
+#!/usr/bin/env python3
+"""
+Apunta el cloud-init vendor-data de las VMs al snippet del NFS y reinicia las
+que lo necesitan, todas en paralelo.
 
-import yaml
-import os
+Un único config POST por VM (ver lib/patches.py); cada VM encendida con el
+cambio pendiente se reinicia una sola vez, por olas (masters de uno en uno,
+ver lib/restarts.py). Las VMs apagadas toman el cambio al arrancar.
+
+    python patch_console.py
+    python patch_console.py --ids 3004-3008 --no-restart
+"""
+import argparse
 import sys
 import time
-from proxmoxer import ProxmoxAPI
-import requests
-from dotenv import load_dotenv
-
-load_dotenv()
-requests.packages.urllib3.disable_warnings()
 
-# Load config
-try:
-    with open('config.yaml') as f:
-        config = yaml.safe_load(f)
-    with open('vms.yaml') as f:
-        vms = yaml.safe_load(f)['vms']
-except Exception as e:
-    print(f"Error loading files: {e}")
-    sys.exit(1)
+from lib.logger import log
+from lib.patches import PatchEngine, Set, report
+from lib.proxmox_client import get_client
+from lib.selection import Selector
 
-# Connect to Proxmox
-px = config.get('proxmox', {})
-px_host = os.getenv('PROXMOX_HOST', px.get('host'))
-px_user = os.getenv('PROXMOX_USER', px.get('user'))
-px_password = os.getenv('PROXMOX_PASSWORD', px.get('password'))
-px_verify_ssl = os.getenv('PROXMOX_VERIFY_SSL', str(px.get('verify_ssl', False))).lower() == 'true'
+CICUSTOM = 'vendor=NFS_SERVER:snippets/user-data.yaml'
 
-proxmox = ProxmoxAPI(px_host, user=px_user, password=px_password, verify_ssl=px_verify_ssl)
 
-print("🔌 Patching VM Console Settings (vga=std)...")
+def patch_console(selector=None, cicustom=CICUSTOM, restart=True, parallel=None, per_node=None, dry_run=False):
+    """Fija `cicustom` en las VMs seleccionadas. Devuelve una lista de resultados por VM."""
+    client = get_client()
+    if not client.connect():
+        return False
 
-for vm in vms:
-    vmid = vm['vmid']
-    node = vm['node']
-    print(f"\nProcessing VM {vmid} on {node}...")
-    
+    selector = selector or Selector()
+    engine = PatchEngine(client, client.cfg.data, parallel=parallel, per_node=per_node)
     try:
-        # Update config
-        print(f"  📝 Setting cicustom=vendor=NFS_SERVER:snippets/user-data.yaml...")
-        proxmox.nodes(node).qemu(vmid).config.post(cicustom='vendor=NFS_SERVER:snippets/user-data.yaml')
-        
-        # We need to stop and start for this to take effect usually
-        status = proxmox.nodes(node).qemu(vmid).status.current.get()
-        if status['status'] == 'running':
-             print(f"  🔄 Restarting VM to apply changes...")
-             proxmox.nodes(node).qemu(vmid).status.shutdown.post()
-             
-             # Wait for stop
-             print("     Waiting for shutdown...")
-             for _ in range(30):
-                 s = proxmox.nodes(node).qemu(vmid).status.current.get()
-                 if s['status'] == 'stopped':
-                     break
-                 time.sleep(2)
-            
-             # Start
-             print("     Starting...")
-             proxmox.nodes(node).qemu(vmid).status.start.post()
-             print("  ✅ Done.")
-        else:
-             print("  ✅ Config updated (VM was stopped).")
-
+        targets = selector.select(client.inventory.refresh(), client.cfg.vms)
     except Exception as e:
-        print(f"  ❌ Error: {e}")
+        log.error(f"❌ No se pudo consultar el cluster: {e}")
+        return False
+
+    log.info(f"🔌 cicustom={cicustom} en {len(targets)} VM(s) ({selector.describe()}) - "
+             f"{engine.parallel} en paralelo, máx. {engine.per_node} por nodo")
+    log.info("=" * 60)
+    if not targets:
+        return []
+
+    start = time.monotonic()
+    results = engine.apply(targets, [Set(cicustom=cicustom)], restart=restart, dry_run=dry_run)
+    report(results, time.monotonic() - start)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fija cicustom (vendor-data) en las VMs')
+    Selector.add_arguments(parser)
+    parser.add_argument('--cicustom', default=CICUSTOM, help=f"Valor de cicustom (default: {CICUSTOM})")
+    parser.add_argument('--no-restart', dest='restart', action='store_false',
+                        help='No reiniciar: el cambio se aplica en el próximo arranque')
+    parser.add_argument('--parallel', type=int, default=None, help='VMs a la vez (default: execution.bulk_parallel)')
+    parser.add_argument('--per-node', type=int, default=None, help='Máximo por nodo (default: execution.bulk_per_node)')
+    parser.add_argument('--dry-run', action='store_true', help='Mostrar qué se cambiaría sin tocar las VMs')
+    args = parser.parse_args()
+
+    results = patch_console(Selector.from_args(args), cicustom=args.cicustom, restart=args.restart,
+                            parallel=args.parallel, per_node=args.per_node, dry_run=args.dry_run)
+    if results is False or any(not r['ok'] for r in results):
+        sys.exit(1)
+
 
-print("\n🎉 All VMs patched.")
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,67 @@
-from lib.proxmox_client import ProxmoxClient
-from lib.config import Config
-import sys
+#!/usr/bin/env python3
+"""
+Quita el drive cloud-init de las VMs (por defecto las de vms.yaml), en paralelo.
+
+Un único config POST por VM (ver lib/patches.py). En una VM encendida Proxmox
+deja el borrado pendiente hasta el próximo arranque; con --restart se reinicia
+sólo cada VM a la que le quedó pendiente.
+
+    python remove_cloudinit_all.py
+    python remove_cloudinit_all.py --tag worker --restart
+"""
+import argparse
 import time
 
+from lib.config import Config
+from lib.logger import log
+from lib.patches import DropCloudInit, PatchEngine, report
+from lib.proxmox_client import get_client
+from lib.selection import Selector
 
-def remove_cloudinit_all():
-    """Remueve el cloud-init drive de todas las VMs definidas en vms.yaml"""
-    cfg = Config()
-    client = ProxmoxClient(cfg)
 
+def remove_cloudinit_all(selector=None, restart=False, parallel=None, per_node=None, dry_run=False):
+    """Remueve el cloud-init drive de las VMs seleccionadas. Devuelve una lista de resultados por VM."""
+    cfg = Config()
+    client = get_client(cfg)
     if not client.connect():
-        print("Failed to connect")
         return False
 
-    # Obtener VMs desde config
-    vms_to_process = {vm['vmid']: vm['node'] for vm in cfg.vms}
-
-    print(f"Processing {len(vms_to_process)} VMs...")
-
-    for vmid, node in vms_to_process.items():
-        try:
-            print(f"\n--- Processing VM {vmid} on {node} ---")
-            try:
-                vm = client.get_vm(node, vmid)
-                conf = vm.config.get()
-            except Exception as e:
-                print(f"❌ Error getting config for VM {vmid}: {e}")
-                continue
-
-            # Check for cloudinit drive
-            drive_key = None
-            for key, value in conf.items():
-                val_str = str(value)
-                if "cloudinit" in val_str:
-                    print(f"Found Cloud-Init Drive: {key}: {val_str}")
-                    drive_key = key
-                    break
-
-            if drive_key:
-                print(f"Removing {drive_key}...")
-                try:
-                    vm.config.post(delete=drive_key)
-                    print("✅ Drive removed.")
-                except Exception as e:
-                    print(f"❌ Error removing drive from VM {vmid}: {e}")
-            else:
-                print("ℹ️  No Cloud-Init drive found (already removed?).")
-
-        except Exception as e:
-            print(f"❌ Unexpected error for VM {vmid}: {e}")
-
-    print("\n✅ All VMs processed.")
-    return True
+    selector = selector or Selector()
+    engine = PatchEngine(client, cfg.data, parallel=parallel, per_node=per_node)
+    try:
+        targets = selector.select(client.inventory.refresh(), cfg.vms)
+    except Exception as e:
+        log.error(f"❌ No se pudo consultar el cluster: {e}")
+        return False
+
+    log.info(f"💿 Quitando el drive cloud-init de {len(targets)} VM(s) ({selector.describe()}) - "
+             f"{engine.parallel} en paralelo, máx. {engine.per_node} por nodo"
+             f"{', reiniciando si queda pendiente' if restart else ''}")
+    log.info("=" * 60)
+    if not targets:
+        return []
+
+    start = time.monotonic()
+    results = engine.apply(targets, [DropCloudInit()], restart=restart, dry_run=dry_run)
+    report(results, time.monotonic() - start)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quita el drive cloud-init de las VMs')
+    Selector.add_arguments(parser)
+    parser.add_argument('--restart', action='store_true',
+                        help='Reiniciar las VMs encendidas en las que el cambio quede pendiente')
+    parser.add_argument('--parallel', type=int, default=None, help='VMs a la vez (default: execution.bulk_parallel)')
+    parser.add_argument('--per-node', type=int, default=None, help='Máximo por nodo (default: execution.bulk_per_node)')
+    parser.add_argument('--dry-run', action='store_true', help='Mostrar qué se cambiaría sin tocar las VMs')
+    args = parser.parse_args()
+
+    results = remove_cloudinit_all(Selector.from_args(args), restart=args.restart, parallel=args.parallel,
+                                   per_node=args.per_node, dry_run=args.dry_run)
+    if results is False or any(not r['ok'] for r in results):
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
-    remove_cloudinit_all()
+    main()
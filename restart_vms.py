@@ -2,86 +2,94 @@
 """
 Script to Full Check-Restart K3s Cluster VMs
 Required for ssd=1 flag to take effect (Hardware change)
-"""
-
-import time
-import yaml
-import os
-from proxmoxer import ProxmoxAPI
-import requests
-from dotenv import load_dotenv
-
 
-def restart_vms():
-    """Reinicia todas las VMs para aplicar cambios de hardware"""
-    load_dotenv()
-    requests.packages.urllib3.disable_warnings()
+Sólo se reinician las VMs encendidas con cambios pendientes (o todas con
+--force), por olas: masters de uno en uno y workers de --wave-size en
+--wave-size, con apagado ACPI, stop forzado si no termina y espera entre olas
+al guest agent o, sin agent, al puerto SSH de la IP de vms.yaml (ver
+lib/restarts.py).
 
-    # Proxmox Setup
-    with open('config.yaml') as f:
-        config = yaml.safe_load(f)
-
-    px = config.get('proxmox', {})
-    px_host = os.getenv('PROXMOX_HOST', px.get('host'))
-    px_user = os.getenv('PROXMOX_USER', px.get('user'))
-    px_password = os.getenv('PROXMOX_PASSWORD', px.get('password'))
+    python restart_vms.py
+    python restart_vms.py --tag worker --wave-size 5
+    python restart_vms.py --force --dry-run
+"""
+import argparse
+import time
 
-    proxmox = ProxmoxAPI(px_host, user=px_user, password=px_password, verify_ssl=False)
+from lib.config import Config
+from lib.logger import log
+from lib.proxmox_client import get_client
+from lib.restarts import RestartPlanner, vm_addresses
+from lib.selection import Selector
 
-    # VMs desde config.yaml
-    vms_list = config.get('vms', [])
-    VMS = [{'vmid': vm['vmid'], 'node': vm['node']} for vm in vms_list]
 
-    def wait_for_status(node, vmid, target_status, timeout=60):
-        start = time.time()
-        while time.time() - start < timeout:
-            current = proxmox.nodes(node).qemu(vmid).status.current.get().get('status')
-            if current == target_status:
-                return True
-            time.sleep(2)
+def restart_vms(selector=None, force=False, wave_size=None, parallel=None, per_node=None, dry_run=False):
+    """Reinicia las VMs que necesitan aplicar cambios de hardware. Devuelve una lista de resultados por VM."""
+    cfg = Config()
+    client = get_client(cfg)
+    if not client.connect():
         return False
 
-    print("🔄 Restarting VMs to apply Hardware Changes...")
-    print("="*60)
-
-    for vm in VMS:
-        vmid = vm['vmid']
-        node = vm['node']
-
-        print(f"VM {vmid} ({node})...")
-
-        # Check if running
-        status = proxmox.nodes(node).qemu(vmid).status.current.get().get('status')
-
-        if status == 'running':
-            print("  🛑 Stopping...")
-            try:
-                proxmox.nodes(node).qemu(vmid).status.stop.post()
-                if wait_for_status(node, vmid, 'stopped'):
-                    print("     -> Stopped.")
-                else:
-                    print("     ⚠️  Timed out waiting for stop. Forcing...")
-                    proxmox.nodes(node).qemu(vmid).status.stop.post()
-                    time.sleep(5)
-            except Exception as e:
-                print(f"     ❌ Error stopping: {e}")
-
-        time.sleep(2)
-
-        print("  🚀 Starting...")
-        try:
-            proxmox.nodes(node).qemu(vmid).status.start.post()
-            if wait_for_status(node, vmid, 'running'):
-                print("     -> Started.")
-            else:
-                print("     ❌ Failed to start properly.")
-        except Exception as e:
-            print(f"     ❌ Error starting: {e}")
-
-        print("-" * 40)
+    selector = selector or Selector()
+    # IPs de vms.yaml: sondeo TCP de las VMs sin guest agent antes de la siguiente ola
+    planner = RestartPlanner(client, cfg.data, parallel=parallel, per_node=per_node, wave_size=wave_size,
+                             addresses=vm_addresses(cfg.vms))
+    try:
+        targets = selector.select(client.inventory.refresh(), cfg.vms)
+    except Exception as e:
+        log.error(f"❌ No se pudo consultar el cluster: {e}")
+        return False
 
-    print("\nAll Done.")
+    log.info(f"🔄 Reinicio de {len(targets)} VM(s) ({selector.describe()}) "
+             f"{'- todas las encendidas' if force else 'con cambios pendientes'}: masters de uno en uno, "
+             f"workers en olas de {planner.wave_size} (máx. {planner.per_node} por nodo)")
+    log.info("=" * 60)
+    if not targets:
+        return []
+
+    start = time.monotonic()
+    results = planner.restart(targets, force=force, dry_run=dry_run)
+    total = time.monotonic() - start
+
+    results.sort(key=lambda r: (r['wave'] is None, r['wave'] or 0, r['vmid']))
+    for r in results:
+        icon = '✅' if r['ok'] else '❌'
+        if r['ok'] and r['wave'] is None:
+            icon = '⚪'
+        wave = f"ola {r['wave']}, " if r['wave'] else ''
+        phases = ', '.join(f"{phase} {secs:.1f}s" for phase, secs in r['phases'].items())
+        log.info(f"  {icon} VM {r['vmid']} ({r['name']}, {wave}{r['role']}) en {r['node']}: {r['detail']} "
+                 f"({r['elapsed']:.1f}s{'; ' + phases if phases else ''})")
+
+    restarted = [r for r in results if r['wave'] is not None and r['ok']]
+    failed = [r for r in results if not r['ok']]
+    log.info("\n" + "=" * 60)
+    log.info(f"🔄 {'Se reiniciarían' if dry_run else 'Reiniciadas'}: {len(restarted)}   ⚪ Sin reinicio: "
+             f"{sum(1 for r in results if r['wave'] is None and r['ok'])}   ❌ Fallidas: {len(failed)}")
+    log.info(f"⏱️  Total: {total:.1f}s (VM más lenta: {max(r['elapsed'] for r in results):.1f}s, "
+             f"suma: {sum(r['elapsed'] for r in results):.1f}s)")
+    for r in failed:
+        log.error(f"   • VM {r['vmid']} ({r['name']}) en {r['node']}: {r['detail']}")
+    log.info("=" * 60)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reinicio por olas de las VMs con cambios de hardware pendientes')
+    Selector.add_arguments(parser)
+    parser.add_argument('--force', action='store_true', help='Reiniciar todas las VMs encendidas, sin mirar pending (y aunque haya '
+                             'varios masters sin guest agent ni IP)')
+    parser.add_argument('--wave-size', type=int, default=None, help='Workers a la vez (default: restarts.wave_size)')
+    parser.add_argument('--parallel', type=int, default=None, help='VMs a la vez (default: execution.bulk_parallel)')
+    parser.add_argument('--per-node', type=int, default=None, help='Máximo por nodo (default: execution.bulk_per_node)')
+    parser.add_argument('--dry-run', action='store_true', help='Mostrar las olas sin reiniciar nada')
+    args = parser.parse_args()
+
+    results = restart_vms(Selector.from_args(args), force=args.force, wave_size=args.wave_size,
+                          parallel=args.parallel, per_node=args.per_node, dry_run=args.dry_run)
+    if results is False or any(not r['ok'] for r in results):
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
-    restart_vms()
+    main()
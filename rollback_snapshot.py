@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Rollback en paralelo de las VMs a un snapshot (por defecto 'Pre-K3s-Install').
+
+Cada VM se detiene, vuelve al snapshot y, con --start, arranca de nuevo; todas
+a la vez con un máximo por nodo y por storage (ver lib/snapshots.py). Pensado
+para resetear el laboratorio K3s entre instalaciones:
+
+    python rollback_snapshot.py --start --yes
+    python rollback_snapshot.py --tag worker --snapshot pre-upgrade-20260101-1200
+"""
+import argparse
+import time
+
+from lib.config import Config
+from lib.logger import log
+from lib.proxmox_client import get_client
+from lib.selection import Selector
+from lib.snapshots import SnapshotEngine
+from create_snapshot import SNAPSHOT_NAME
+
+
+def rollback_vms(selector=None, name=SNAPSHOT_NAME, start=False, parallel=None, per_node=None,
+                 per_storage=None, dry_run=False):
+    """Vuelve las VMs seleccionadas al snapshot. Devuelve una lista de resultados por VM."""
+    cfg = Config()
+    client = get_client(cfg)
+    if not client.connect():
+        return []
+
+    selector = selector or Selector()
+    engine = SnapshotEngine(client, cfg.data, parallel=parallel, per_node=per_node, per_storage=per_storage)
+    try:
+        targets = selector.select(client.inventory.refresh(), cfg.vms)
+    except Exception as e:
+        log.error(f"❌ No se pudo consultar el cluster: {e}")
+        return []
+
+    log.info(f"⏪ Rollback a '{name}' de {len(targets)} VM(s) ({selector.describe()}) - "
+             f"{engine.parallel} en paralelo, máx. {engine.per_node} por nodo y {engine.per_storage} por storage"
+             f"{', arrancando después' if start else ''}")
+    log.info("=" * 60)
+    if not targets:
+        return []
+
+    begin = time.monotonic()
+    results = engine.rollback(targets, name, start=start, dry_run=dry_run)
+    total = time.monotonic() - begin
+
+    for r in results:
+        phases = ', '.join(f"{phase} {secs:.1f}s" for phase, secs in r['phases'].items())
+        log.info(f"  {'✅' if r['ok'] else '❌'} VM {r['vmid']} ({r['name']}) en {r['node']}: {r['detail']} "
+                 f"({r['elapsed']:.1f}s{'; ' + phases if phases else ''})")
+
+    failed = [r for r in results if not r['ok']]
+    log.info("\n" + "=" * 60)
+    log.info(f"✅ Restauradas: {len(results) - len(failed)}   ❌ Fallidas: {len(failed)}")
+    log.info(f"⏱️  Total: {total:.1f}s (VM más lenta: {max(r['elapsed'] for r in results):.1f}s, "
+             f"suma: {sum(r['elapsed'] for r in results):.1f}s)")
+    for r in failed:
+        log.error(f"   • VM {r['vmid']} ({r['name']}) en {r['node']}: {r['detail']}")
+    log.info("=" * 60)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rollback en paralelo de las VMs a un snapshot')
+    Selector.add_arguments(parser)
+    parser.add_argument('--snapshot', default=SNAPSHOT_NAME, help=f"Snapshot destino (default: {SNAPSHOT_NAME})")
+    parser.add_argument('--start', action='store_true', help='Arrancar las VMs tras el rollback')
+    parser.add_argument('--parallel', type=int, default=None, help='VMs a la vez (default: execution.bulk_parallel)')
+    parser.add_argument('--per-node', type=int, default=None, help='Máximo por nodo (default: execution.bulk_per_node)')
+    parser.add_argument('--per-storage', type=int, default=None,
+                        help='Máximo por storage (default: snapshots.per_storage)')
+    parser.add_argument('--dry-run', action='store_true', help='Mostrar qué se haría sin tocar las VMs')
+    parser.add_argument('--yes', action='store_true', help='No pedir confirmación')
+    args = parser.parse_args()
+
+    if not args.yes and not args.dry_run:
+        if input("Se perderá el estado actual de las VMs. Escribe 'rollback' para confirmar: ").strip() != 'rollback':
+            print("Cancelado.")
+            return
+
+    results = rollback_vms(Selector.from_args(args), name=args.snapshot, start=args.start, parallel=args.parallel,
+                           per_node=args.per_node, per_storage=args.per_storage, dry_run=args.dry_run)
+    if not results or any(not r['ok'] for r in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
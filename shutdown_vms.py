@@ -1,40 +1,87 @@
+#!/usr/bin/env python3
+"""
+Apagado ACPI en paralelo de las VMs, con stop forzado si no terminan.
+
+Desde el menú se eligen las VMs encendidas; `shutdown_vms()` (acción
+headless `shutdown-all` y este script) apaga las seleccionadas por
+--tag/--node/--ids/--name. Todas a la vez con un máximo por nodo, esperando
+a que cada apagado termine de verdad (ver lib/power.py).
+
+    python shutdown_vms.py --tag worker
+    python shutdown_vms.py --timeout 60 --no-force
+"""
+import argparse
+import time
 
-import questionary
 from lib.config import Config
-from lib.proxmox_client import ProxmoxClient
 from lib.logger import log
+from lib.power import PowerEngine, report
+from lib.proxmox_client import get_client
+from lib.selection import Selector
+
+
+def _shutdown(client, cfg, targets, timeout=None, force=None, parallel=None, per_node=None, dry_run=False):
+    engine = PowerEngine(client, cfg.data, parallel=parallel, per_node=per_node)
+    force = engine.settings['force_stop'] if force is None else force
+    log.info(f"🌙 Apagando {len(targets)} VM(s) - {engine.parallel} en paralelo, máx. {engine.per_node} por nodo, "
+             f"ACPI {timeout or engine.settings['shutdown_timeout']}s{' y después stop forzado' if force else ''}")
+    log.info("=" * 60)
+    start = time.monotonic()
+    results = engine.shutdown(targets, timeout=timeout, force=force, dry_run=dry_run)
+    report(results, time.monotonic() - start, 'Apagadas')
+    return results
+
+
+def shutdown_vms(selector=None, timeout=None, force=None, parallel=None, per_node=None, dry_run=False):
+    """Apaga las VMs seleccionadas (por defecto las de vms.yaml). Devuelve una lista de resultados por VM."""
+    cfg = Config()
+    client = get_client(cfg)
+    if not client.connect():
+        return False
+
+    selector = selector or Selector()
+    try:
+        targets = selector.select(client.inventory.refresh(), cfg.vms)
+    except Exception as e:
+        log.error(f"❌ No se pudo consultar el cluster: {e}")
+        return False
+    log.info(f"🔍 {len(targets)} VM(s) ({selector.describe()})")
+    if not targets:
+        return []
+    return _shutdown(client, cfg, targets, timeout=timeout, force=force, parallel=parallel, per_node=per_node,
+                     dry_run=dry_run)
+
 
 def shutdown_vms_interactive():
+    # questionary sólo hace falta al elegir VMs desde el menú
+    import questionary
+
     cfg = Config()
-    client = ProxmoxClient(cfg)
-    
+    client = get_client(cfg)
+
     if not client.connect():
         return
 
     log.info("🔍 Scanning running VMs...")
-    
-    # Filter only VMs defined in our config
-    defined_vms = cfg.vms
+
+    # One cluster/resources snapshot instead of a status call per VM
+    try:
+        inventory = client.inventory.refresh()
+    except Exception as e:
+        log.error(f"❌ Could not query cluster resources: {e}")
+        return
+
     running_choices = []
-    
-    for vm_def in defined_vms:
-        vmid = vm_def['vmid']
-        node = vm_def['node']
-        name = vm_def['name']
-        
-        try:
-            # Check actual status
-            current = client.get_vm(node, vmid).status.current.get()
-            if current['status'] == 'running':
-                # Determine Role
-                role = "🎯 Worker" if "worker" in name else "👑 Master" if "master" in name else "🖥️  VM"
-                
-                label = f"{role:<10} | {name:<20} | Node: {node:<8} | IP: {vm_def.get('ip', 'N/A')}"
-                running_choices.append(questionary.Choice(title=label, value=vm_def))
-                
-        except Exception:
-            # VM might not exist or be unreachable
+    for vm in Selector().select(inventory, cfg.vms):
+        if vm.get('status') != 'running':
             continue
+        vm_def = next((d for d in cfg.vms if d['vmid'] == vm['vmid']), {})
+        name = vm.get('name') or vm_def.get('name', '')
+        # Determine Role
+        role = "🎯 Worker" if "worker" in name else "👑 Master" if "master" in name else "🖥️  VM"
+
+        label = f"{role:<10} | {name:<20} | Node: {vm['node']:<8} | IP: {vm_def.get('ip', 'N/A')}"
+        running_choices.append(questionary.Choice(title=label, value=vm))
 
     if not running_choices:
         log.warning("🚫 No running VMs found from configuration.")
@@ -49,18 +96,26 @@ def shutdown_vms_interactive():
         log.info("❌ No VMs selected.")
         return
 
-    for vm in selected_vms:
-        vmid = vm['vmid']
-        node = vm['node']
-        name = vm['name']
-        
-        try:
-            log.info(f"🌙 Shutting down {name} on {node}...")
-            client.get_vm(node, vmid).status.shutdown.post()
-        except Exception as e:
-            log.error(f"❌ Failed to shutdown {name}: {e}")
+    return _shutdown(client, cfg, selected_vms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apagado ACPI en paralelo de las VMs')
+    Selector.add_arguments(parser)
+    parser.add_argument('--timeout', type=int, default=None,
+                        help='Segundos de apagado ACPI antes de forzar stop (default: power.shutdown_timeout)')
+    parser.add_argument('--no-force', dest='force', action='store_false', default=None,
+                        help='No forzar stop si el apagado ACPI no termina')
+    parser.add_argument('--parallel', type=int, default=None, help='VMs a la vez (default: execution.bulk_parallel)')
+    parser.add_argument('--per-node', type=int, default=None, help='Máximo por nodo (default: execution.bulk_per_node)')
+    parser.add_argument('--dry-run', action='store_true', help='Mostrar qué se apagaría')
+    args = parser.parse_args()
+
+    results = shutdown_vms(Selector.from_args(args), timeout=args.timeout, force=args.force,
+                           parallel=args.parallel, per_node=args.per_node, dry_run=args.dry_run)
+    if results is False or any(not r['ok'] for r in results):
+        raise SystemExit(1)
 
-    log.info("✅ Shutdown commands sent.")
 
 if __name__ == "__main__":
-    shutdown_vms_interactive()
+    main()
@@ -1,101 +1,67 @@
 #!/usr/bin/env python3
 """
 Script para iniciar VMs en Proxmox
-"""
-
-import yaml
-import os
-import sys
-from proxmoxer import ProxmoxAPI
-import requests
-from dotenv import load_dotenv
-import time
-
-
-def start_vms():
-    """Inicia todas las VMs definidas en config.yaml"""
-    load_dotenv()
-    requests.packages.urllib3.disable_warnings()
-
-    # Leer config
-    with open('config.yaml') as f:
-        config = yaml.safe_load(f)
-
-    px = config.get('proxmox', {})
-    px_host = os.getenv('PROXMOX_HOST', px.get('host'))
-    px_user = os.getenv('PROXMOX_USER', px.get('user'))
-    px_password = os.getenv('PROXMOX_PASSWORD', px.get('password'))
-    px_verify_ssl = os.getenv('PROXMOX_VERIFY_SSL', str(px.get('verify_ssl', False))).lower() == 'true'
-
-    proxmox = ProxmoxAPI(
-        px_host,
-        user=px_user,
-        password=px_password,
-        verify_ssl=px_verify_ssl
-    )
-
-    # VMs a iniciar desde config.yaml
-    vms_list = config.get('vms', [])
-    vms_to_start = [(vm['vmid'], vm['node'], vm['name']) for vm in vms_list]
-
-    print("\n🚀 Iniciando VMs en Proxmox...")
-    print("="*70)
 
-    success = 0
-    failed = 0
-    already_running = 0
+Todas las VMs se arrancan a la vez con un máximo por nodo; cada arranque se
+confirma con su tarea (sin esperas fijas) y la tabla final sale de un único
+snapshot del inventario (ver lib/power.py).
 
-    for vmid, node, name in vms_to_start:
-        try:
-            # Verificar estado actual
-            status = proxmox.nodes(node).qemu(vmid).status.current.get()
-            current_status = status['status']
-
-            if current_status == 'running':
-                print(f"⚪ VM {vmid} ({name}) - Ya está corriendo")
-                already_running += 1
-                continue
-
-            # Iniciar VM
-            print(f"⏳ VM {vmid} ({name}) en {node} - Iniciando...", end='', flush=True)
-            proxmox.nodes(node).qemu(vmid).status.start.post()
-
-            # Esperar un momento
-            time.sleep(2)
-
-            # Verificar que inició
-            status = proxmox.nodes(node).qemu(vmid).status.current.get()
-            if status['status'] == 'running':
-                print(f" ✅")
-                success += 1
-            else:
-                print(f" ⚠️  Estado: {status['status']}")
-                failed += 1
-
-        except Exception as e:
-            print(f" ❌ Error: {e}")
-            failed += 1
-
-    print("\n" + "="*70)
-    print(f"✅ Iniciadas exitosamente: {success}")
-    print(f"⚪ Ya estaban corriendo: {already_running}")
-    print(f"❌ Fallidas: {failed}")
-    print("="*70)
-
-    if success > 0 or already_running > 0:
-        print("\n📋 Estado final de las VMs:")
-        print("="*70)
-        for vmid, node, name in vms_to_start:
-            try:
-                status = proxmox.nodes(node).qemu(vmid).status.current.get()
-                icon = "🟢" if status['status'] == 'running' else "⚪"
-                print(f"{icon} VM {vmid}: {name} ({status['status']}) - Nodo: {node}")
-            except Exception as e:
-                print(f"❌ VM {vmid}: Error al verificar - {e}")
-        print("="*70)
+    python start_vms.py
+    python start_vms.py --tag worker --per-node 2
+"""
+import argparse
+import time
 
-    print("\n✨ Proceso completado!\n")
+from lib.logger import log
+from lib.power import PowerEngine, report
+from lib.proxmox_client import get_client
+from lib.selection import Selector
+
+
+def start_vms(selector=None, parallel=None, per_node=None, dry_run=False):
+    """Inicia las VMs seleccionadas (por defecto las de vms.yaml). Devuelve una lista de resultados por VM."""
+    client = get_client()
+    if not client.connect():
+        return False
+
+    selector = selector or Selector()
+    engine = PowerEngine(client, client.cfg.data, parallel=parallel, per_node=per_node)
+    try:
+        inventory = client.inventory.refresh()
+        targets = selector.select(inventory, client.cfg.vms)
+    except Exception as e:
+        log.error(f"❌ No se pudo consultar el cluster: {e}")
+        return False
+
+    log.info(f"\n🚀 Iniciando {len(targets)} VM(s) ({selector.describe()}) - "
+             f"{engine.parallel} en paralelo, máx. {engine.per_node} por nodo")
+    log.info("=" * 70)
+    if not selector.all_vms:
+        for vm in client.cfg.vms:
+            if not inventory.exists(vm['vmid']):
+                log.error(f"❌ VM {vm['vmid']} ({vm.get('name')}) - No encontrada en el cluster")
+    if not targets:
+        return []
+
+    start = time.monotonic()
+    results = engine.start(targets, dry_run=dry_run)
+    report(results, time.monotonic() - start, 'Iniciadas')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Arranque en paralelo de las VMs')
+    Selector.add_arguments(parser)
+    parser.add_argument('--parallel', type=int, default=None, help='VMs a la vez (default: execution.bulk_parallel)')
+    parser.add_argument('--per-node', type=int, default=None, help='Máximo por nodo (default: execution.bulk_per_node)')
+    parser.add_argument('--dry-run', action='store_true', help='Mostrar qué se arrancaría')
+    args = parser.parse_args()
+
+    results = start_vms(Selector.from_args(args), parallel=args.parallel, per_node=args.per_node,
+                        dry_run=args.dry_run)
+    if results is False or any(not r['ok'] for r in results):
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
-    start_vms()
+    main()